@@ -5,8 +5,15 @@ API_NAME_PREFIX = 'video-analysis-extraction-service'
 VIDEO_EXTRACTION_CONCURRENT_LIMIT = "1" # Number of videos processed concurrently
 VIDEO_IMAGE_EXTRACTION_CONCURRENT_LIMIT = "10" # Max number of images processed concurrently by extraction workflow
 VIDEO_IMAGE_EXTRACTION_SAMPLE_CONCURRENT_LIMIT = "2" # Max numbers of sampling tasks processed concurrently
+VIDEO_IMAGE_EXTRACTION_BATCH_SIZE = "4" # Frames per extraction Map item (ItemBatcher). Keep the batch under the 256 KB state payload limit: each frame carries ~40 KB of embeddings
+VIDEO_IMAGE_BATCH_CONCURRENCY = "4" # Frames of a batch processed at the same time inside the extraction lambdas
+VIDEO_FRAME_PROCESSOR_MODE = "fused" # Frame processing in the extraction workflow: fused (extract, embed and index in one lambda) | split (extraction, embedding and vector save lambdas)
+RAW_OUTPUT_MODE = "archive" # Raw Rekognition/caption output: object (one S3 object per detector per frame) | archive (one gzip JSONL + index per batch)
 VIDEO_EXTRACTION_WORKFLOW_TIMEOUT_HR = "5" # Step function state machine video extraction workflow timeout
 VIDEO_SAMPLE_CHUNK_DURATION_S = "600" # For extraction workflow. Default 10 minutes means the flow will sample 10 minutes of the given video at a time to prevent Lambda timeout.
+VIDEO_SAMPLE_DECODE_MODE = "single_pass" # single_pass: decode each chunk in one forward pass | seek: seek to every sample timestamp
+VIDEO_SAMPLE_UPLOAD_THREADS = "8" # Number of threads uploading sampled frames to S3 while the sampler keeps decoding
+VIDEO_SAMPLE_UPLOAD_QUEUE_SIZE = "32" # Max number of encoded frames buffered in memory waiting for upload
 
 S3_BUCKET_EXTRACTION_PREFIX = 'video-analysis-extr'
 S3_PRE_SIGNED_URL_EXPIRY_S = "3600" # 1 hour
@@ -14,6 +21,7 @@ TRANSCRIBE_JOB_PREFIX = 'video_analysis_'
 TRANSCRIBE_OUTPUT_PREFIX = 'transcribe'
 VIDEO_SAMPLE_FILE_PREFIX = "video_frame_"
 VIDEO_SAMPLE_S3_PREFIX = "video_frame_"
+FRAME_MANIFEST_FILE = "frame_manifest.json" # Map items of the sampled images with their frame records, written under tasks/<task_id>/ by the frame subtitle stage
 VIDEO_UPLOAD_S3_PREFIX = 'upload'
 LAMBDA_LAYER_SOURCE_S3_KEY_OPENSEARCHPY = "layer/opensearchpy_layer.zip"
 LAMBDA_LAYER_SOURCE_S3_KEY_MOVIEPY = "layer/moviepy_layer.zip"
@@ -23,25 +31,43 @@ SECRET_MANAGER_PREFIX = "prod/shoppable/"
 SECRET_MANAGER_OPENSEARCH_LOGIN_KEY = "opensearchlogin"
 OPENSERACH_USER_NAME = "extr_srv_admin"
 OPENSEARCH_DOMAIN_NAME_PREFIX = "video-analysis"
+OPENSEARCH_ENGINE_VERSION = "2.7"
 OPENSEARCH_PORT = "443"
 OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME	= "video_frame_"
 OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING = '''{"settings":{"index.knn":true,"number_of_shards":2},"mappings":{"properties":{"mm_embedding":{"type":"knn_vector","dimension":1024,"method":{"name":"hnsw","space_type":"l2","engine":"faiss"}},"text_embedding":{"type":"knn_vector","dimension":1024,"method":{"name":"hnsw","space_type":"l2","engine":"faiss"}},"timestamp":{"type":"double"},"task_id":{"type":"text","fields":{"keyword":{"type":"keyword","ignore_above":256}}}}}}'''
 OPENSEARCH_DEFAULT_K = "20"
 OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_TEMP_PREFIX = 'video_frame_similiarity_check_temp_'
 OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_THRESHOLD = '1.7'
+VIDEO_FRAME_SIMILARITY_BACKEND = 'memory' # Dedup similarity backend: memory (in-process) | opensearch (temp k-NN index)
 OPENSEARCH_VIDEO_FRAME_SIMILAIRTY_INDEX_MAPPING = '{"mappings":{"properties":{"mm_embedding":{"type":"knn_vector","dimension":1024,"method":{"name":"hnsw","engine":"lucene","space_type":"l2","parameters":{}}}}}}'
 OPENSEARCH_SHARD_SIZE_LIMIT = "104857600" # 100M
+OPENSEARCH_BULK_CHUNK_SIZE = "500" # Frame documents per bulk request
+OPENSEARCH_BULK_MAX_BYTES = "10485760" # Bytes per bulk request, under the domain http.max_content_length
+OPENSEARCH_REFRESH_INTERVAL = "30s" # Frame index refresh interval, set when an index is created. Each task refreshes its indices once its frames are saved
+OPENSEARCH_ROLLOVER_MODE = "date" # Frame index rollover: date (<prefix><date>_<seq>, checked by the lambdas) | ism (write alias rolled over by an ISM policy)
+OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S = "300" # The cached write index is checked again after this many seconds...
+OPENSEARCH_ROLLOVER_CHECK_DOCS = "2000" # ...or documents written by the container
+OPENSEARCH_VECTOR_ENCODING = "float32" # Frame vectors in new frame indices: float32 | fp16 (faiss SQ, engine 2.13+) | byte (lucene, engine 2.9+) | pq (faiss PQ, engine 2.10+, models trained from a full float32 index)
+OPENSEARCH_VECTOR_BYTE_SCALE = "512" # byte: vector values are multiplied by this and rounded to [-128, 127]
+OPENSEARCH_VECTOR_PQ_M = "128" # pq: sub-vectors (bytes) per vector, divides the dimension
+OPENSEARCH_VECTOR_SOURCE_EXCLUDES = "true" # Leave the vector fields out of the stored frame documents
 
 DYNAMO_VIDEO_TASK_TABLE = "extr_srv_video_task"
 DYNAMO_VIDEO_TRANS_TABLE = "extr_srv_video_transcription"
 DYNAMO_VIDEO_FRAME_TABLE = "extr_srv_video_frame"
 DYNAMO_VIDEO_ANALYSIS_TABLE = "extr_srv_video_analysis"
+DYNAMO_RATE_LIMIT_TABLE = "extr_srv_rate_limit" # Shared token buckets and AIMD rates for Rekognition and Bedrock
 
 REK_MIN_CONF_DETECT_CELEBRITY = "90"
 REK_MIN_CONF_DETECT_LABEL = "80"
 REK_MIN_CONF_DETECT_MODERATION = "70"
 REK_MIN_CONF_DETECT_TEXT = "60"
 
+# Account-wide calls per second, the AIMD limiter never goes above these
+REKOGNITION_RATE_LIMIT = "50" # per Rekognition API
+BEDROCK_CAPTION_RATE_LIMIT = "10" # image caption model
+BEDROCK_EMBEDDING_RATE_LIMIT = "30" # per Titan embedding model
+
 BEDROCK_DEFAULT_MODEL_ID = "anthropic.claude-v2:1"
 BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID = "amazon.titan-embed-image-v1"
 BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
@@ -52,4 +78,19 @@ PROMPTS_PLACE_HOLDER_CELEBRITY = "CELEBRITY"
 PROMPTS_PLACE_HOLDER_IMAGE_CAPTION = "IMAGE_CAPTION"
 PROMPTS_PLACE_HOLDER_KB_POLICY = "KB_POLICY"
 PROMPTS_PLACE_HOLDER_LABELS = "LABEL"
-VIDEO_FRAME_SIMILAIRTY_THRESHOLD_FAISS = '0.8'
\ No newline at end of file
+VIDEO_FRAME_SIMILAIRTY_THRESHOLD_FAISS = '0.8'
+VIDEO_FRAME_HASH_PREFILTER = "true" # Smart sampling: compare perceptual hashes locally before calling Bedrock
+VIDEO_FRAME_HASH_DUPLICATE_DISTANCE = "3" # Hamming distance (of 64 bits) at or below which a frame is dropped as near-identical
+VIDEO_FRAME_HASH_DISTINCT_DISTANCE = "18" # Hamming distance at or above which a frame is kept as clearly different
+VIDEO_FRAME_SIMILARITY_METRIC = "l2" # Smart sampling vector comparison: l2 (squared L2) | cosine
+VIDEO_FRAME_SIMILARITY_WINDOW = "1" # Number of last kept frames each sampled frame is compared with
+VIDEO_FRAME_DEDUP_CONCURRENCY = "8" # Smart sampling: S3 reads and Bedrock embedding calls in flight per chunk
+BEDROCK_MAX_RETRIES = "6" # Retries for throttled Bedrock calls (exponential backoff with jitter)
+EMBEDDING_CACHE_ENABLED = "true" # Content-addressed embedding cache: (model, image SHA-256, text SHA-256) -> float32 vector
+EMBEDDING_CACHE_S3_PREFIX = "embedding_cache" # S3 prefix of the embedding cache in the extraction bucket
+EMBEDDING_BATCH_MAX_SIZE = "64" # Inputs per batch request to the embedding lambda
+EMBEDDING_BATCH_CONCURRENCY = "8" # Bedrock calls in flight for one batch request
+EMBEDDING_TRANSPORT = "bedrock" # Embedding client layer: bedrock (Titan called in process) | lambda (through extr-srv-generate-embedding)
+DETECTOR_CACHE_ENABLED = "true" # Detector result cache: (detector, configuration, frame SHA-256) -> Rekognition/caption output
+DETECTOR_CACHE_S3_PREFIX = "detector_cache" # S3 prefix of the detector cache in the extraction bucket
+REKOGNITION_MODEL_VERSION = "1" # Part of the detector cache key, bump to invalidate cached Rekognition results
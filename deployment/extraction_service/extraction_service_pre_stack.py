@@ -212,7 +212,11 @@ class ExtractionServicePreStack(NestedStack):
                                         {
                                             "name":"faiss-cpu",
                                             "version":"1.8.0",
-                                        }                                    
+                                        },
+                                        {
+                                            "name":"pillow",
+                                            "version":"10.3.0",
+                                        }
                                     ],
                                     "s3_bucket":self.s3_extraction_bucket_name,
                                     "s3_key":LAMBDA_LAYER_SOURCE_S3_KEY_LANGCHAIN
@@ -58,6 +58,9 @@ class ExtractionServiceStack(NestedStack):
     cognito_authorizer = None
     opensearch_layer = None
     langchain_layer = None
+    embedding_client_layer = None
+    embedding_client_env = None
+    frame_vector_layer = None
     sf_state_machine = None
     api = None
     delete_task_q = None
@@ -158,11 +161,16 @@ class ExtractionServiceStack(NestedStack):
             ]
         )
 
+        # Compact vector encodings need a newer engine, see vector_encoding.py
+        min_engine_version = {"fp16": "2.13", "byte": "2.9", "pq": "2.10"}.get(OPENSEARCH_VECTOR_ENCODING)
+        if min_engine_version and [int(v) for v in OPENSEARCH_ENGINE_VERSION.split(".")] < [int(v) for v in min_engine_version.split(".")]:
+            raise ValueError(f"OPENSEARCH_VECTOR_ENCODING {OPENSEARCH_VECTOR_ENCODING} needs OpenSearch {min_engine_version} or later")
+
         # OpenSearch domain
         self.opensearch_domain = opensearch.Domain(
             self, f"OpenSearchDomain{self.instance_hash}",
             domain_name=f'{OPENSEARCH_DOMAIN_NAME_PREFIX}{self.instance_hash}',
-            version=opensearch.EngineVersion.OPENSEARCH_2_7,
+            version=opensearch.EngineVersion.open_search(OPENSEARCH_ENGINE_VERSION),
             node_to_node_encryption=True,
             enforce_https=True,
             encryption_at_rest=opensearch.EncryptionAtRestOptions(enabled=True),
@@ -272,6 +280,15 @@ class ExtractionServiceStack(NestedStack):
             ),
             projection_type=_dynamodb.ProjectionType.ALL 
         )
+        # Rate limit table: per second token counters (expire with TTL) and current AIMD rates
+        rate_limit_table = _dynamodb.Table(self, 
+            id='rate-limit-table', 
+            table_name=DYNAMO_RATE_LIMIT_TABLE, 
+            partition_key=_dynamodb.Attribute(name='Id', type=_dynamodb.AttributeType.STRING),
+            billing_mode=_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="ExpiresAt",
+            removal_policy=RemovalPolicy.DESTROY
+        )
 
     def deploy_s3(self):
         if self.s3_bucket_name_extraction:
@@ -343,6 +360,21 @@ class ExtractionServiceStack(NestedStack):
             compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
             description="Python 3.12 with movie.py"
         )
+        self.embedding_client_layer = _lambda.LayerVersion(self, 'EmbeddingClientLayer',
+            code=_lambda.Code.from_asset(os.path.join("../source/", "extraction_service/lambda_layer/embedding-client")),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_12, _lambda.Runtime.PYTHON_3_10],
+            description="Embedding client: Titan embeddings with rate limiter and cache, in process or through extr-srv-generate-embedding"
+        )
+        self.frame_vector_layer = _lambda.LayerVersion(self, 'FrameVectorLayer',
+            code=_lambda.Code.from_asset(os.path.join("../source/", "extraction_service/lambda_layer/frame-vector")),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+            description="Frame vector save: frame index rollover, vector encoding and bulk indexing"
+        )
+        subtitle_index_layer = _lambda.LayerVersion(self, 'SubtitleIndexLayer',
+            code=_lambda.Code.from_asset(os.path.join("../source/", "extraction_service/lambda_layer/subtitle-index")),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+            description="Sorted subtitle index of a task, written by the transcription trigger and read by the frame subtitle stage"
+        )
         
         # Util function generate embedding
         # Lambda: extr-srv-generate-embedding
@@ -365,6 +397,16 @@ class ExtractionServiceStack(NestedStack):
                         effect=_iam.Effect.ALLOW,
                         actions=["logs:CreateLogStream", "logs:PutLogEvents"],
                         resources=[f"arn:aws:logs:{self.region}:{self.account_id}:log-group:/aws/lambda/extr-srv-generate-embedding{self.instance_hash}:*"]
+                    ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["s3:ListBucket","s3:GetObject","s3:PutObject"],
+                        resources=[f"arn:aws:s3:::{self.s3_bucket_name_extraction}",f"arn:aws:s3:::{self.s3_bucket_name_extraction}/{EMBEDDING_CACHE_S3_PREFIX}/*"]
+                    ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["dynamodb:GetItem", "dynamodb:UpdateItem"],
+                        resources=[f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_RATE_LIMIT_TABLE}"]
                     )
                 ]
             )}
@@ -375,16 +417,39 @@ class ExtractionServiceStack(NestedStack):
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler='extr-srv-generate-embedding.lambda_handler',
             code=_lambda.Code.from_asset(os.path.join("../source/", "extraction_service/lambda/extr-srv-generate-embedding")),
-            timeout=Duration.seconds(10),
+            timeout=Duration.seconds(60),
             environment={
                 'BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID': BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID,
                 'BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID': BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID,
-                'BEDROCK_REGION': self.bedrock_region
+                'BEDROCK_REGION': self.bedrock_region,
+                'EMBEDDING_CACHE_ENABLED': EMBEDDING_CACHE_ENABLED,
+                'EMBEDDING_CACHE_S3_BUCKET': self.s3_bucket_name_extraction,
+                'EMBEDDING_CACHE_S3_PREFIX': EMBEDDING_CACHE_S3_PREFIX,
+                'RATE_LIMIT_TABLE': DYNAMO_RATE_LIMIT_TABLE,
+                'BEDROCK_EMBEDDING_RATE_LIMIT': BEDROCK_EMBEDDING_RATE_LIMIT,
+                'EMBEDDING_BATCH_MAX_SIZE': EMBEDDING_BATCH_MAX_SIZE,
+                'EMBEDDING_BATCH_CONCURRENCY': EMBEDDING_BATCH_CONCURRENCY
             },
             role=lambda_extration_srv_gen_embedding_role,
+            layers=[self.embedding_client_layer],
         )
         self.lambda_arn_gen_embedding = lambda_gen_embedding.function_arn
 
+        # Environment of the lambdas using the embedding client layer
+        self.embedding_client_env = {
+            'EMBEDDING_TRANSPORT': EMBEDDING_TRANSPORT,
+            'LAMBDA_FUNCTION_ARN_EMBEDDING': self.lambda_arn_gen_embedding,
+            'BEDROCK_REGION': self.bedrock_region,
+            'BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID': BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID,
+            'BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID': BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID,
+            'EMBEDDING_CACHE_ENABLED': EMBEDDING_CACHE_ENABLED,
+            'EMBEDDING_CACHE_S3_BUCKET': self.s3_bucket_name_extraction,
+            'EMBEDDING_CACHE_S3_PREFIX': EMBEDDING_CACHE_S3_PREFIX,
+            'RATE_LIMIT_TABLE': DYNAMO_RATE_LIMIT_TABLE,
+            'BEDROCK_EMBEDDING_RATE_LIMIT': BEDROCK_EMBEDDING_RATE_LIMIT,
+            'EMBEDDING_BATCH_CONCURRENCY': EMBEDDING_BATCH_CONCURRENCY
+        }
+
         # Step Function - start
         # Lambda: extr-srv-video-metadata
         lambda_extration_srv_metadata_role = _iam.Role(
@@ -474,7 +539,7 @@ class ExtractionServiceStack(NestedStack):
                         resources=[f"arn:aws:logs:{self.region}:{self.account_id}:log-group:/aws/lambda/extr-srv-sample-video{self.instance_hash}:*"]
                     ),
                     _iam.PolicyStatement(
-                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem"],
+                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem", "dynamodb:BatchWriteItem"],
                         resources=[
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TASK_TABLE}/index/*",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}/index/*",
@@ -503,6 +568,9 @@ class ExtractionServiceStack(NestedStack):
                 'VIDEO_SAMPLE_FILE_PREFIX': VIDEO_SAMPLE_FILE_PREFIX,
                 'VIDEO_SAMPLE_S3_PREFIX': VIDEO_SAMPLE_S3_PREFIX,
                 'VIDEO_SAMPLE_S3_BUCKET': self.s3_bucket_name_extraction,
+                'VIDEO_SAMPLE_DECODE_MODE': VIDEO_SAMPLE_DECODE_MODE,
+                'VIDEO_SAMPLE_UPLOAD_THREADS': VIDEO_SAMPLE_UPLOAD_THREADS,
+                'VIDEO_SAMPLE_UPLOAD_QUEUE_SIZE': VIDEO_SAMPLE_UPLOAD_QUEUE_SIZE,
                 'REKOGNITION_REGION': self.rekognition_region,
             },
             role=lambda_extration_srv_sample_video_role,
@@ -545,7 +613,7 @@ class ExtractionServiceStack(NestedStack):
                         resources=["*"]
                     ),
                     _iam.PolicyStatement(
-                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem"],
+                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem", "dynamodb:BatchWriteItem"],
                         resources=[
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TASK_TABLE}/index/*",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}/index/*",
@@ -576,6 +644,12 @@ class ExtractionServiceStack(NestedStack):
                 'OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_TEMP_PREFIX': OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_TEMP_PREFIX,
                 'OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_THRESHOLD': OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_THRESHOLD,
                 'OPENSEARCH_VIDEO_FRAME_SIMILAIRTY_INDEX_MAPPING': OPENSEARCH_VIDEO_FRAME_SIMILAIRTY_INDEX_MAPPING,
+                'VIDEO_FRAME_SIMILARITY_BACKEND': VIDEO_FRAME_SIMILARITY_BACKEND,
+                'VIDEO_FRAME_DEDUP_CONCURRENCY': VIDEO_FRAME_DEDUP_CONCURRENCY,
+                'BEDROCK_MAX_RETRIES': BEDROCK_MAX_RETRIES,
+                'EMBEDDING_CACHE_ENABLED': EMBEDDING_CACHE_ENABLED,
+                'EMBEDDING_CACHE_S3_BUCKET': self.s3_bucket_name_extraction,
+                'EMBEDDING_CACHE_S3_PREFIX': EMBEDDING_CACHE_S3_PREFIX,
                 'DYNAMO_VIDEO_TASK_TABLE': DYNAMO_VIDEO_TASK_TABLE,
                 'DYNAMO_VIDEO_TRANS_TABLE': DYNAMO_VIDEO_TRANS_TABLE,
                 'DYNAMO_VIDEO_FRAME_TABLE': DYNAMO_VIDEO_FRAME_TABLE,
@@ -583,7 +657,7 @@ class ExtractionServiceStack(NestedStack):
                 'BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID': BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID
             },
             role=lambda_extration_srv_sample_video_dedup_role,
-            layers=[self.opensearch_layer],
+            layers=[self.opensearch_layer, self.embedding_client_layer],
             vpc=self.vpc,
         )
 
@@ -625,7 +699,7 @@ class ExtractionServiceStack(NestedStack):
                         resources=["*"]
                     ),
                     _iam.PolicyStatement(
-                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem"],
+                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem", "dynamodb:BatchWriteItem"],
                         resources=[
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TASK_TABLE}/index/*",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}/index/*",
@@ -653,10 +727,69 @@ class ExtractionServiceStack(NestedStack):
                 'DYNAMO_VIDEO_TRANS_TABLE': DYNAMO_VIDEO_TRANS_TABLE,
                 'DYNAMO_VIDEO_FRAME_TABLE': DYNAMO_VIDEO_FRAME_TABLE,
                 'VIDEO_SAMPLE_FILE_PREFIX': VIDEO_SAMPLE_FILE_PREFIX,
-                'BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID': BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID
+                'BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID': BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID,
+                'VIDEO_FRAME_HASH_PREFILTER': VIDEO_FRAME_HASH_PREFILTER,
+                'VIDEO_FRAME_HASH_DUPLICATE_DISTANCE': VIDEO_FRAME_HASH_DUPLICATE_DISTANCE,
+                'VIDEO_FRAME_HASH_DISTINCT_DISTANCE': VIDEO_FRAME_HASH_DISTINCT_DISTANCE,
+                'VIDEO_FRAME_SIMILARITY_METRIC': VIDEO_FRAME_SIMILARITY_METRIC,
+                'VIDEO_FRAME_SIMILARITY_WINDOW': VIDEO_FRAME_SIMILARITY_WINDOW,
+                'VIDEO_FRAME_DEDUP_CONCURRENCY': VIDEO_FRAME_DEDUP_CONCURRENCY,
+                'BEDROCK_MAX_RETRIES': BEDROCK_MAX_RETRIES,
+                'EMBEDDING_CACHE_ENABLED': EMBEDDING_CACHE_ENABLED,
+                'EMBEDDING_CACHE_S3_BUCKET': self.s3_bucket_name_extraction,
+                'EMBEDDING_CACHE_S3_PREFIX': EMBEDDING_CACHE_S3_PREFIX
             },
             role=lambda_extration_srv_sample_video_dedup_faiss_role,
-            layers=[self.langchain_layer]
+            layers=[self.langchain_layer, self.embedding_client_layer]
+        )
+
+        # Lambda: extr-srv-frame-subtitle
+        lambda_extration_srv_frame_subtitle_role = _iam.Role(
+            self, "ExtrSrvLambdaFrameSubtitleRole",
+            assumed_by=_iam.ServicePrincipal("lambda.amazonaws.com"),
+            inline_policies={"extr-srv-frame-subtitle-poliy": _iam.PolicyDocument(
+                statements=[
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["s3:ListBucket","s3:GetObject","s3:PutObject","s3:HeadObject"],
+                        resources=[f"arn:aws:s3:::{self.s3_bucket_name_extraction}",f"arn:aws:s3:::{self.s3_bucket_name_extraction}/*"]
+                    ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["logs:CreateLogGroup"],
+                        resources=[f"arn:aws:logs:{self.region}:{self.account_id}:*"]
+                    ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["logs:CreateLogStream", "logs:PutLogEvents"],
+                        resources=[f"arn:aws:logs:{self.region}:{self.account_id}:log-group:/aws/lambda/extr-srv-frame-subtitle{self.instance_hash}:*"]
+                    ),
+                    _iam.PolicyStatement(
+                        actions=["dynamodb:Query", "dynamodb:GetItem", "dynamodb:UpdateItem"],
+                        resources=[
+                            f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}/index/*",
+                            f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TRANS_TABLE}",
+                            f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}"
+                        ]
+                    )
+                ]
+            )}
+        )
+        lambda_extraction_srv_frame_subtitle = _lambda.Function(self, 
+            id='ExtrSrvFrameSubtitleLambda', 
+            function_name=f"extr-srv-frame-subtitle{self.instance_hash}", 
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler='extr-srv-frame-subtitle.lambda_handler',
+            code=_lambda.Code.from_asset(os.path.join("../source/", "extraction_service/lambda/extr-srv-frame-subtitle")),
+            timeout=Duration.seconds(900),
+            memory_size=1024,
+            role=lambda_extration_srv_frame_subtitle_role,
+            environment={
+                'DYNAMO_VIDEO_FRAME_TABLE': DYNAMO_VIDEO_FRAME_TABLE,
+                'DYNAMO_VIDEO_TRANS_TABLE': DYNAMO_VIDEO_TRANS_TABLE,
+                'FRAME_MANIFEST_FILE': FRAME_MANIFEST_FILE,
+            },
+            layers=[subtitle_index_layer],
         )
 
         # Lambda: extr-srv-image-extraction
@@ -691,12 +824,13 @@ class ExtractionServiceStack(NestedStack):
                         resources=[f"arn:aws:logs:{self.region}:{self.account_id}:log-group:/aws/lambda/extr-srv-image-extraction{self.instance_hash}:*"]
                     ),
                     _iam.PolicyStatement(
-                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem"],
+                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem", "dynamodb:BatchWriteItem"],
                         resources=[
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TASK_TABLE}/index/*",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}/index/*",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TASK_TABLE}",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TRANS_TABLE}",
+                            f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_RATE_LIMIT_TABLE}",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}"
                         ]
                     )
@@ -715,15 +849,24 @@ class ExtractionServiceStack(NestedStack):
                 'REKOGNITION_REGION': self.rekognition_region,
                 'DYNAMO_VIDEO_TASK_TABLE': DYNAMO_VIDEO_TASK_TABLE,
                 'DYNAMO_VIDEO_FRAME_TABLE': DYNAMO_VIDEO_FRAME_TABLE,
-                'DYNAMO_VIDEO_TRANS_TABLE': DYNAMO_VIDEO_TRANS_TABLE,
                 'REK_MIN_CONF_DETECT_CELEBRITY': REK_MIN_CONF_DETECT_CELEBRITY,
                 'REK_MIN_CONF_DETECT_MODERATION': REK_MIN_CONF_DETECT_MODERATION,
                 'REK_MIN_CONF_DETECT_TEXT': REK_MIN_CONF_DETECT_TEXT,
                 'REK_MIN_CONF_DETECT_LABEL': REK_MIN_CONF_DETECT_LABEL,
                 'BEDROCK_REGION': self.bedrock_region,
                 'BEDROCK_ANTHROPIC_CLAUDE_HAIKU': BEDROCK_ANTHROPIC_CLAUDE_HAIKU,
-                'BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION': BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION
+                'BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION': BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION,
+                'VIDEO_IMAGE_BATCH_CONCURRENCY': VIDEO_IMAGE_BATCH_CONCURRENCY,
+                'RATE_LIMIT_TABLE': DYNAMO_RATE_LIMIT_TABLE,
+                'REKOGNITION_RATE_LIMIT': REKOGNITION_RATE_LIMIT,
+                'BEDROCK_CAPTION_RATE_LIMIT': BEDROCK_CAPTION_RATE_LIMIT,
+                'RAW_OUTPUT_MODE': RAW_OUTPUT_MODE,
+                'DETECTOR_CACHE_ENABLED': DETECTOR_CACHE_ENABLED,
+                'DETECTOR_CACHE_S3_PREFIX': DETECTOR_CACHE_S3_PREFIX,
+                'REKOGNITION_MODEL_VERSION': REKOGNITION_MODEL_VERSION
             },
+            # rate_limiter
+            layers=[self.embedding_client_layer],
         )
 
         # Lambda: extr-srv-image-embedding
@@ -752,6 +895,11 @@ class ExtractionServiceStack(NestedStack):
                         actions=["logs:CreateLogStream", "logs:PutLogEvents"],
                         resources=[f"arn:aws:logs:{self.region}:{self.account_id}:log-group:/aws/lambda/extr-srv-image-embedding{self.instance_hash}:*"]
                     ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["bedrock:InvokeModel"],
+                        resources=["arn:aws:bedrock:*::foundation-model/amazon.titan*"]
+                    ),
                     _iam.PolicyStatement(
                         actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem"],
                         resources=[
@@ -759,6 +907,7 @@ class ExtractionServiceStack(NestedStack):
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}/index/*",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TASK_TABLE}",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TRANS_TABLE}",
+                            f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_RATE_LIMIT_TABLE}",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}"
                         ]
                     )
@@ -771,13 +920,15 @@ class ExtractionServiceStack(NestedStack):
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler='extr-srv-image-embedding.lambda_handler',
             code=_lambda.Code.from_asset(os.path.join("../source/", "extraction_service/lambda/extr-srv-image-embedding")),
-            timeout=Duration.seconds(60),
+            timeout=Duration.seconds(300),
             role=lambda_extration_srv_image_caption_mm_role,
             environment={
-             'LAMBDA_FUNCTION_ARN_EMBEDDING': self.lambda_arn_gen_embedding,
              'DYNAMO_VIDEO_FRAME_TABLE': DYNAMO_VIDEO_FRAME_TABLE,
              'DYNAMO_VIDEO_TASK_TABLE': DYNAMO_VIDEO_TASK_TABLE,
+             'VIDEO_IMAGE_BATCH_CONCURRENCY': VIDEO_IMAGE_BATCH_CONCURRENCY,
+             **self.embedding_client_env
             },
+            layers=[self.embedding_client_layer],
         )
 
         # Lambda: extr-srv-image-vector-save
@@ -832,9 +983,19 @@ class ExtractionServiceStack(NestedStack):
              'OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME': OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME,
              'OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING': OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING,
              'DYNAMO_VIDEO_TASK_TABLE': DYNAMO_VIDEO_TASK_TABLE,
-             'OPENSEARCH_SHARD_SIZE_LIMIT': OPENSEARCH_SHARD_SIZE_LIMIT
+             'OPENSEARCH_SHARD_SIZE_LIMIT': OPENSEARCH_SHARD_SIZE_LIMIT,
+             'OPENSEARCH_BULK_CHUNK_SIZE': OPENSEARCH_BULK_CHUNK_SIZE,
+             'OPENSEARCH_BULK_MAX_BYTES': OPENSEARCH_BULK_MAX_BYTES,
+             'OPENSEARCH_REFRESH_INTERVAL': OPENSEARCH_REFRESH_INTERVAL,
+             'OPENSEARCH_ROLLOVER_MODE': OPENSEARCH_ROLLOVER_MODE,
+             'OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S': OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S,
+             'OPENSEARCH_ROLLOVER_CHECK_DOCS': OPENSEARCH_ROLLOVER_CHECK_DOCS,
+             'OPENSEARCH_VECTOR_ENCODING': OPENSEARCH_VECTOR_ENCODING,
+             'OPENSEARCH_VECTOR_BYTE_SCALE': OPENSEARCH_VECTOR_BYTE_SCALE,
+             'OPENSEARCH_VECTOR_PQ_M': OPENSEARCH_VECTOR_PQ_M,
+             'OPENSEARCH_VECTOR_SOURCE_EXCLUDES': OPENSEARCH_VECTOR_SOURCE_EXCLUDES
             },
-            layers=[self.opensearch_layer],
+            layers=[self.opensearch_layer, self.frame_vector_layer],
             vpc=self.vpc,
         )
 
@@ -844,6 +1005,117 @@ class ExtractionServiceStack(NestedStack):
             port_range=ec2.Port.tcp(int(OPENSEARCH_PORT))
         )
 
+        # Lambda: extr-srv-frame-processor (extraction, embedding and vector save in one invocation)
+        lambda_extration_srv_frame_processor_role = _iam.Role(
+            self, "ExtrSrvLambdaFrameProcessorRole",
+            assumed_by=_iam.ServicePrincipal("lambda.amazonaws.com"),
+            inline_policies={"extr-srv-frame-processor-poliy": _iam.PolicyDocument(
+                statements=[
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["s3:ListBucket","s3:GetObject","s3:PutObject","s3:DeleteObject","s3:HeadObject"],
+                        resources=[f"arn:aws:s3:::{self.s3_bucket_name_extraction}",f"arn:aws:s3:::{self.s3_bucket_name_extraction}/*"]
+                    ), 
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["rekognition:DetectModerationLabels", "rekognition:DetectFaces", "rekognition:DetectLabels", "rekognition:DetectText", "rekognition:RecognizeCelebrities"],
+                        resources=["*"]
+                    ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["bedrock:InvokeModel"],
+                        resources=["arn:aws:bedrock:*::foundation-model/amazon.titan*", "arn:aws:bedrock:*::foundation-model/anthropic.*"]
+                    ), 
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["lambda:InvokeFunction"],
+                        resources=[self.lambda_arn_gen_embedding]
+                    ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["es:ESHttpGet", "es:ESHttpHead", "es:ESHttpPut", "es:ESHttpDelete", "es:ESHttpPost", "es:DescribeDomains", "es:ListDomainNames", "es:DescribeDomain"],
+                        resources=[self.opensearch_domain.domain_arn]
+                    ), 
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["logs:CreateLogGroup"],
+                        resources=[f"arn:aws:logs:{self.region}:{self.account_id}:*"]
+                    ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["logs:CreateLogStream", "logs:PutLogEvents"],
+                        resources=[f"arn:aws:logs:{self.region}:{self.account_id}:log-group:/aws/lambda/extr-srv-frame-processor{self.instance_hash}:*"]
+                    ),
+                    _iam.PolicyStatement(
+                        actions=["ec2:DescribeNetworkInterfaces", "ec2:CreateNetworkInterface", "ec2:DeleteNetworkInterface",],
+                        resources=["*"]
+                    ),
+                    _iam.PolicyStatement(
+                        actions=["dynamodb:Query", "dynamodb:UpdateItem", "dynamodb:GetItem"],
+                        resources=[
+                            f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TASK_TABLE}",
+                            f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_RATE_LIMIT_TABLE}",
+                            f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}"
+                        ]
+                    )
+                ]
+            )}
+        )
+        lambda_extraction_srv_frame_processor = _lambda.Function(self, 
+            id='ExtrSrvFrameProcessorLambda', 
+            function_name=f"extr-srv-frame-processor{self.instance_hash}", 
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler='extr-srv-frame-processor.lambda_handler',
+            code=_lambda.Code.from_asset(os.path.join("../source/", "extraction_service/lambda/extr-srv-frame-processor")),
+            timeout=Duration.seconds(900),
+            memory_size=1024,
+            role=lambda_extration_srv_frame_processor_role,
+            environment={
+                'REKOGNITION_REGION': self.rekognition_region,
+                'DYNAMO_VIDEO_TASK_TABLE': DYNAMO_VIDEO_TASK_TABLE,
+                'DYNAMO_VIDEO_FRAME_TABLE': DYNAMO_VIDEO_FRAME_TABLE,
+                'REK_MIN_CONF_DETECT_CELEBRITY': REK_MIN_CONF_DETECT_CELEBRITY,
+                'REK_MIN_CONF_DETECT_MODERATION': REK_MIN_CONF_DETECT_MODERATION,
+                'REK_MIN_CONF_DETECT_TEXT': REK_MIN_CONF_DETECT_TEXT,
+                'REK_MIN_CONF_DETECT_LABEL': REK_MIN_CONF_DETECT_LABEL,
+                'BEDROCK_REGION': self.bedrock_region,
+                'BEDROCK_ANTHROPIC_CLAUDE_HAIKU': BEDROCK_ANTHROPIC_CLAUDE_HAIKU,
+                'BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION': BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION,
+                'VIDEO_IMAGE_BATCH_CONCURRENCY': VIDEO_IMAGE_BATCH_CONCURRENCY,
+                'RATE_LIMIT_TABLE': DYNAMO_RATE_LIMIT_TABLE,
+                'REKOGNITION_RATE_LIMIT': REKOGNITION_RATE_LIMIT,
+                'BEDROCK_CAPTION_RATE_LIMIT': BEDROCK_CAPTION_RATE_LIMIT,
+                'RAW_OUTPUT_MODE': RAW_OUTPUT_MODE,
+                'DETECTOR_CACHE_ENABLED': DETECTOR_CACHE_ENABLED,
+                'DETECTOR_CACHE_S3_PREFIX': DETECTOR_CACHE_S3_PREFIX,
+                'REKOGNITION_MODEL_VERSION': REKOGNITION_MODEL_VERSION,
+                'OPENSEARCH_DOMAIN_ENDPOINT': self.opensearch_domain.domain_endpoint,
+                'OPENSEARCH_PORT': OPENSEARCH_PORT,
+                'OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME': OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME,
+                'OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING': OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING,
+                'OPENSEARCH_SHARD_SIZE_LIMIT': OPENSEARCH_SHARD_SIZE_LIMIT,
+                'OPENSEARCH_BULK_CHUNK_SIZE': OPENSEARCH_BULK_CHUNK_SIZE,
+                'OPENSEARCH_BULK_MAX_BYTES': OPENSEARCH_BULK_MAX_BYTES,
+                'OPENSEARCH_REFRESH_INTERVAL': OPENSEARCH_REFRESH_INTERVAL,
+                'OPENSEARCH_ROLLOVER_MODE': OPENSEARCH_ROLLOVER_MODE,
+                'OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S': OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S,
+                'OPENSEARCH_ROLLOVER_CHECK_DOCS': OPENSEARCH_ROLLOVER_CHECK_DOCS,
+                'OPENSEARCH_VECTOR_ENCODING': OPENSEARCH_VECTOR_ENCODING,
+                'OPENSEARCH_VECTOR_BYTE_SCALE': OPENSEARCH_VECTOR_BYTE_SCALE,
+                'OPENSEARCH_VECTOR_PQ_M': OPENSEARCH_VECTOR_PQ_M,
+                'OPENSEARCH_VECTOR_SOURCE_EXCLUDES': OPENSEARCH_VECTOR_SOURCE_EXCLUDES,
+                **self.embedding_client_env
+            },
+            layers=[self.opensearch_layer, self.embedding_client_layer, self.frame_vector_layer],
+            vpc=self.vpc,
+        )
+
+        # Grant access to OpenSearch
+        self.opensearch_domain.connections.allow_from(
+            other=lambda_extraction_srv_frame_processor,
+            port_range=ec2.Port.tcp(int(OPENSEARCH_PORT))
+        )
+
         # Lambda: extr-srv-aggregate-extracted-label
         lambda_extration_srv_agg_role = _iam.Role(
             self, "ExtrSrvLambdaAggRole",
@@ -1021,6 +1293,7 @@ class ExtractionServiceStack(NestedStack):
             sm_json = sm_json.replace("##LAMBDA_METADATA_VIDEO##", f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-video-metadata{self.instance_hash}")
             sm_json = sm_json.replace("##LAMBDA_ES_SAMPLE_VIDEO##", f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-sample-video{self.instance_hash}")
             sm_json = sm_json.replace("##LAMBDA_ES_SAMPLE_VIDEO_DEDUP##", f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-sample-video-dedup-faiss{self.instance_hash}")
+            sm_json = sm_json.replace("##LAMBDA_ES_FRAME_SUBTITLE##", f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-frame-subtitle{self.instance_hash}")
             sm_json = sm_json.replace("##LAMBDA_ES_IMAGE_EXTRACTION##", f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-image-extraction{self.instance_hash}")
             sm_json = sm_json.replace("##LAMBDA_ES_IMAGE_EMBEDDING##", f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-image-embedding{self.instance_hash}")
             sm_json = sm_json.replace("##LAMBDA_ES_IMAGE_EMBEDDING_SAVE##", f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-image-vector-save{self.instance_hash}")
@@ -1029,6 +1302,30 @@ class ExtractionServiceStack(NestedStack):
             #sm_json = sm_json.replace("##LAMBDA_ES_SCENE_ANALYSIS##", f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-scene-analysis{self.instance_hash}")
             sm_json = sm_json.replace("##VIDEO_IMAGE_EXTRACTION_CONCURRENT_LIMIT##", VIDEO_IMAGE_EXTRACTION_CONCURRENT_LIMIT)
             sm_json = sm_json.replace("##VIDEO_IMAGE_EXTRACTION_SAMPLE_CONCURRENT_LIMIT##", VIDEO_IMAGE_EXTRACTION_SAMPLE_CONCURRENT_LIMIT)
+            sm_json = sm_json.replace("##VIDEO_IMAGE_EXTRACTION_BATCH_SIZE##", VIDEO_IMAGE_EXTRACTION_BATCH_SIZE)
+
+            if VIDEO_FRAME_PROCESSOR_MODE == "fused":
+                # Replace the extraction, embedding and vector save steps of each Map batch with the fused frame processor
+                sm_definition = json.loads(sm_json)
+                item_processor = sm_definition["States"]["Iterate sampled images"]["ItemProcessor"]
+                first_step = item_processor["States"][item_processor["StartAt"]]
+                # The fused processor also saves the vectors: keep the retry on frames not indexed
+                save_step = item_processor["States"]["Store vectors"]
+                item_processor["StartAt"] = "Process frames"
+                item_processor["States"] = {
+                    "Process frames": {
+                        "Type": "Task",
+                        "Resource": "arn:aws:states:::lambda:invoke",
+                        "OutputPath": "$.Payload",
+                        "Parameters": {
+                            "FunctionName": f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-frame-processor{self.instance_hash}",
+                            "Payload.$": "$"
+                        },
+                        "Retry": first_step["Retry"] + [r for r in save_step["Retry"] if "FrameIndexError" in r["ErrorEquals"]],
+                        "End": True
+                    }
+                }
+                sm_json = json.dumps(sm_definition, indent=2)
 
         stepfunction_extration_srv_workflow_role = _iam.Role(
             self, "ExtrSrvStepFunctionRole",
@@ -1057,9 +1354,11 @@ class ExtractionServiceStack(NestedStack):
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-video-metadata{self.instance_hash}",
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-sample-video{self.instance_hash}",
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-sample-video-dedup-faiss{self.instance_hash}",
+                            f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-frame-subtitle{self.instance_hash}",
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-image-extraction{self.instance_hash}",
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-image-embedding{self.instance_hash}",
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-image-vector-save{self.instance_hash}",
+                            f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-frame-processor{self.instance_hash}",
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-aggregate-extracted-label{self.instance_hash}",
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-shot-analysis{self.instance_hash}",
                             f"arn:aws:lambda:{self.region}:{self.account_id}:function:extr-srv-scene-analysis{self.instance_hash}",
@@ -1168,7 +1467,7 @@ class ExtractionServiceStack(NestedStack):
                         resources=[self.delete_task_q.queue_arn]
                     ),
                     _iam.PolicyStatement(
-                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem"],
+                        actions=["dynamodb:DeleteItem","dynamodb:Query", "dynamodb:Scan", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem", "dynamodb:BatchWriteItem"],
                         resources=[
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_TASK_TABLE}/index/*",
                             f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_VIDEO_FRAME_TABLE}/index/*",
@@ -1358,6 +1657,7 @@ class ExtractionServiceStack(NestedStack):
                 'DYNAMO_VIDEO_FRAME_TABLE': DYNAMO_VIDEO_FRAME_TABLE,
                 'SQS_URL': extr_task_sqs.queue_url,
             },
+            layers=[subtitle_index_layer],
         )
 
         # Add S3 trigger
@@ -1762,6 +2062,16 @@ class ExtractionServiceStack(NestedStack):
                         actions=["lambda:InvokeFunction"],
                         resources=[self.lambda_arn_gen_embedding]
                     ),                    
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["bedrock:InvokeModel"],
+                        resources=["arn:aws:bedrock:*::foundation-model/amazon.titan*"]
+                    ),
+                    _iam.PolicyStatement(
+                        effect=_iam.Effect.ALLOW,
+                        actions=["dynamodb:GetItem", "dynamodb:UpdateItem"],
+                        resources=[f"arn:aws:dynamodb:{self.region}:{self.account_id}:table/{DYNAMO_RATE_LIMIT_TABLE}"]
+                    ),
                     _iam.PolicyStatement(
                         effect=_iam.Effect.ALLOW,
                         actions=["logs:CreateLogGroup"],
@@ -1790,7 +2100,6 @@ class ExtractionServiceStack(NestedStack):
                 lambda_file_name="extr-srv-search-vector",
                 instance_hash=self.instance_hash, memory_m=1024, timeout_s=30, ephemeral_storage_size=1024,
                 evns={
-                    'LAMBDA_FUNCTION_ARN_EMBEDDING': self.lambda_arn_gen_embedding,
                     'OPENSEARCH_DEFAULT_K': OPENSEARCH_DEFAULT_K,
                     'OPENSEARCH_DOMAIN_ENDPOINT': self.opensearch_domain.domain_endpoint,
                     'OPENSEARCH_PORT': OPENSEARCH_PORT,
@@ -1799,9 +2108,12 @@ class ExtractionServiceStack(NestedStack):
                     'VIDEO_SAMPLE_FILE_PREFIX': VIDEO_SAMPLE_FILE_PREFIX,
                     'VIDEO_SAMPLE_S3_BUCKET': self.s3_bucket_name_extraction,
                     'VIDEO_SAMPLE_S3_PREFIX': VIDEO_SAMPLE_S3_PREFIX,
-                    'DYNAMO_VIDEO_TASK_TABLE': DYNAMO_VIDEO_TASK_TABLE
+                    'DYNAMO_VIDEO_TASK_TABLE': DYNAMO_VIDEO_TASK_TABLE,
+                    'OPENSEARCH_VECTOR_ENCODING': OPENSEARCH_VECTOR_ENCODING,
+                    'OPENSEARCH_VECTOR_BYTE_SCALE': OPENSEARCH_VECTOR_BYTE_SCALE,
+                    **self.embedding_client_env
                 }, 
-                layers=[self.opensearch_layer]
+                layers=[self.opensearch_layer, self.embedding_client_layer, self.frame_vector_layer]
         )
             
         # POST /v1/extraction/video/start-task
@@ -0,0 +1,119 @@
+'''
+Compare smart sampling dedup similarity backends on the same frame set.
+
+The vectors are scored with the same sequential walk the dedup lambda uses (each frame against
+the previous kept frame), so decisions and scores can be compared between backends.
+
+Usage:
+  # Synthetic vectors, in-process backend only
+  python dedup_similarity_backend.py --frames 500
+
+  # Embeddings exported as a JSON list of vectors, include OpenSearch (needs opensearch-py and network access)
+  python dedup_similarity_backend.py --vectors vectors.json --opensearch-host <domain-endpoint>
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lambda/extr-srv-sample-video-dedup"))
+import similarity_backend
+
+OPENSEARCH_VIDEO_FRAME_SIMILAIRTY_INDEX_MAPPING = '{"mappings":{"properties":{"mm_embedding":{"type":"knn_vector","dimension":1024,"method":{"name":"hnsw","engine":"lucene","space_type":"l2","parameters":{}}}}}}'
+
+def synthetic_vectors(frames, dimension, shot_length, seed):
+    # Shots of slowly drifting vectors with a jump at every shot boundary
+    rnd = random.Random(seed)
+    vectors, base = [], None
+    for i in range(frames):
+        if i % shot_length == 0:
+            base = [rnd.gauss(0, 0.03) for _ in range(dimension)]
+        base = [v + rnd.gauss(0, 0.004) for v in base]
+        vectors.append(list(base))
+    return vectors
+
+def run(backend, vectors, threshold):
+    decisions, scores, latencies = [], [], []
+    prev_ts, prev_vector = None, None
+    start = time.perf_counter()
+    backend.open()
+    for ts, vector in enumerate(vectors):
+        t = time.perf_counter()
+        score = None
+        if prev_vector is not None:
+            doc_id = f"benchmark_{prev_ts}"
+            backend.add(doc_id, prev_vector)
+            score = backend.score(doc_id, vector)
+        latencies.append(time.perf_counter() - t)
+
+        duplicate = score is not None and score > threshold
+        if not duplicate:
+            prev_ts, prev_vector = ts, vector
+        decisions.append(duplicate)
+        scores.append(score)
+    backend.close()
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "backend": backend.name,
+        "frames": len(vectors),
+        "kept": decisions.count(False),
+        "total_s": round(total, 4),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        "decisions": decisions,
+        "scores": scores,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", help="JSON file containing a list of frame embeddings in timestamp order")
+    parser.add_argument("--frames", type=int, default=300, help="Number of synthetic frames when --vectors is not set")
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--shot-length", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--threshold", type=float, default=1.7)
+    parser.add_argument("--opensearch-host", help="OpenSearch domain endpoint, enables the opensearch backend")
+    parser.add_argument("--opensearch-port", type=int, default=443)
+    args = parser.parse_args()
+
+    if args.vectors:
+        with open(args.vectors) as f:
+            vectors = json.load(f)
+    else:
+        vectors = synthetic_vectors(args.frames, args.dimension, args.shot_length, args.seed)
+
+    backends = [similarity_backend.create_backend("memory")]
+    if args.opensearch_host:
+        from opensearchpy import OpenSearch
+        client = OpenSearch(
+            hosts=[{'host': args.opensearch_host, 'port': args.opensearch_port}],
+            http_compress=True,
+            use_ssl=True,
+            verify_certs=True,
+            ssl_assert_hostname=False,
+            ssl_show_warn=False,
+        )
+        mapping = json.loads(OPENSEARCH_VIDEO_FRAME_SIMILAIRTY_INDEX_MAPPING)
+        mapping["mappings"]["properties"]["mm_embedding"]["dimension"] = len(vectors[0])
+        backends.append(similarity_backend.create_backend("opensearch", 
+                            opensearch_client=client, 
+                            index_name=f"video_frame_similiarity_check_temp_benchmark_{int(time.time())}", 
+                            index_mapping=json.dumps(mapping)))
+
+    results = [run(backend, vectors, args.threshold) for backend in backends]
+    for r in results:
+        print(json.dumps({k: v for k, v in r.items() if k not in ("decisions", "scores")}))
+
+    # Compare every backend with the first one
+    baseline = results[0]
+    for r in results[1:]:
+        agree = sum(1 for a, b in zip(baseline["decisions"], r["decisions"]) if a == b)
+        max_diff = max((abs(a - b) for a, b in zip(baseline["scores"], r["scores"]) if a is not None and b is not None), default=0)
+        print(f'{baseline["backend"]} vs {r["backend"]}: decision agreement {agree}/{len(vectors)}, max score difference {max_diff:.6f}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+'''
+Compare frame index vector encodings (OPENSEARCH_VECTOR_ENCODING) with the float32 mapping: recall, latency and memory.
+
+In process (numpy): a synthetic corpus of Titan-like frame vectors (unit length, grouped by video and shot) is
+encoded with each encoding and searched exhaustively. recall@k is measured against the exact float32 neighbours,
+so it isolates the encoding error, the HNSW graph adds its own on top. Memory is the k-NN native memory estimate
+of one vector field, with the formulas of the OpenSearch k-NN documentation.
+
+With --opensearch-host the same corpus is indexed into one index per encoding, with the mapping built by
+vector_encoding.get_index_mapping as the lambdas do, and searched with the k-NN query of extr-srv-search-vector:
+recall@k, query latency, k-NN graph memory and index store size. pq models are trained from the float32 index.
+
+Usage:
+  # 1M synthetic frames, in process only (needs numpy)
+  python frame_vector_encoding.py --frames 1000000
+
+  # Include OpenSearch (needs opensearch-py, network access, and the engine versions of vector_encoding.py)
+  python frame_vector_encoding.py --frames 1000000 --opensearch-host <domain-endpoint>
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lambda_layer/frame-vector/python"))
+import vector_encoding
+
+OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING = '''{"settings":{"index.knn":true,"number_of_shards":2},"mappings":{"properties":{"mm_embedding":{"type":"knn_vector","dimension":1024,"method":{"name":"hnsw","space_type":"l2","engine":"faiss"}},"text_embedding":{"type":"knn_vector","dimension":1024,"method":{"name":"hnsw","space_type":"l2","engine":"faiss"}},"timestamp":{"type":"double"},"task_id":{"type":"text","fields":{"keyword":{"type":"keyword","ignore_above":256}}}}}}'''
+ENCODINGS = ["float32", "fp16", "byte", "pq"]
+# HNSW m of the k-NN plugin (default)
+HNSW_M = 16
+
+def synthetic_video(video, frames, dimension, shot_length, seed):
+    # Frames of one video: a video direction, one offset per shot and per frame noise, unit length like Titan vectors
+    rnd = np.random.default_rng([seed, video])
+    center = rnd.standard_normal(dimension, dtype=np.float32)
+    shots = rnd.standard_normal(((frames + shot_length - 1) // shot_length, dimension), dtype=np.float32)
+    vectors = center + 0.8 * np.repeat(shots, shot_length, axis=0)[:frames] + 0.3 * rnd.standard_normal((frames, dimension), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def corpus(args):
+    # Yields (first frame id, vectors) per chunk of videos, the same corpus on every pass
+    videos = (args.frames + args.frames_per_video - 1) // args.frames_per_video
+    for first_video in range(0, videos, args.chunk_videos):
+        chunk = []
+        for video in range(first_video, min(videos, first_video + args.chunk_videos)):
+            count = min(args.frames_per_video, args.frames - video * args.frames_per_video)
+            chunk.append(synthetic_video(video, count, args.dimension, args.shot_length, args.seed))
+        yield first_video * args.frames_per_video, np.concatenate(chunk)
+
+def synthetic_queries(args):
+    # Near duplicates of random frames, like searching with a frame of an indexed video
+    rnd = np.random.default_rng(args.seed)
+    ids = np.sort(rnd.choice(args.frames, args.queries, replace=False))
+    queries = []
+    for video in np.unique(ids // args.frames_per_video):
+        count = min(args.frames_per_video, args.frames - video * args.frames_per_video)
+        vectors = synthetic_video(video, count, args.dimension, args.shot_length, args.seed)
+        queries.extend(vectors[i % args.frames_per_video] for i in ids if i // args.frames_per_video == video)
+    queries = np.array(queries) + 0.3 * rnd.standard_normal((len(ids), args.dimension), dtype=np.float32) / np.sqrt(args.dimension)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+def byte_encode(vectors, scale):
+    # Same as vector_encoding.encode_vector on a matrix (round half to even in both)
+    return np.clip(np.rint(vectors * scale), -128, 127).astype(np.float32)
+
+def pq_train(vectors, m, iterations, seed):
+    # k-means codebook of 2^8 centroids per sub-vector, as trained by the k-NN plugin for code_size 8
+    n, dimension = vectors.shape
+    sub = vectors.reshape(n, m, dimension // m).transpose(1, 0, 2)
+    rnd = np.random.default_rng(seed)
+    codebooks = []
+    for s in range(m):
+        x = sub[s]
+        centroids = x[rnd.choice(n, 256, replace=False)].copy()
+        for _ in range(iterations):
+            assign = nearest(x, centroids)
+            counts = np.bincount(assign, minlength=256)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, x)
+            # Empty clusters keep their centroid
+            centroids[counts > 0] = sums[counts > 0] / counts[counts > 0, None]
+        codebooks.append(centroids)
+    return np.array(codebooks)
+
+def pq_reconstruct(vectors, codebooks, batch=2000):
+    # Vectors as seen by the PQ index: every sub-vector replaced by its nearest centroid
+    m = codebooks.shape[0]
+    result = np.empty_like(vectors)
+    for start in range(0, len(vectors), batch):
+        x = vectors[start:start + batch]
+        sub = x.reshape(len(x), m, -1).transpose(1, 0, 2)
+        distances = (sub ** 2).sum(axis=2)[:, :, None] - 2 * np.matmul(sub, codebooks.transpose(0, 2, 1)) + (codebooks ** 2).sum(axis=2)[:, None, :]
+        codes = distances.argmin(axis=2)
+        result[start:start + batch] = codebooks[np.arange(m)[:, None], codes].transpose(1, 0, 2).reshape(len(x), -1)
+    return result
+
+def nearest(x, centroids):
+    return ((x ** 2).sum(axis=1)[:, None] - 2 * x @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]).argmin(axis=1)
+
+def encode(vectors, encoding, args, codebooks=None):
+    if encoding == "fp16":
+        return vectors.astype(np.float16).astype(np.float32)
+    elif encoding == "byte":
+        return byte_encode(vectors, args.byte_scale)
+    elif encoding == "pq":
+        return pq_reconstruct(vectors, codebooks)
+    return vectors
+
+def merge_top_k(top_ids, top_distances, first_id, distances, k):
+    # Running top k (smallest squared L2) per query
+    ids = np.concatenate([top_ids, np.broadcast_to(np.arange(first_id, first_id + distances.shape[1]), distances.shape)], axis=1)
+    distances = np.concatenate([top_distances, distances], axis=1)
+    keep = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(ids, keep, axis=1), np.take_along_axis(distances, keep, axis=1)
+
+def native_memory(encoding, frames, dimension, pq_m):
+    # k-NN native memory estimate of one HNSW vector field (bytes)
+    if encoding == "fp16":
+        return 1.1 * (2 * dimension + 8 * HNSW_M) * frames
+    elif encoding == "byte":
+        # lucene engine: not native memory, the vectors and graph are read through the page cache
+        return 1.1 * (dimension + 8 * HNSW_M) * frames
+    elif encoding == "pq":
+        return 1.1 * ((vector_encoding.PQ_CODE_SIZE / 8) * pq_m + 24 + 8 * HNSW_M) * frames + 256 * 4 * dimension
+    return 1.1 * (4 * dimension + 8 * HNSW_M) * frames
+
+def source_bytes(vectors, encoding, args):
+    # JSON of one vector in _source, saved per vector field when OPENSEARCH_VECTOR_SOURCE_EXCLUDES is on
+    sample = vectors[:100]
+    if encoding == "byte":
+        return np.mean([len(json.dumps(byte_encode(v, args.byte_scale).astype(int).tolist())) for v in sample])
+    return np.mean([len(json.dumps(v.tolist())) for v in sample])
+
+def run_in_process(args, encodings, queries):
+    codebooks = None
+    if "pq" in encodings:
+        start = time.perf_counter()
+        # Training sample: the first chunks of the corpus
+        sample = []
+        for _, vectors in corpus(args):
+            sample.append(vectors)
+            if sum(len(v) for v in sample) >= args.pq_train:
+                break
+        sample = np.concatenate(sample)
+        codebooks = pq_train(sample[:args.pq_train], args.pq_m, args.pq_iterations, args.seed)
+        print(f"pq codebooks trained on {min(len(sample), args.pq_train)} vectors in {time.perf_counter() - start:.1f}s")
+
+    k = args.k
+    top = {e: (np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)) for e in ["exact"] + encodings}
+    scan_s = {e: 0.0 for e in encodings}
+    clipped, values, json_bytes = 0, 0, {}
+    encoded_queries = {e: byte_encode(queries, args.byte_scale) if e == "byte" else queries for e in encodings}
+    for first_id, vectors in corpus(args):
+        top["exact"] = merge_top_k(*top["exact"], first_id, squared_l2(queries, vectors), k)
+        for encoding in encodings:
+            encoded = encode(vectors, encoding, args, codebooks)
+            t = time.perf_counter()
+            top[encoding] = merge_top_k(*top[encoding], first_id, squared_l2(encoded_queries[encoding], encoded), k)
+            scan_s[encoding] += time.perf_counter() - t
+        clipped += int((np.abs(np.rint(vectors * args.byte_scale)) > 127).sum())
+        values += vectors.size
+        if not json_bytes:
+            json_bytes = {e: source_bytes(vectors, e, args) for e in encodings}
+
+    results = []
+    for encoding in encodings:
+        results.append({
+            "encoding": encoding,
+            "frames": args.frames,
+            f"recall@{k}": round(recall(top["exact"][0], top[encoding][0]), 4),
+            "scan_ms_per_query": round(scan_s[encoding] * 1000 / len(queries), 3),
+            "native_memory_mb": round(native_memory(encoding, args.frames, args.dimension, args.pq_m) / 1024 / 1024, 1),
+            "source_vector_bytes": int(json_bytes[encoding]),
+        })
+        if encoding == "byte":
+            results[-1]["clipped_values"] = f"{clipped / values:.6%}"
+    return results, top["exact"][0]
+
+def squared_l2(queries, vectors):
+    return (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)[None, :]
+
+def recall(exact_ids, ids):
+    return np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(exact_ids, ids)])
+
+def run_opensearch(args, encodings, queries, exact_ids):
+    from opensearchpy import OpenSearch, helpers
+    client = OpenSearch(
+        hosts=[{'host': args.opensearch_host, 'port': args.opensearch_port}],
+        http_compress=True,
+        use_ssl=True,
+        verify_certs=True,
+        ssl_assert_hostname=False,
+        ssl_show_warn=False,
+        timeout=300,
+    )
+    vector_encoding.OPENSEARCH_VECTOR_BYTE_SCALE = args.byte_scale
+    vector_encoding.OPENSEARCH_VECTOR_PQ_M = args.pq_m
+
+    # One vector field, the corpus has one vector per frame
+    mapping = json.loads(OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING)
+    del mapping["mappings"]["properties"]["text_embedding"]
+    mapping["mappings"]["properties"]["mm_embedding"]["dimension"] = args.dimension
+    mapping = json.dumps(mapping)
+
+    suffix = int(time.time())
+    model_prefix = f"video_frame_benchmark_{suffix}_"
+    indices, results = {}, []
+    # float32 first, it is the pq training index
+    for encoding in ["float32"] + [e for e in encodings if e != "float32"]:
+        index = f"video_frame_benchmark_{encoding}_{suffix}"
+        training_index = indices.get("float32")
+        body = vector_encoding.get_index_mapping(mapping, encoding=encoding, source_excludes=args.source_excludes,
+                                                 client=client, training_index=training_index, model_prefix=model_prefix)
+        if encoding == "pq":
+            body = wait_pq_model(client, mapping, training_index, model_prefix, args)
+            if body is None:
+                continue
+        client.indices.create(index=index, body=body)
+        client.indices.put_settings(index=index, body={"index": {"refresh_interval": "-1"}})
+        indices[encoding] = index
+
+        start = time.perf_counter()
+        for first_id, vectors in corpus(args):
+            indexed = byte_encode(vectors, args.byte_scale).astype(int) if encoding == "byte" else vectors
+            helpers.bulk(client, ({"_index": index, "_id": str(first_id + i), "_source": {
+                        "mm_embedding": v.tolist(),
+                        "task_id": f"benchmark_{(first_id + i) // args.frames_per_video}",
+                        "timestamp": float((first_id + i) % args.frames_per_video)
+                    }} for i, v in enumerate(indexed)), chunk_size=500, max_chunk_bytes=10 * 1024 * 1024)
+        client.indices.put_settings(index=index, body={"index": {"refresh_interval": "1s"}})
+        client.indices.refresh(index=index)
+        ingest_s = time.perf_counter() - start
+
+        if encoding in encodings:
+            results.append(search_index(client, index, encoding, queries, exact_ids, ingest_s, args))
+
+    if not args.keep:
+        for index in indices.values():
+            client.indices.delete(index=index)
+        if "pq" in indices:
+            client.transport.perform_request("DELETE", f"/_plugins/_knn/models/{vector_encoding.pq_model_id('mm_embedding', model_prefix)}")
+    return results
+
+def wait_pq_model(client, mapping, training_index, model_prefix, args):
+    model_id = vector_encoding.pq_model_id("mm_embedding", model_prefix)
+    deadline = time.time() + args.pq_train_timeout
+    while time.time() < deadline:
+        state = vector_encoding.get_model_state(client, model_id)
+        if state == "created":
+            return vector_encoding.get_index_mapping(mapping, encoding="pq", source_excludes=args.source_excludes, client=client, model_prefix=model_prefix)
+        if state == "failed":
+            break
+        time.sleep(10)
+    print(f"PQ model {model_id} not created, pq skipped")
+    return None
+
+def search_index(client, index, encoding, queries, exact_ids, ingest_s, args):
+    # Warm up the k-NN graphs, then the k-NN query of extr-srv-search-vector
+    client.transport.perform_request("GET", f"/_plugins/_knn/warmup/{index}")
+    latencies, took, ids = [], [], []
+    for q in queries:
+        vector = byte_encode(q, args.byte_scale).astype(int).tolist() if encoding == "byte" else q.tolist()
+        t = time.perf_counter()
+        response = client.search(index=index, body={
+            "_source": ["task_id", "timestamp"],
+            "size": args.k,
+            "query": {"knn": {"mm_embedding": {"vector": vector, "k": args.k}}}
+        })
+        latencies.append(time.perf_counter() - t)
+        took.append(response["took"])
+        ids.append([int(hit["_id"]) for hit in response["hits"]["hits"]])
+    latencies.sort()
+
+    stats = client.indices.stats(index=index, metric="store")
+    knn_stats = client.transport.perform_request("GET", "/_plugins/_knn/stats")
+    graph_kb = sum(node.get("indices_in_cache", {}).get(index, {}).get("graph_memory_usage", 0) for node in knn_stats["nodes"].values())
+    return {
+        "encoding": encoding,
+        "index": index,
+        f"recall@{args.k}": round(np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(exact_ids, ids)]), 4),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "took_p50_ms": sorted(took)[len(took) // 2],
+        "graph_memory_mb": round(graph_kb / 1024, 1),
+        "store_mb": round(stats["indices"][index]["primaries"]["store"]["size_in_bytes"] / 1024 / 1024, 1),
+        "ingest_s": round(ingest_s, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=1000000)
+    parser.add_argument("--frames-per-video", type=int, default=200)
+    parser.add_argument("--shot-length", type=int, default=50)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--chunk-videos", type=int, default=50, help="Videos generated and scanned at a time")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20, help="OPENSEARCH_DEFAULT_K")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--encodings", default=",".join(ENCODINGS))
+    parser.add_argument("--byte-scale", type=float, default=512, help="OPENSEARCH_VECTOR_BYTE_SCALE")
+    parser.add_argument("--pq-m", type=int, default=128, help="OPENSEARCH_VECTOR_PQ_M")
+    parser.add_argument("--pq-train", type=int, default=20000, help="Vectors the in process pq codebooks are trained on")
+    parser.add_argument("--pq-iterations", type=int, default=15)
+    parser.add_argument("--pq-train-timeout", type=int, default=1800, help="Seconds to wait for the OpenSearch pq model")
+    parser.add_argument("--source-excludes", type=lambda v: v.lower() == "true", default=True, help="OPENSEARCH_VECTOR_SOURCE_EXCLUDES")
+    parser.add_argument("--opensearch-host", help="OpenSearch domain endpoint, enables the OpenSearch run")
+    parser.add_argument("--opensearch-port", type=int, default=443)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark indices and pq model")
+    args = parser.parse_args()
+
+    encodings = args.encodings.split(",")
+    if args.dimension % args.pq_m != 0:
+        parser.error("--pq-m must divide --dimension")
+    queries = synthetic_queries(args)
+
+    start = time.perf_counter()
+    results, exact_ids = run_in_process(args, encodings, queries)
+    print(f"In process, exhaustive search ({time.perf_counter() - start:.1f}s)")
+    for r in results:
+        print(json.dumps(r))
+
+    if args.opensearch_host:
+        print("OpenSearch, HNSW")
+        for r in run_opensearch(args, encodings, queries, exact_ids):
+            print(json.dumps(r))
+
+if __name__ == "__main__":
+    main()
@@ -15,10 +15,11 @@ def lambda_handler(event, context):
             "Error": "Invalid Request"
         }
 
-    # Get video task from DB
-    task = utils.dynamodb_get_by_id(table_name=DYNAMO_VIDEO_TASK_TABLE, id=task_id, key_name="Id")
-    task["Status"] = "extraction_completed"
-    task["ExtractionCompleteTs"] = datetime.now(timezone.utc).isoformat()
+    # Fields updated on the task
+    task = {
+        "Status": "extraction_completed",
+        "ExtractionCompleteTs": datetime.now(timezone.utc).isoformat()
+    }
 
     agg_result = event["Request"]["ExtractionSetting"].get("AggregateResult", True)
     if agg_result:
@@ -64,7 +65,7 @@ def lambda_handler(event, context):
         task["AggResult"] = agg_result
         
     # Save aggregated results to DB
-    utils.dynamodb_table_upsert(DYNAMO_VIDEO_TASK_TABLE, task)
+    utils.dynamodb_task_update(DYNAMO_VIDEO_TASK_TABLE, task_id, set_values=task)
 
     return {
         'statusCode': 200,
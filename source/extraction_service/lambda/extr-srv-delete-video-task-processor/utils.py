@@ -1,8 +1,15 @@
 import boto3
 import numbers,decimal
+import time, random
 from boto3.dynamodb.types import TypeDeserializer
 from boto3.dynamodb.conditions import Key
 
+DYNAMO_BATCH_WRITE_SIZE = 25 # BatchWriteItem limit
+
+class UnprocessedItemsError(Exception):
+    # Items still unprocessed once the batch write retries are used up
+    pass
+
 dynamodb = boto3.resource('dynamodb')
 
 def dynamodb_table_upsert(table_name, document):
@@ -28,6 +35,37 @@ def dynamodb_get_by_id(table_name, id, key_name="Id"):
         return None
     return None
 
+def dynamodb_batch_delete(table_name, keys, max_retries=8, base_delay_s=0.05):
+    """
+    Delete items in BatchWriteItem requests of up to 25 keys.
+    Unprocessed items are retried with exponential backoff, UnprocessedItemsError is raised for items left after max_retries.
+    """
+    requests = [{"DeleteRequest": {"Key": k}} for k in keys]
+    return dynamodb_batch_write_requests(table_name, requests, max_retries, base_delay_s)
+
+def dynamodb_batch_write_requests(table_name, requests, max_retries=8, base_delay_s=0.05):
+    # Same request shape as Table.batch_writer, plus backoff between unprocessed item retries
+    client = dynamodb.meta.client
+    unprocessed_total = 0
+    for i in range(0, len(requests), DYNAMO_BATCH_WRITE_SIZE):
+        pending = requests[i:i + DYNAMO_BATCH_WRITE_SIZE]
+        retries = 0
+        while pending:
+            response = client.batch_write_item(RequestItems={table_name: pending})
+            pending = response.get("UnprocessedItems", {}).get(table_name, [])
+            if not pending:
+                break
+            if retries >= max_retries:
+                print(f"dynamodb_batch_write_requests: {len(pending)} unprocessed items left in {table_name}")
+                unprocessed_total += len(pending)
+                break
+            time.sleep(min(base_delay_s * (2 ** retries), 5) * (0.5 + random.random() / 2))
+            retries += 1
+    if unprocessed_total > 0:
+        # Raised after all chunks are sent, the state machine retries the invocation (writes are idempotent)
+        raise UnprocessedItemsError(f"{unprocessed_total} of {len(requests)} items not written to {table_name}")
+    return unprocessed_total
+
 def dynamodb_delete_frames_by_taskid(table_name, task_id):
     #try:
         table = dynamodb.Table(table_name)
@@ -39,9 +77,9 @@ def dynamodb_delete_frames_by_taskid(table_name, task_id):
             # Query for items with the given task_id
             if pagination_token:
                 response = table.query(
-                    IndexName=table_name,
+                    IndexName='task_id-timestamp-index',  # Specify the secondary index name
                     KeyConditionExpression=Key('task_id').eq(task_id),  # Use the task_id to query the index
-                    ExclusiveStartKey=last_evaluated_key,
+                    ExclusiveStartKey=pagination_token,
                     Limit=1000
                 )
             else:
@@ -51,14 +89,8 @@ def dynamodb_delete_frames_by_taskid(table_name, task_id):
                     Limit=1000
                 )
 
-            # Delete each item returned by the query
-            for item in response['Items']:
-                table.delete_item(
-                    Key={
-                        'id': item['id'],  # Replace with your partition key name
-                        'task_id': item['task_id']  # Replace with your sort key name
-                    }
-                )
+            # Delete the items returned by the query in batches
+            dynamodb_batch_delete(table_name, [{'id': item['id'], 'task_id': item['task_id']} for item in response['Items']])
 
             # Check if there are more items to fetch
             if 'LastEvaluatedKey' in response:
@@ -79,9 +111,9 @@ def dynamodb_delete_analysis_by_taskid(table_name, task_id):
             # Query for items with the given task_id
             if pagination_token:
                 response = table.query(
-                    IndexName=table_name,
+                    IndexName='task_id-analysis_type-index',  # Specify the secondary index name
                     KeyConditionExpression=Key('task_id').eq(task_id),  # Use the task_id to query the index
-                    ExclusiveStartKey=last_evaluated_key,
+                    ExclusiveStartKey=pagination_token,
                     Limit=1000
                 )
             else:
@@ -91,14 +123,8 @@ def dynamodb_delete_analysis_by_taskid(table_name, task_id):
                     Limit=1000
                 )
 
-            # Delete each item returned by the query
-            for item in response['Items']:
-                table.delete_item(
-                    Key={
-                        'id': item['id'],  # Replace with your partition key name
-                        'task_id': item['task_id']  # Replace with your sort key name
-                    }
-                )
+            # Delete the items returned by the query in batches
+            dynamodb_batch_delete(table_name, [{'id': item['id'], 'task_id': item['task_id']} for item in response['Items']])
 
             # Check if there are more items to fetch
             if 'LastEvaluatedKey' in response:
@@ -37,8 +37,7 @@ def lambda_handler(event, context):
     }))
 
     # Update task status
-    task["Status"] = "deleting"
-    utils.dynamodb_table_upsert(DYNAMO_VIDEO_TASK_TABLE, task)
+    utils.dynamodb_task_update_status(DYNAMO_VIDEO_TASK_TABLE, task_id, "deleting")
 
     return {
         'statusCode': 200,
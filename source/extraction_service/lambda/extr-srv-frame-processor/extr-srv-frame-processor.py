@@ -0,0 +1,94 @@
+'''
+Fused frame processor: extraction, embedding and vector save of a batch of frames in one invocation
+1. Read the frame record (subtitles, similarity score) and the frame image once
+2. Extract metadata (Rekognition, caption), the extracted attributes are written to video_frame
+3. Embed the in-memory frame, reusing the image bytes for the multimodal embedding
+4. Index the batch into OpenSearch in one bulk request, update the task status once
+Stage code is shared with extr-srv-image-extraction, extr-srv-image-embedding and extr-srv-image-vector-save
+(frame_extraction.py, frame_embedding.py, frame_vector_save.py), used when VIDEO_FRAME_PROCESSOR_MODE is "split"
+'''
+import json
+import boto3
+import os
+import time
+import utils
+import detector_cache
+import frame_extraction
+import frame_embedding
+import frame_vector_save
+from concurrent.futures import ThreadPoolExecutor
+
+DYNAMO_VIDEO_TASK_TABLE = os.environ.get("DYNAMO_VIDEO_TASK_TABLE")
+DYNAMO_VIDEO_FRAME_TABLE = os.environ.get("DYNAMO_VIDEO_FRAME_TABLE")
+
+# Number of frames of a batch processed at the same time
+VIDEO_IMAGE_BATCH_CONCURRENCY = max(1, int(os.environ.get("VIDEO_IMAGE_BATCH_CONCURRENCY", 4)))
+
+s3 = boto3.client('s3')
+
+def lambda_handler(event, context):
+    # Batch input: {"BatchInput": {"Request", "MetaData"}, "Items": [{"Key", "frame"}, ...]}, or a single frame {"Request", "MetaData", "Key"}
+    if event is None:
+        return {
+            "Error": "Invalid Request"
+        }
+    if "Items" in event:
+        batch_input = event.get("BatchInput", {})
+        items = [dict(batch_input, **item) for item in event["Items"]]
+    else:
+        batch_input = event
+        items = [event]
+    task_id = batch_input.get("Request", {}).get("TaskId")
+    if len(items) == 0:
+        return {"Saved": 0}
+
+    detector_cache.reset_counters()
+    start = time.perf_counter()
+
+    archive = frame_extraction.create_raw_archive(items[0])
+    with ThreadPoolExecutor(max_workers=min(len(items), VIDEO_IMAGE_BATCH_CONCURRENCY)) as executor:
+        results = list(executor.map(lambda item: process_frame(item, archive), items))
+    frame_extraction.flush_raw_archive(archive)
+
+    frame_docs = [r for r in results if r]
+    saved = frame_vector_save.save_documents(frame_docs)
+
+    # Update database once for the batch
+    if len(frame_docs) > 0:
+        utils.dynamodb_task_update_status(DYNAMO_VIDEO_TASK_TABLE, task_id, "embedding_generated")
+    frame_extraction.report_detector_cache(task_id)
+
+    print(json.dumps({"task_id": task_id, "frames": len(items), "saved": saved, "total_ms": round((time.perf_counter() - start) * 1000, 1)}))
+    return {"Saved": saved}
+
+def process_frame(event, archive=None):
+    # Returns the OpenSearch document (task_id, frame_id, frame), None if the frame is skipped
+    if "Request" not in event or "Key" not in event:
+        return None
+    task_id = event["Request"].get("TaskId")
+    s3_bucket = event["MetaData"]["VideoFrameS3"]["S3Bucket"]
+    s3_key = event["Key"]
+
+    # Image bytes shared by the detector cache, the caption and the multimodal embedding
+    image_bytes = None
+    try:
+        image_bytes = s3.get_object(Bucket=s3_bucket, Key=s3_key)["Body"].read()
+    except Exception as ex:
+        print(f"Failed to read frame {s3_key}: {ex}")
+
+    extracted = frame_extraction.extract_frame(event, image_bytes=image_bytes, archive=archive)
+    if "Error" in extracted:
+        return None
+
+    # Frame record of the Map item (frame manifest) plus the attributes just extracted.
+    # Items without record in the manifest read the sampler and subtitle attributes from DB
+    frame = extracted["frame"]
+    if "prev_timestamp" not in frame:
+        stored = utils.dynamodb_get_by_id(DYNAMO_VIDEO_FRAME_TABLE, frame["id"], key_name="id", sort_key="task_id", sort_key_value=task_id)
+        frame = dict(stored or {}, **frame)
+
+    embedded = frame_embedding.embed_frame(event, update_status=False, image_bytes=image_bytes, frame=frame)
+    if "Error" in embedded:
+        return None
+
+    return frame_vector_save.get_frame_document(embedded) or None
@@ -0,0 +1,126 @@
+'''
+Frame embedding, shared by extr-srv-image-embedding and extr-srv-frame-processor
+Get frame metadata from DB
+Construct vector text input using frame level data
+Generate text embedding
+Generate mm embedding
+'''
+import json
+import boto3
+import os
+import utils
+import embedding_client
+import base64
+from io import BytesIO
+import re
+import time
+
+DYNAMO_VIDEO_FRAME_TABLE = os.environ.get("DYNAMO_VIDEO_FRAME_TABLE")
+DYNAMO_VIDEO_TASK_TABLE = os.environ.get("DYNAMO_VIDEO_TASK_TABLE")
+
+s3 = boto3.client('s3')
+
+def embed_frame(event, update_status=True, image_bytes=None, frame=None):
+    # frame: frame record already in memory (fused processor), skips the DB read
+    if event is None or "Error" in event or "Request" not in event or "Key" not in event:
+        return {
+            "Error": "Invalid Request"
+        }
+
+    task_id = event["Request"].get("TaskId")
+    setting = event["Request"].get("ExtractionSetting")
+    s3_bucket = event["MetaData"]["VideoFrameS3"]["S3Bucket"]
+    s3_prefix = event["MetaData"]["VideoFrameS3"]["S3Prefix"]
+    s3_key = event.get("Key")
+    file_name = event["Request"].get("FileName", "")
+
+    if task_id is None or setting is None or s3_bucket is None or s3_key is None or not s3_key.endswith('.jpg'):
+        return {
+            "Error": "Invalid Request"
+        }
+
+    enable_text_embedding, enable_mm_embedding = True, True
+    if "EmbeddingSetting" in event["Request"]:
+        enable_text_embedding = event["Request"]["EmbeddingSetting"]["Text"]
+        enable_mm_embedding = event["Request"]["EmbeddingSetting"]["MultiModal"]
+
+    if not enable_mm_embedding and not enable_text_embedding:
+        return event
+        
+    frame_file_name = s3_key.split('/')[-1].replace('.jpg','')
+    ts = float(frame_file_name.split("_")[-1])
+    input_text = f"Video file name: {file_name};"
+
+    # Frame record of the Map item, extended by the extraction step. Items without record in the
+    # frame manifest (no sampler fields) read it from DB
+    if frame is None and "prev_timestamp" in (event.get("frame") or {}):
+        frame = event["frame"]
+    if frame is None:
+        frame = utils.dynamodb_get_by_id(table_name=DYNAMO_VIDEO_FRAME_TABLE, id=f'{task_id}_{ts}', key_name="id", sort_key="task_id", sort_key_value=task_id)
+    embedding_frame = {
+        "id": frame["id"],
+        "task_id": task_id,
+    }
+    if frame:
+        # Construct vector text input
+        if "image_caption" in frame and frame["image_caption"] and len(frame["image_caption"]) > 0:
+            input_text += f"Summary: {frame['image_caption']}" + ";"
+        if "subtitles" in frame and frame["subtitles"] and len(frame["subtitles"]) > 0:
+            transcription = ""
+            for s in frame["subtitles"]:
+                transcription += s["transcription"]
+            input_text += f"Transcription: {transcription}" + ";"
+        if "detect_label" in frame and frame["detect_label"] and len(frame["detect_label"]) > 0:
+            input_text += f"Label: {get_rekognition_label_name(frame['detect_label'])}" + ";"
+        if "detect_text" in frame and frame["detect_text"] and len(frame["detect_text"]) > 0:
+            input_text += f"Text: {get_rekognition_label_name(frame['detect_text'])}" + ";"
+        if "detect_celebrity" in frame and frame["detect_celebrity"] and len(frame["detect_celebrity"]) > 0:
+            input_text += f"Celebrity: {get_rekognition_label_name(frame['detect_celebrity'])}" + ";"
+        if "detect_moderation" in frame and frame["detect_moderation"] and len(frame["detect_moderation"]) > 0:
+            input_text += f"Moderation: {get_rekognition_label_name(frame['detect_moderation'])}" + ";"
+    
+        # Generate vectors: Multimodal and Text Embedding, in one batch request
+        inputs = {}
+        if enable_mm_embedding:
+            inputs["mm_embedding"] = get_multimodal_input(s3_bucket, s3_key, input_text, image_bytes=image_bytes)
+        if enable_text_embedding:
+            inputs["text_embedding"] = {"embedding_type": "txt", "text_input": input_text}
+        vectors = get_vectors(list(inputs.values()))
+        for name, vector in zip(inputs, vectors):
+            embedding_frame[name] = vector
+        if enable_text_embedding:
+            embedding_frame["embedding_text"] = input_text
+    
+    # Update database
+    if update_status:
+        utils.dynamodb_task_update_status(DYNAMO_VIDEO_TASK_TABLE, task_id, "embedding_generated")
+    
+    event["frame"] = embedding_frame
+    return event
+
+def get_rekognition_label_name(items):
+    result = []
+    if items:
+        for i in items:
+            result.append(i["name"])
+    return ','.join(result)
+    
+def get_multimodal_input(s3_bucket, s3_key, input_text=None, image_bytes=None):
+    # Get image base64, reuse the bytes when the caller already read the frame
+    image_content = image_bytes
+    if image_content is None:
+        response = s3.get_object(Bucket=s3_bucket, Key=s3_key)
+        image_content = response['Body'].read()
+    base64_encoded_image = base64.b64encode(image_content).decode('utf-8')
+
+    request_body = {"embedding_type": "mm"}
+    if input_text is not None and len(input_text) > 0:
+        request_body["text_input"] = input_text
+        
+    if base64_encoded_image:
+        request_body["image_input"] = base64_encoded_image
+    return request_body
+
+def get_vectors(inputs):
+    # Embedding client layer: Bedrock in process, or the embedding lambda (EMBEDDING_TRANSPORT)
+    return embedding_client.get_vectors(inputs)
@@ -0,0 +1,352 @@
+'''
+Frame extraction, shared by extr-srv-image-extraction and extr-srv-frame-processor
+Call Rekognition APIs to retrieve lable, text, moderation and celebrity
+Call Bedrock to retrieve image summary 
+Sync frame to DB
+'''
+import json
+import boto3
+import os
+import utils
+import rate_limiter
+import raw_archive
+import detector_cache
+import base64
+from io import BytesIO
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from botocore.config import Config
+
+REK_MIN_CONF_DETECT_LABEL = float(os.environ.get("REK_MIN_CONF_DETECT_LABEL"))
+REK_MIN_CONF_DETECT_MODERATION = float(os.environ.get("REK_MIN_CONF_DETECT_MODERATION"))
+REK_MIN_CONF_DETECT_TEXT = float(os.environ.get("REK_MIN_CONF_DETECT_TEXT"))
+REK_MIN_CONF_DETECT_CELEBRITY = float(os.environ.get("REK_MIN_CONF_DETECT_CELEBRITY"))
+REKOGNITION_REGION = os.environ.get("REKOGNITION_REGION", os.environ['AWS_REGION'])
+BEDROCK_REGION = os.environ.get("BEDROCK_REGION", os.environ['AWS_REGION'])
+BEDROCK_ANTHROPIC_CLAUDE_HAIKU = os.environ.get('BEDROCK_ANTHROPIC_CLAUDE_HAIKU')
+BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION = os.environ.get('BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION')
+
+DYNAMO_VIDEO_TASK_TABLE = os.environ.get("DYNAMO_VIDEO_TASK_TABLE")
+DYNAMO_VIDEO_FRAME_TABLE = os.environ.get("DYNAMO_VIDEO_FRAME_TABLE")
+
+# Account-wide calls per second, per Rekognition API and for the caption model
+REKOGNITION_RATE_LIMIT = float(os.environ.get("REKOGNITION_RATE_LIMIT", 50))
+BEDROCK_CAPTION_RATE_LIMIT = float(os.environ.get("BEDROCK_CAPTION_RATE_LIMIT", 10))
+
+# Raw detector output: object (one S3 object per detector per frame) | archive (one gzip JSONL per batch)
+RAW_OUTPUT_MODE = os.environ.get("RAW_OUTPUT_MODE", "object")
+
+# Part of the detector cache key: bump to invalidate cached Rekognition results after a model update
+REKOGNITION_MODEL_VERSION = os.environ.get("REKOGNITION_MODEL_VERSION", "1")
+
+# Throttling is retried by the rate limiter (AIMD), so botocore does not retry it on its own
+s3 = boto3.client('s3')
+rekognition = boto3.client('rekognition', region_name=REKOGNITION_REGION, config=Config(retries={"max_attempts": 1, "mode": "standard"}))
+bedrock = boto3.client('bedrock-runtime', region_name=BEDROCK_REGION, config=Config(retries={"max_attempts": 1, "mode": "standard"}))
+
+def report_detector_cache(task_id):
+    # Hits and misses of this invocation, added to the task counters
+    counters = detector_cache.get_counters()
+    if task_id is None or counters["hit"] + counters["miss"] == 0:
+        return
+    print(json.dumps({"task_id": task_id, "detector_cache": counters}))
+    utils.dynamodb_task_update(DYNAMO_VIDEO_TASK_TABLE, task_id, add_values={
+        "MetaData.DetectorCache.Hits": counters["hit"],
+        "MetaData.DetectorCache.Misses": counters["miss"],
+    })
+
+def extract_frame(event, write_db=True, image_bytes=None, archive=None):
+    # image_bytes: frame already in memory, shared with the caption call instead of reading S3 again
+    # archive: raw output buffer of the batch, flushed by the caller
+    if event is None or "Request" not in event or "Key" not in event:
+        return {
+            "Error": "Invalid Request"
+        }
+    task_id = event["Request"].get("TaskId")
+    setting = event["Request"].get("ExtractionSetting")
+    s3_bucket = event["MetaData"]["VideoFrameS3"]["S3Bucket"]
+    s3_prefix = event["MetaData"]["VideoFrameS3"]["S3Prefix"]
+    s3_key = event.get("Key")
+    file_name = event["Request"].get("FileName", "")
+    caption_prompts = event.get("Request",{}).get("ExtractionSetting",{}).get("ImageCaptionPromptTemplate")
+    if not caption_prompts:
+        caption_prompts = "Describe the image in detail limit in 100 tokens. Condition: If you are uncertain about the content or if the description violates any guardrail rules, return an empty result."
+
+    if task_id is None or setting is None or s3_bucket is None or s3_key is None or not s3_key.endswith('.jpg'):
+        return {
+            "Error": "Invalid Request"
+        }
+
+    frame_id = s3_key.split('/')[-1].replace('.jpg','')
+    ts = float(frame_id.split("_")[-1])
+
+    # The frame record comes with the Map item (frame manifest: sampler fields, similarity score, subtitles),
+    # otherwise it is derived from the key and MetaData. The sampler already wrote it: only the extracted
+    # attributes are written back, the other attributes stay untouched.
+    frame = dict(event.get("frame") or {}, **{
+        "id": f'{task_id}_{ts}',
+        "timestamp": ts,
+        "task_id": task_id,
+        "s3_bucket": s3_bucket,
+        "s3_key": s3_key,
+    })
+    extracted = {}
+
+    # Single frame request in archive mode: the frame is its own batch
+    own_archive = archive is None and RAW_OUTPUT_MODE == "archive"
+    if own_archive:
+        archive = create_raw_archive(event)
+
+    # Frame content hash for the detector cache, the bytes are reused by the caption call
+    image_sha = None
+    if detector_cache.is_enabled():
+        try:
+            if image_bytes is None:
+                image_bytes = s3.get_object(Bucket=s3_bucket, Key=s3_key)["Body"].read()
+            image_sha = detector_cache.image_hash(image_bytes)
+        except Exception as ex:
+            print(f"Failed to read frame for detector cache: {ex}")
+
+    # Independent calls: Rekognition detectors and Bedrock caption
+    # Subtitles are already on the frame, assigned by the frame subtitle stage after sampling
+    jobs = {}
+    detectors = {
+        "detect_label": (setting.get("DetectLabel"), rekognition_detect_label, setting.get("DetectLabelConfidenceThreshold"), REK_MIN_CONF_DETECT_LABEL),
+        "detect_text": (setting.get("DetectText"), rekognition_detect_text, setting.get("DetectTextConfidenceThreshold"), REK_MIN_CONF_DETECT_TEXT),
+        "detect_celebrity": (setting.get("DetectCelebrity"), rekognition_detect_celebrity, setting.get("DetectCelebrityConfidenceThreshold"), REK_MIN_CONF_DETECT_CELEBRITY),
+        "detect_moderation": (setting.get("DetectModeration"), rekognition_detect_moderation, setting.get("DetectModerationConfidenceThreshold"), REK_MIN_CONF_DETECT_MODERATION),
+    }
+    for name, (enabled, detector, threshold, default_threshold) in detectors.items():
+        if enabled == True:
+            cache_config = {"threshold": float(threshold) if threshold else default_threshold, "region": REKOGNITION_REGION, "version": REKOGNITION_MODEL_VERSION}
+            jobs[name] = partial(run_detector, name, detector, task_id, ts, s3_bucket, s3_key, threshold, archive, image_sha, cache_config)
+
+    # Image caption - Sonnet
+    if setting.get("ImageCaption") == True:
+        jobs["image_caption"] = partial(run_image_caption, task_id, ts, s3_bucket, s3_key, caption_prompts, image_bytes, archive, image_sha)
+
+    start = time.perf_counter()
+    timings = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as executor:
+        futures = {name: executor.submit(run_timed, job) for name, job in jobs.items()}
+    results = {}
+    for name, future in futures.items():
+        results[name], timings[name] = future.result()
+    print(json.dumps({"frame_id": frame["id"], "timings_ms": timings, "total_ms": round((time.perf_counter() - start) * 1000, 1)}))
+    if own_archive:
+        flush_raw_archive(archive)
+
+    for name in detectors:
+        if name in results:
+            extracted[name] = results[name]
+
+    if setting.get("DetectLogo") == True:
+        logos = None
+        extracted["detect_logo"] = logos
+
+    caption = results.get("image_caption")
+    if caption and len(caption) > 0:
+        extracted["image_caption"] = caption
+
+    # Update database: video_frame, extracted attributes only
+    if write_db:
+        utils.dynamodb_update_item(DYNAMO_VIDEO_FRAME_TABLE, {"id": frame["id"], "task_id": task_id}, set_values=extracted)
+    frame.update(extracted)
+
+    # include frame into event object
+    event["frame"] = frame
+
+    return event
+
+def run_timed(job):
+    # Returns (result, elapsed ms)
+    start = time.perf_counter()
+    result = job()
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
+def run_detector(name, detector, task_id, ts, s3_bucket, s3_key, threshold, archive=None, image_sha=None, cache_config=None):
+    (result, raw), cache_hit = detector_cache.get_or_compute(s3_bucket, name, cache_config, image_sha,
+                                    lambda: list(detector(s3_bucket, s3_key, threshold=threshold)))
+    # Store raw response to S3
+    if archive is not None:
+        archive.add(ts, name, raw)
+    else:
+        s3.put_object(Bucket=s3_bucket, Key=f'tasks/{task_id}/rekognition_{name}/{name}_{ts}.json', Body=json.dumps(raw))
+    return result
+
+def run_image_caption(task_id, ts, s3_bucket, s3_key, caption_prompts, image_bytes=None, archive=None, image_sha=None):
+    cache_config = {"model": BEDROCK_ANTHROPIC_CLAUDE_HAIKU, "version": BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION, "prompt": caption_prompts}
+    caption, cache_hit = detector_cache.get_or_compute(s3_bucket, "image_caption", cache_config, image_sha,
+                                    lambda: bedrock_image_caption(s3_bucket, s3_key, caption_prompts, image_bytes=image_bytes))
+    if caption and len(caption) > 0:
+        # Store to S3
+        if archive is not None:
+            archive.add(ts, "image_caption", caption)
+        else:
+            s3.put_object(Bucket=s3_bucket, Key=f'tasks/{task_id}/bedrock_image_caption/image_caption_{ts}.txt', Body=caption)
+    return caption
+
+def create_raw_archive(event):
+    if RAW_OUTPUT_MODE != "archive":
+        return None
+    return raw_archive.RawArchive(event["MetaData"]["VideoFrameS3"]["S3Bucket"], event["Request"].get("TaskId"))
+
+def flush_raw_archive(archive):
+    if archive is None:
+        return
+    try:
+        archive.flush(s3)
+    except Exception as ex:
+        print(f"Failed to write raw output archive: {ex}")
+
+def rekognition_limiter(api):
+    return rate_limiter.get_limiter(f"rekognition:{REKOGNITION_REGION}:{api}", REKOGNITION_RATE_LIMIT)
+
+def bedrock_limiter():
+    return rate_limiter.get_limiter(f"bedrock:{BEDROCK_REGION}:{BEDROCK_ANTHROPIC_CLAUDE_HAIKU}", BEDROCK_CAPTION_RATE_LIMIT)
+
+def rekognition_detect_label(s3_bucket, s3_key, threshold):
+    threshold = float(threshold) if threshold else REK_MIN_CONF_DETECT_LABEL
+    response = rekognition_limiter("detect_labels").call(rekognition.detect_labels,
+            Image={
+                "S3Object": {
+                    "Bucket": s3_bucket,
+                    "Name": s3_key
+                }
+            },
+            MinConfidence=threshold,
+            MaxLabels=10
+        )
+    labels = []
+    raw = response["Labels"]
+    for i in raw:
+        categories = []
+        for c in i["Categories"]:
+            cat = c["Name"]#.replace(' ','_')
+            if cat not in categories:
+                categories.append(cat)
+        labels.append({
+            "name": i["Name"],
+            "confidence": i["Confidence"],
+            "categories": categories
+        })
+    return labels, raw
+
+def rekognition_detect_text(s3_bucket, s3_key, threshold):
+    threshold = float(threshold) if threshold else REK_MIN_CONF_DETECT_TEXT
+    response = rekognition_limiter("detect_text").call(rekognition.detect_text,
+            Image={
+                "S3Object": {
+                    "Bucket": s3_bucket,
+                    "Name": s3_key
+                }
+            },
+            Filters={
+                "WordFilter": {
+                    "MinConfidence": threshold,
+                }
+            }
+        )
+    result = []
+    raw = response["TextDetections"]
+    for i in raw:
+        if i["Type"] == "LINE":
+            result.append({
+                "name": i["DetectedText"],
+                "confidence": i["Confidence"]
+            })
+    return result, raw
+
+def rekognition_detect_celebrity(s3_bucket, s3_key, threshold):
+    threshold = float(threshold) if threshold else REK_MIN_CONF_DETECT_CELEBRITY
+    response = rekognition_limiter("recognize_celebrities").call(rekognition.recognize_celebrities,
+            Image={
+                "S3Object": {
+                    "Bucket": s3_bucket,
+                    "Name": s3_key
+                }
+            }
+        )
+    result = []
+    raw = response["CelebrityFaces"]
+    for i in raw:
+        if i["MatchConfidence"] >= threshold:
+            result.append({
+                "name": i["Name"],
+                "confidence": i["MatchConfidence"]
+            })
+    return result, response
+
+def rekognition_detect_moderation(s3_bucket, s3_key, threshold):
+    threshold = float(threshold) if threshold else REK_MIN_CONF_DETECT_MODERATION
+    response = rekognition_limiter("detect_moderation_labels").call(rekognition.detect_moderation_labels,
+            Image={
+                "S3Object": {
+                    "Bucket": s3_bucket,
+                    "Name": s3_key
+                }
+            },
+            MinConfidence=threshold,
+        )
+    result = []
+    raw = response["ModerationLabels"]
+    for i in raw:
+        if len(i["ParentName"]) > 0:
+            result.append(
+                {
+                    "name": f'{i["ParentName"]}/{i["Name"]}',
+                    "confidence": i["Confidence"]
+                }
+            )
+    return result, raw
+
+def bedrock_image_caption(s3_bucket, s3_key, caption_prompts, image_bytes=None):
+    # Throttling and transient errors are retried by the rate limiter, other errors return no caption
+    try:
+        if image_bytes is None:
+            image_bytes = s3.get_object(Bucket=s3_bucket, Key=s3_key)["Body"].read()
+        body = get_image_caption_body(image_bytes, caption_prompts)
+
+        # Call Bedrock Anthropic Claude V3 Sonnet
+        response = bedrock_limiter().call(bedrock.invoke_model,
+            body=body, 
+            modelId=BEDROCK_ANTHROPIC_CLAUDE_HAIKU, 
+            accept="application/json", 
+            contentType="application/json",
+        )
+        
+        return json.loads(response.get('body').read())["content"][0]["text"]
+
+    except Exception as ex:
+        print(ex)
+
+    return None
+
+def get_image_caption_body(image_bytes, caption_prompts):
+    return json.dumps(
+        {
+            "anthropic_version": BEDROCK_ANTHROPIC_CLAUDE_HAIKU_MODEL_VERSION,
+            "max_tokens": 1000,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/jpeg",
+                                "data": base64.b64encode(image_bytes).decode('utf-8')
+                            }
+                        },
+                        {
+                            "type": "text",
+                            "text": caption_prompts
+                        }
+                    ]
+                }
+            ]
+        })
+
@@ -0,0 +1,59 @@
+'''
+Raw detector output archive
+1. Raw Rekognition responses and image captions of a batch of frames are buffered in memory
+2. Written as one gzip JSONL object per batch: every line is its own gzip member, so the file
+   is a valid .jsonl.gz and a single record can be read back with a ranged GET
+3. A small JSON index next to the archive maps (timestamp, type) to the byte range
+'''
+import gzip
+import json
+import threading
+
+RAW_ARCHIVE_S3_PREFIX = "raw_archive"
+
+class RawArchive:
+    def __init__(self, s3_bucket, task_id):
+        self.s3_bucket = s3_bucket
+        self.task_id = task_id
+        self.records = []
+        self.lock = threading.Lock()
+
+    def add(self, ts, name, data):
+        # data: raw detector response (JSON) or caption text
+        with self.lock:
+            self.records.append((float(ts), name, data))
+
+    def __len__(self):
+        return len(self.records)
+
+    def flush(self, s3):
+        '''
+        Write the buffered records, returns the archive key (None when there is nothing to write)
+        '''
+        with self.lock:
+            records, self.records = sorted(self.records, key=lambda r: (r[0], r[1])), []
+        if len(records) == 0:
+            return None
+
+        body, index = bytearray(), []
+        for ts, name, data in records:
+            line = json.dumps({"timestamp": ts, "type": name, "data": data}, separators=(",", ":")).encode("utf-8") + b"\n"
+            member = gzip.compress(line)
+            index.append({"timestamp": ts, "type": name, "offset": len(body), "length": len(member)})
+            body += member
+
+        key = archive_key(self.task_id, records[0][0], records[-1][0])
+        s3.put_object(Bucket=self.s3_bucket, Key=key, Body=bytes(body), ContentType="application/gzip")
+        s3.put_object(Bucket=self.s3_bucket, Key=index_key(key), Body=json.dumps({"archive": key, "records": index}), ContentType="application/json")
+        return key
+
+def archive_key(task_id, first_ts, last_ts):
+    return f"tasks/{task_id}/{RAW_ARCHIVE_S3_PREFIX}/raw_{first_ts}_{last_ts}.jsonl.gz"
+
+def index_key(key):
+    return key.replace(".jsonl.gz", ".index.json")
+
+def read_record(s3, s3_bucket, key, offset, length):
+    # Fetch one record of an archive by its index entry
+    response = s3.get_object(Bucket=s3_bucket, Key=key, Range=f"bytes={offset}-{offset + length - 1}")
+    return json.loads(gzip.decompress(response["Body"].read()))
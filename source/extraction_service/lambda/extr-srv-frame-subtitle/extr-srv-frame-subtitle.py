@@ -0,0 +1,125 @@
+'''
+Assign subtitles to all sampled frames of a task in one pass
+1. Read the task frames (after sampling and dedup) and the sorted subtitle index
+2. Merge join frame intervals [prev_timestamp, timestamp] with the subtitle cues
+3. Set the subtitles attribute of the matching frames (UpdateItem, concurrent), other attributes are left as they are
+4. Write the frame manifest read by the "Iterate sampled images" Map: one item per sampled image,
+   {"Key", "frame"} with the frame record, so the frame processors do not read it again from DB
+'''
+import json
+import os
+import heapq
+import boto3
+import decimal
+import utils
+import subtitle_index
+
+DYNAMO_VIDEO_FRAME_TABLE = os.environ.get("DYNAMO_VIDEO_FRAME_TABLE")
+DYNAMO_VIDEO_TRANS_TABLE = os.environ.get("DYNAMO_VIDEO_TRANS_TABLE")
+FRAME_MANIFEST_FILE = os.environ.get("FRAME_MANIFEST_FILE", "frame_manifest.json")
+
+# Frame record attributes carried by the Map items, set by the sampler, dedup and this stage
+FRAME_MANIFEST_FIELDS = ["id", "task_id", "timestamp", "prev_timestamp", "s3_bucket", "s3_key", "similarity_score", "subtitles"]
+
+s3 = boto3.client('s3')
+
+def lambda_handler(event, context):
+    task_id = event.get("Request", {}).get("TaskId")
+    setting = event.get("Request", {}).get("ExtractionSetting", {})
+    if task_id is None:
+        return {
+            "Error": "Invalid Request"
+        }
+
+    s3_bucket = event["MetaData"]["VideoFrameS3"]["S3Bucket"]
+    s3_prefix = event["MetaData"]["VideoFrameS3"]["S3Prefix"]
+    frames = utils.get_items_by_sort_key(DYNAMO_VIDEO_FRAME_TABLE, task_id)
+    frames.sort(key=lambda f: float(f["timestamp"]))
+
+    counts = {"updated": 0, "missing": 0, "failed": 0}
+    index = get_subtitle_index(s3_bucket, task_id) if setting.get("Transcription") == True else []
+    if len(index) > 0:
+        updates = {}
+        for frame, subtitles in zip(frames, assign_subtitles(frames, index)):
+            if subtitles:
+                updates[frame["id"]] = subtitles
+                frame["subtitles"] = subtitles
+
+        # Update database: video_frame. The GSI read may be stale, so only the new attribute is written,
+        # on frames that still exist
+        counts = utils.update_items_with_subtitles(DYNAMO_VIDEO_FRAME_TABLE, task_id, updates)
+        print(json.dumps({"task_id": task_id, "frames": len(frames), "subtitles": len(index), "frames_with_subtitles": len(updates), **counts}))
+        if counts["failed"] > 0:
+            # The state machine retries the step, the updates are idempotent
+            raise utils.UnprocessedItemsError(f"{counts['failed']} of {len(updates)} frames not updated with subtitles")
+
+    manifest_key = save_frame_manifest(s3_bucket, s3_prefix, task_id, frames)
+    return {"FramesWithSubtitles": counts["updated"], "FrameManifest": {"S3Bucket": s3_bucket, "S3Key": manifest_key}}
+
+def save_frame_manifest(s3_bucket, s3_prefix, task_id, frames):
+    '''
+    Map items of the sampled images. The images listed in S3 are the frames to process, as when the Map
+    listed the prefix itself; the GSI read may be stale, so a frame it does not return yet gets an item
+    without record, and the frame processors read that one from DB.
+    '''
+    records = {f.get("s3_key"): {k: f[k] for k in FRAME_MANIFEST_FIELDS if k in f} for f in frames}
+    items = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith(".jpg"):
+                continue
+            item = {"Key": obj["Key"]}
+            if obj["Key"] in records:
+                item["frame"] = records[obj["Key"]]
+            items.append(item)
+
+    manifest_key = f'tasks/{task_id}/{FRAME_MANIFEST_FILE}'
+    s3.put_object(Bucket=s3_bucket, Key=manifest_key, Body=json.dumps(items, default=from_dynamo_number))
+    return manifest_key
+
+def from_dynamo_number(value):
+    # DynamoDB numbers are read as Decimal
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def get_subtitle_index(s3_bucket, task_id):
+    # Built by the transcription trigger, fall back to the transcription table for tasks without one
+    index = subtitle_index.load(s3_bucket, task_id)
+    if index is None:
+        item = utils.dynamodb_get_by_id(DYNAMO_VIDEO_TRANS_TABLE, task_id, key_name="task_id")
+        index = subtitle_index.SubtitleIndex.from_subtitles(item.get("subtitles") if item else None)
+    return index
+
+def assign_subtitles(frames, index):
+    '''
+    Subtitles overlapping [prev_timestamp, timestamp] for each frame, frames sorted by timestamp.
+    One sweep over the cues: cues are added once their start_ts <= timestamp and
+    dropped once their end_ts < prev_timestamp (kept in a min-heap on end_ts).
+    '''
+    result = []
+    active = [] # (end_ts, cue position)
+    next_cue = 0
+    last_prev_ts = float("-inf")
+    for frame in frames:
+        ts = float(frame["timestamp"])
+        prev_ts = float(frame.get("prev_timestamp", 0))
+        if prev_ts < last_prev_ts:
+            # Intervals are consecutive within a chunk, a step back can only come from
+            # out of order data: answer this frame from the index instead of the sweep
+            result.append(index.overlap(prev_ts, ts))
+            continue
+        last_prev_ts = prev_ts
+
+        while next_cue < len(index) and index.starts[next_cue] <= ts:
+            heapq.heappush(active, (index.ends[next_cue], next_cue))
+            next_cue += 1
+        while active and active[0][0] < prev_ts:
+            heapq.heappop(active)
+
+        result.append([
+            {"start_ts": index.starts[i], "end_ts": index.ends[i], "transcription": index.texts[i]}
+            for i in sorted(i for _, i in active)
+        ])
+    return result
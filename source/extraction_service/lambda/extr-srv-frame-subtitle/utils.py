@@ -0,0 +1,96 @@
+import boto3
+import numbers,decimal
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+
+class UnprocessedItemsError(Exception):
+    # Items still not written once the retries are used up
+    pass
+
+dynamodb = boto3.resource('dynamodb')
+
+def dynamodb_get_by_id(table_name, id, key_name="Id"):
+    try:
+        table = dynamodb.Table(table_name)
+        response = table.get_item(Key={key_name: id})
+        if 'Item' in response:
+            return response['Item']
+        else:
+            print(f"No item found with id: {id}")
+            return None
+    except Exception as e:
+        print(f"An error occurred, dynamodb_get_by_id: {e}")
+        return None
+
+def get_items_by_sort_key(table_name, task_id, page_size=1000):
+    items = []
+    last_evaluated_key = None
+    table = dynamodb.Table(table_name)
+
+    while True:
+        if last_evaluated_key:
+            response = table.query(
+                IndexName='task_id-timestamp-index',  # Specify the secondary index name
+                KeyConditionExpression=Key('task_id').eq(task_id),  # Use the task_id to query the index
+                ExclusiveStartKey=last_evaluated_key,
+                Limit=page_size
+            )
+        else:
+            response = table.query(
+                IndexName='task_id-timestamp-index',  # Specify the secondary index name
+                KeyConditionExpression=Key('task_id').eq(task_id),  # Use the task_id to query the index
+                Limit=page_size
+            )
+
+        items.extend(response.get('Items', []))
+
+        last_evaluated_key = response.get('LastEvaluatedKey', None)
+        if not last_evaluated_key:
+            break
+
+    return items
+
+def update_items_with_subtitles(table_name, task_id, subtitles, max_workers=8):
+    """
+    Set subtitles on many frames. subtitles: {frame_id: [cues]}
+    Only the subtitles attribute is written, so attributes set by dedup (similarity_score) are kept,
+    and frames deleted since the read are not re-created (attribute_exists condition).
+    Returns {"updated", "missing", "failed"} counts.
+    """
+    client = dynamodb.meta.client
+    def update(frame_id, cues):
+        try:
+            client.update_item(
+                TableName=table_name,
+                Key={'id': frame_id, 'task_id': task_id},
+                UpdateExpression='SET subtitles = :s',
+                ConditionExpression='attribute_exists(id)',
+                ExpressionAttributeValues={':s': convert_to_dynamo_format(cues)}
+            )
+            return "updated"
+        except client.exceptions.ConditionalCheckFailedException:
+            return "missing"
+        except Exception as e:
+            print(f"Error updating subtitles of {frame_id} in table {table_name}: {str(e)}")
+        return "failed"
+
+    counts = {"updated": 0, "missing": 0, "failed": 0}
+    if not subtitles:
+        return counts
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for result in executor.map(lambda item: update(*item), subtitles.items()):
+            counts[result] += 1
+    return counts
+
+def convert_to_dynamo_format(item):
+    """
+    Recursively convert floats to Decimal so the item can be written to DynamoDB.
+    """
+    if isinstance(item, dict):
+        return {k: convert_to_dynamo_format(v) for k, v in item.items()}
+    elif isinstance(item, list):
+        return [convert_to_dynamo_format(v) for v in item]
+    elif isinstance(item, float):
+        return decimal.Decimal(str(item))
+    else:
+        return item
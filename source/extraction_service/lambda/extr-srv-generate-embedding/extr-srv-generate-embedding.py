@@ -1,14 +1,18 @@
-import json
+'''
+Remote transport of the embedding client (EMBEDDING_TRANSPORT = "lambda")
+The embedding code lives in embedding_client.py, in the embedding client layer
+'''
 import os
-import boto3
+import embedding_cache
+import embedding_client
 
-BEDROCK_REGION = os.environ.get("BEDROCK_REGION", os.environ['AWS_REGION'])
-BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID = os.environ.get("BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID")
-BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID = os.environ.get("BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID")
-
-bedrock = boto3.client('bedrock-runtime', region_name=BEDROCK_REGION) 
+# Batch requests: max inputs per request
+EMBEDDING_BATCH_MAX_SIZE = int(os.environ.get("EMBEDDING_BATCH_MAX_SIZE", 64))
 
 def lambda_handler(event, context):
+    if event is not None and "inputs" in event:
+        return batch_handler(event)
+
     embedding_type, text_input, image_input = None, None, None
     try:
         embedding_type = event.get("embedding_type", "txt") # txt | mm
@@ -20,59 +24,45 @@ def lambda_handler(event, context):
             'statusCode': 400,
             'body': 'Invalid request'
         }
-    
+
     if (text_input is None or len(text_input) == 0) and (image_input is None or len(image_input) == 0):
         return {
             'statusCode': 400,
             'body': 'Invalid request'
         }
-    
-    embedding = None
-    if embedding_type == "txt":
-        body = json.dumps({
-                "inputText": f"{text_input}", 
-                "dimensions": 1024,
-                "normalize": True
-            })
-        try:
-            response = bedrock.invoke_model(
-                body=body, 
-                modelId=BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID, 
-                accept="application/json", 
-                contentType="application/json"
-            )
-            
-            response_body = json.loads(response.get("body").read())
-            embedding = response_body.get("embedding")
-        except Exception as ex:
-            print(ex)
-    
-    elif embedding_type == "mm":
-        request_body = {}
-        if text_input is not None and len(text_input) > 0:
-            request_body["inputText"] = text_input
-            
-        if image_input:
-            request_body["inputImage"] = image_input
-        
-        body = json.dumps(request_body)
-        
-        embedding = None
-        try:
-            response = bedrock.invoke_model(
-                body=body, 
-                modelId=BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID, 
-                accept="application/json", 
-                contentType="application/json"
-            )
-            
-            response_body = json.loads(response.get('body').read())
-            embedding = response_body.get("embedding")
-            
-        except Exception as ex:
-            print(ex)
 
+    embedding, cache_hit = None, False
+    try:
+        embedding, cache_hit = embedding_client.get_embedding(embedding_type, text_input, image_input)
+    except Exception as ex:
+        print(ex)
+
+    print("Embedding cache:", embedding_cache.get_counters())
     return {
             'statusCode': 400,
-            'body': embedding
-        }
\ No newline at end of file
+            'body': embedding,
+            'cache_hit': cache_hit
+        }
+
+def batch_handler(event):
+    '''
+    Batch request: {"inputs": [{"embedding_type", "text_input", "image_input"}, ...], "output_format": "json" | "base64"}
+    Returns one result per input, in order: {"embedding", "cache_hit"} or {"error"}.
+    With output_format "base64" each embedding is the base64 of its little-endian float32 values.
+    '''
+    inputs = event.get("inputs")
+    output_format = event.get("output_format", "json")
+    if not isinstance(inputs, list) or len(inputs) > EMBEDDING_BATCH_MAX_SIZE or output_format not in ["json", "base64"]:
+        return {
+            'statusCode': 400,
+            'body': 'Invalid request'
+        }
+
+    results = embedding_client.embed_batch(inputs, output_format)
+
+    print("Embedding cache:", embedding_cache.get_counters())
+    return {
+            'statusCode': 200,
+            'body': results,
+            'output_format': output_format
+        }
@@ -56,6 +56,10 @@ def lambda_handler(event, context):
             task["MetaData"]["VideoMetaData"]["Duration"] = float(task["MetaData"]["VideoMetaData"]["Duration"])
             task["MetaData"]["VideoFrameS3"]["TotalFramesPlaned"] = float(task["MetaData"]["VideoFrameS3"]["TotalFramesPlaned"])
             task["MetaData"]["VideoFrameS3"]["TotalFramesSampled"] = float(task["MetaData"]["VideoFrameS3"]["TotalFramesSampled"])
+            if "DetectorCache" in task["MetaData"]:
+                cache = task["MetaData"]["DetectorCache"]
+                hits, misses = float(cache.get("Hits", 0)), float(cache.get("Misses", 0))
+                task["MetaData"]["DetectorCache"] = {"Hits": hits, "Misses": misses, "HitRatio": hits / (hits + misses) if hits + misses > 0 else None}
             task["RequestTs"] = db_task["RequestTs"]
     
         except Exception as ex:
@@ -41,25 +41,55 @@ def dynamodb_delete_by_id(table_name, id):
     except Exception as e:
         print(f"Error deleting item with key {key} from table {table_name}: {str(e)}")
 
-def dynamodb_task_update_status(table_name, task_id, new_status):    
+def dynamodb_task_update(table_name, task_id, set_values=None, add_values=None, key_name="Id"):
+    """
+    Partial, atomic update of a task item.
+    set_values: {"Status": "processing", "MetaData.VideoMetaData": {...}} -> SET
+    add_values: {"MetaData.VideoFrameS3.TotalFramesSampled": 3} -> ADD (atomic counter)
+    Nested paths are separated by "."; their parent maps must already exist.
+    """
+    names, values, set_clauses, add_clauses = {}, {}, [], []
+
+    def path_expression(path):
+        parts = []
+        for name in path.split("."):
+            placeholder = f"#n{len(names)}"
+            names[placeholder] = name
+            parts.append(placeholder)
+        return ".".join(parts)
+
+    for path, value in (set_values or {}).items():
+        placeholder = f":v{len(values)}"
+        values[placeholder] = convert_to_json_serializable(value)
+        set_clauses.append(f"{path_expression(path)} = {placeholder}")
+    for path, value in (add_values or {}).items():
+        placeholder = f":v{len(values)}"
+        values[placeholder] = convert_to_json_serializable(value)
+        add_clauses.append(f"{path_expression(path)} {placeholder}")
+
+    update_expression = []
+    if set_clauses:
+        update_expression.append("SET " + ", ".join(set_clauses))
+    if add_clauses:
+        update_expression.append("ADD " + ", ".join(add_clauses))
+    if not update_expression:
+        return None
+
     try:
-        response = dynamodb.update_item(
-            TableName=table_name,
-            Key={
-                'Id': {'S': task_id}
-            },
-            UpdateExpression="SET #status = :new_status",
-            ExpressionAttributeNames={
-                '#status': 'Status'
-            },
-            ExpressionAttributeValues={
-                ':new_status': {'S': new_status}
-            },
+        table = dynamodb.Table(table_name)
+        return table.update_item(
+            Key={key_name: task_id},
+            UpdateExpression=" ".join(update_expression),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
             ReturnValues="UPDATED_NEW"
         )
-        print(f"Update succeeded: {response}")
     except Exception as e:
-        print(f"Error updating item in table {table_name}: {str(e)}")
+        print(f"Error updating item {task_id} in table {table_name}: {str(e)}")
+    return None
+
+def dynamodb_task_update_status(table_name, task_id, new_status):
+    return dynamodb_task_update(table_name, task_id, set_values={"Status": new_status})
 
 def convert_to_json_serializable(item):
     """
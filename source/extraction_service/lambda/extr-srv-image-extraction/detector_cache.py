@@ -0,0 +1,85 @@
+'''
+Detector result cache
+1. Key: detector + hash of its configuration (threshold, model version, prompt) + SHA-256 of the frame bytes
+2. Results are stored in S3 as JSON, so a re-run of the same video only calls detectors
+   whose configuration changed
+3. Hits and misses are counted per invocation and reported in the task metadata
+'''
+import os
+import json
+import hashlib
+import threading
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+DETECTOR_CACHE_ENABLED = os.environ.get("DETECTOR_CACHE_ENABLED", "true").lower() == "true"
+DETECTOR_CACHE_S3_PREFIX = os.environ.get("DETECTOR_CACHE_S3_PREFIX", "detector_cache")
+
+s3 = boto3.client('s3', config=Config(max_pool_connections=25))
+
+counters = {"hit": 0, "miss": 0, "error": 0}
+lock = threading.Lock()
+
+def is_enabled():
+    return DETECTOR_CACHE_ENABLED
+
+def image_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def cache_key(detector, config, image_sha):
+    config_hash = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()[0:16]
+    return f"{DETECTOR_CACHE_S3_PREFIX}/{detector}/{config_hash}/{image_sha[0:2]}/{image_sha}.json"
+
+def count(name):
+    with lock:
+        counters[name] += 1
+
+def get_counters():
+    with lock:
+        return dict(counters)
+
+def reset_counters():
+    with lock:
+        for name in counters:
+            counters[name] = 0
+
+def get(s3_bucket, key):
+    try:
+        response = s3.get_object(Bucket=s3_bucket, Key=key)
+        return json.loads(response["Body"].read())
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] not in ["NoSuchKey", "404"]:
+            print(f"detector cache get {key}: {ex}")
+            count("error")
+    except Exception as ex:
+        print(f"detector cache get {key}: {ex}")
+        count("error")
+    return None
+
+def put(s3_bucket, key, value):
+    try:
+        s3.put_object(Bucket=s3_bucket, Key=key, Body=json.dumps(value), ContentType="application/json")
+    except Exception as ex:
+        print(f"detector cache put {key}: {ex}")
+        count("error")
+
+def get_or_compute(s3_bucket, detector, config, image_sha, compute):
+    '''
+    Return the cached value, or call compute() and cache its result.
+    Values must be JSON serializable. Returns (value, cache hit)
+    '''
+    if not is_enabled() or image_sha is None:
+        return compute(), False
+
+    key = cache_key(detector, config, image_sha)
+    value = get(s3_bucket, key)
+    if value is not None:
+        count("hit")
+        return value, True
+
+    count("miss")
+    value = compute()
+    if value is not None:
+        put(s3_bucket, key, value)
+    return value, False
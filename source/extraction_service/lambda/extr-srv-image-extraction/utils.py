@@ -57,48 +57,59 @@ def convert_to_json_serializable(item):
     else:
         return item
 
-def get_frame_by_id(table_name, frame_id, task_id):
-    try:
-        video_task_table = dynamodb.Table(table_name)
-        response = video_task_table.get_item(Key={"id": frame_id, "task_id": task_id})
-        if 'Item' in response:
-            return convert_to_json_serializable(response['Item'])
-        else:
-            print(f"No item found with id: {document_id}")
-            return None
-    except Exception as e:
-        print(f"An error occurred, dynamodb_get_by_id: {e}")
+def dynamodb_task_update(table_name, task_id, set_values=None, add_values=None, key_name="Id"):
+    """
+    Partial, atomic update of a task item.
+    set_values: {"Status": "processing", "MetaData.VideoMetaData": {...}} -> SET
+    add_values: {"MetaData.VideoFrameS3.TotalFramesSampled": 3} -> ADD (atomic counter)
+    Nested paths are separated by "."; their parent maps must already exist.
+    """
+    return dynamodb_update_item(table_name, {key_name: task_id}, set_values, add_values)
+
+def dynamodb_update_item(table_name, key, set_values=None, add_values=None):
+    """
+    Partial, atomic update of the item with the given (full) key, same paths as dynamodb_task_update.
+    """
+    names, values, set_clauses, add_clauses = {}, {}, [], []
+
+    def path_expression(path):
+        parts = []
+        for name in path.split("."):
+            placeholder = f"#n{len(names)}"
+            names[placeholder] = name
+            parts.append(placeholder)
+        return ".".join(parts)
+
+    for path, value in (set_values or {}).items():
+        placeholder = f":v{len(values)}"
+        values[placeholder] = convert_to_json_serializable(value)
+        set_clauses.append(f"{path_expression(path)} = {placeholder}")
+    for path, value in (add_values or {}).items():
+        placeholder = f":v{len(values)}"
+        values[placeholder] = convert_to_json_serializable(value)
+        add_clauses.append(f"{path_expression(path)} {placeholder}")
+
+    update_expression = []
+    if set_clauses:
+        update_expression.append("SET " + ", ".join(set_clauses))
+    if add_clauses:
+        update_expression.append("ADD " + ", ".join(add_clauses))
+    if not update_expression:
         return None
-    return None
-    
-def dynamodb_trans_get_trans(table_name, task_id, start_ts, end_ts):
-    item = dynamodb_get_by_id(table_name, task_id, key_name="task_id")
-    result = []
-    if item and "subtitles" in item:
-        for st in item["subtitles"]:
-            if (float(st["start_ts"]) > float(end_ts)) or (float(st["end_ts"]) < float(start_ts)):
-                continue
-            result.append(st)
-    
-    return result
 
-def dynamodb_task_update_status(table_name, task_id, new_status):    
     try:
         table = dynamodb.Table(table_name)
-        response = table.update_item(
-            TableName=table_name,
-            Key={
-                'Id': {'S': task_id}
-            },
-            UpdateExpression="SET #status = :new_status",
-            ExpressionAttributeNames={
-                '#status': 'Status'
-            },
-            ExpressionAttributeValues={
-                ':new_status': {'S': new_status}
-            },
+        return table.update_item(
+            Key=key,
+            UpdateExpression=" ".join(update_expression),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
             ReturnValues="UPDATED_NEW"
         )
-        print(f"Update succeeded: {response}")
     except Exception as e:
-        print(f"Error updating item in table {table_name}: {str(e)}")
\ No newline at end of file
+        print(f"Error updating item {key} in table {table_name}: {str(e)}")
+    return None
+
+def dynamodb_task_update_status(table_name, task_id, new_status):
+    return dynamodb_task_update(table_name, task_id, set_values={"Status": new_status})
+
@@ -1,6 +1,7 @@
 import boto3
 import numbers,decimal
 from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
 
 dynamodb = boto3.resource('dynamodb')
 
@@ -27,6 +28,105 @@ def dynamodb_get_by_id(table_name, id, key_name="Id"):
         return None
     return None
 
+def dynamodb_task_update(table_name, task_id, set_values=None, add_values=None, key_name="Id"):
+    """
+    Partial, atomic update of a task item.
+    set_values: {"Status": "processing", "MetaData.VideoMetaData": {...}} -> SET
+    add_values: {"MetaData.VideoFrameS3.TotalFramesSampled": 3} -> ADD (atomic counter)
+    Nested paths are separated by "."; their parent maps must already exist.
+    """
+    names, values, set_clauses, add_clauses = {}, {}, [], []
+
+    def path_expression(path):
+        parts = []
+        for name in path.split("."):
+            placeholder = f"#n{len(names)}"
+            names[placeholder] = name
+            parts.append(placeholder)
+        return ".".join(parts)
+
+    for path, value in (set_values or {}).items():
+        placeholder = f":v{len(values)}"
+        values[placeholder] = convert_to_dynamo_format(value)
+        set_clauses.append(f"{path_expression(path)} = {placeholder}")
+    for path, value in (add_values or {}).items():
+        placeholder = f":v{len(values)}"
+        values[placeholder] = convert_to_dynamo_format(value)
+        add_clauses.append(f"{path_expression(path)} {placeholder}")
+
+    update_expression = []
+    if set_clauses:
+        update_expression.append("SET " + ", ".join(set_clauses))
+    if add_clauses:
+        update_expression.append("ADD " + ", ".join(add_clauses))
+    if not update_expression:
+        return None
+
+    try:
+        table = dynamodb.Table(table_name)
+        return table.update_item(
+            Key={key_name: task_id},
+            UpdateExpression=" ".join(update_expression),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            ReturnValues="UPDATED_NEW"
+        )
+    except Exception as e:
+        print(f"Error updating item {task_id} in table {table_name}: {str(e)}")
+    return None
+
+def dynamodb_task_list_append(table_name, task_id, path, value, key_name="Id"):
+    """
+    Atomically append value to the list at path ("A.B.C") unless it is already there.
+    Missing parent maps are created on the first call. The task item must exist.
+    Returns True if the list changed, False if the value was already there, None on error.
+    """
+    names = {"#key": key_name}
+    parts = []
+    for name in path.split("."):
+        placeholder = f"#n{len(parts)}"
+        names[placeholder] = name
+        parts.append(placeholder)
+    path_expression = ".".join(parts)
+
+    table = dynamodb.Table(table_name)
+    for attempt in range(2):
+        try:
+            table.update_item(
+                Key={key_name: task_id},
+                UpdateExpression=f"SET {path_expression} = list_append(if_not_exists({path_expression}, :empty), :new)",
+                ConditionExpression=f"attribute_exists(#key) AND (attribute_not_exists({path_expression}) OR NOT contains({path_expression}, :val))",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={":empty": [], ":new": [value], ":val": value}
+            )
+            return True
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code == "ConditionalCheckFailedException":
+                return False
+            if code != "ValidationException" or attempt > 0:
+                print(f"Error appending to {path} of {task_id} in table {table_name}: {str(e)}")
+                return None
+
+        # The document path is invalid: create the parent maps, then retry
+        try:
+            for i in range(1, len(parts)):
+                prefix = ".".join(parts[:i])
+                table.update_item(
+                    Key={key_name: task_id},
+                    UpdateExpression=f"SET {prefix} = if_not_exists({prefix}, :map)",
+                    ConditionExpression="attribute_exists(#key)",
+                    ExpressionAttributeNames={k: v for k, v in names.items() if k == "#key" or k in parts[:i]},
+                    ExpressionAttributeValues={":map": {}}
+                )
+        except Exception as e:
+            print(f"Error creating {path} of {task_id} in table {table_name}: {str(e)}")
+            return None
+    return None
+
+def dynamodb_task_update_status(table_name, task_id, new_status):
+    return dynamodb_task_update(table_name, task_id, set_values={"Status": new_status})
+
 def convert_to_dynamo_format(item):
     """
     Recursively convert a DynamoDB item to a JSON serializable format.
@@ -75,7 +75,7 @@ def lambda_handler(event, context):
         
         # Update task status in DB
         task["Status"] = "processing"
-        utils.dynamodb_table_upsert(DYNAMO_VIDEO_TASK_TABLE, document=task)
+        utils.dynamodb_task_update_status(DYNAMO_VIDEO_TASK_TABLE, task_id, task["Status"])
         print("Updated DB status:",task["Status"])
 
     else:
@@ -3,7 +3,13 @@ import boto3
 import os
 import utils
 import base64
-from langchain.vectorstores import FAISS
+import time
+import random
+import frame_similarity
+import embedding_cache
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 BEDROCK_REGION = os.environ.get("BEDROCK_REGION", os.environ.get('AWS_REGION'))
 DYNAMO_VIDEO_FRAME_TABLE = os.environ.get("DYNAMO_VIDEO_FRAME_TABLE")
@@ -12,8 +18,30 @@ VIDEO_FRAME_SIMILAIRTY_THRESHOLD = float(os.environ.get("VIDEO_FRAME_SIMILAIRTY_
 VIDEO_SAMPLE_FILE_PREFIX = os.environ.get("VIDEO_SAMPLE_FILE_PREFIX")
 BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID = os.environ.get("BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID")
 
-s3 = boto3.client('s3')
-bedrock = boto3.client('bedrock-runtime', region_name=BEDROCK_REGION) 
+# Local perceptual hash prefilter: Hamming distance between 64-bit dHashes
+VIDEO_FRAME_HASH_PREFILTER = os.environ.get("VIDEO_FRAME_HASH_PREFILTER", "true").lower() == "true"
+VIDEO_FRAME_HASH_DUPLICATE_DISTANCE = int(os.environ.get("VIDEO_FRAME_HASH_DUPLICATE_DISTANCE", 3)) # <= : near-identical, drop without embedding
+VIDEO_FRAME_HASH_DISTINCT_DISTANCE = int(os.environ.get("VIDEO_FRAME_HASH_DISTINCT_DISTANCE", 18)) # >= : clearly different, keep without embedding
+
+# Vector comparison: l2 (squared L2, same scores as the previous FAISS store) | cosine
+VIDEO_FRAME_SIMILARITY_METRIC = os.environ.get("VIDEO_FRAME_SIMILARITY_METRIC", "l2")
+# Number of last kept frames each frame is compared with. 1 = previous kept frame only.
+VIDEO_FRAME_SIMILARITY_WINDOW = max(1, int(os.environ.get("VIDEO_FRAME_SIMILARITY_WINDOW", 1)))
+
+# Number of S3 reads / Bedrock embedding calls in flight
+VIDEO_FRAME_DEDUP_CONCURRENCY = max(1, int(os.environ.get("VIDEO_FRAME_DEDUP_CONCURRENCY", 8)))
+# Retries for throttled Bedrock calls (capped exponential backoff with jitter)
+BEDROCK_MAX_RETRIES = int(os.environ.get("BEDROCK_MAX_RETRIES", 6))
+BEDROCK_RETRY_BASE_DELAY_S = 0.2
+BEDROCK_RETRY_MAX_DELAY_S = 8
+BEDROCK_THROTTLING_ERRORS = ["ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException", "ModelNotReadyException"]
+
+S3_DELETE_BATCH_SIZE = 1000 # DeleteObjects limit
+
+s3 = boto3.client('s3', config=Config(max_pool_connections=max(10, VIDEO_FRAME_DEDUP_CONCURRENCY)))
+# Throttling retries are handled in get_mm_vector
+bedrock = boto3.client('bedrock-runtime', region_name=BEDROCK_REGION, 
+                config=Config(max_pool_connections=max(10, VIDEO_FRAME_DEDUP_CONCURRENCY), retries={"max_attempts": 1})) 
 
 def lambda_handler(event, context):
     task_id, start_ts, end_ts = None, None, None
@@ -54,79 +82,159 @@ def lambda_handler(event, context):
     video_duration = float(task["MetaData"]["VideoMetaData"]["Duration"])
     timestamps = generate_sample_timestamps(task["Request"].get("PreProcessSetting"), video_duration, start_ts, end_ts)
     
-    prev_ts, prev_vector, total_sampled = start_ts, None, 0
-    for ts in timestamps:
-        cur_ts = ts["ts"]
-        try:
-            s3_key = f"{s3_prefix}/{VIDEO_SAMPLE_FILE_PREFIX}{cur_ts}.jpg"
+    # Shot detection relies on the similarity score of every kept frame, so distinct frames still need an embedding
+    require_score = task["Request"].get("AnalysisSetting", {}).get("ShotDetection", False) == True
+
+    embedding_cache.reset_counters()
 
-            # Get image base64 str
-            base64_encoded_image = None
+    with ThreadPoolExecutor(max_workers=VIDEO_FRAME_DEDUP_CONCURRENCY) as executor:
+        # Prefetch: read image bytes and compute perceptual hashes in parallel, kept in timestamp order
+        frames = list(executor.map(lambda ts: fetch_frame(s3_bucket, s3_prefix, ts["ts"]), timestamps or []))
+
+        # Embedding futures by frame index. Frames that are likely to need an embedding are requested ahead,
+        # any other embedding the walk needs is requested on demand.
+        embeddings = {}
+        def request_embedding(i):
+            if i not in embeddings:
+                embeddings[i] = executor.submit(get_frame_vector, frames[i]["image"])
+            return embeddings[i]
+
+        for i in embedding_candidates(frames, require_score):
+            request_embedding(i)
+
+        # Sequential keep/drop walk. Last kept frames: {"index", "hash", "vector"}
+        kept, total_sampled = [], 0
+        # Writes are applied after the walk: dropped frames [(ts, s3_key)] and scores of kept frames {frame_id: score}
+        dropped, scores = [], {}
+        stats = {"hash_duplicate": 0, "hash_distinct": 0, "embedding": 0}
+        for i, frame in enumerate(frames):
+            cur_ts = frame["ts"]
             try:
-                response = s3.get_object(Bucket=s3_bucket, Key=s3_key)
-                image_data = response['Body'].read()
-                base64_encoded_image = base64.b64encode(image_data).decode('utf-8')
-            except Exception as ex:
-                print(ex)
-
-            if base64_encoded_image:
-                # Generate mm embedding
-                cur_vector = get_mm_vector(base64_encoded_image)
-                
-                # similarity score: compare with previous image
-                score = similarity_check(task_id, prev_ts, prev_vector, cur_ts, cur_vector)
-
-                if score is not None and score <= similarity_threshold:
-                    # Delete image on S3
-                    s3.delete_object(Bucket=s3_bucket, Key=s3_key)
-
-                    # Delete from DB video_frame table
-                    frame_id = f'{task_id}_{cur_ts}'
-                    response = utils.dynamodb_delete_by_id(DYNAMO_VIDEO_FRAME_TABLE, frame_id, task_id)
-
-                else:
-                    # set current image as prev
-                    prev_vector = cur_vector
-                    prev_ts = cur_ts
-
-                    total_sampled += 1
-                    
-                    # update frame in db: include similarity score
-                    if score:
-                        response = utils.update_item_with_similarity_score(DYNAMO_VIDEO_FRAME_TABLE, f'{task_id}_{cur_ts}', task_id, score)
-
-        except Exception as e:
-            print(e)
-
-    # update video_task table
+                s3_key = frame["s3_key"]
+                image_data = frame["image"]
+
+                if image_data:
+                    cur_vector, score, duplicate = None, None, False
+
+                    # Prefilter: compare perceptual hash with the kept frames
+                    cur_hash = frame["hash"]
+                    hash_distance = frame_similarity.min_hamming_distance(cur_hash, [k["hash"] for k in kept])
+
+                    if len(kept) == 0:
+                        # First frame of the chunk is always kept
+                        duplicate = False
+                    elif hash_distance is not None and hash_distance <= VIDEO_FRAME_HASH_DUPLICATE_DISTANCE:
+                        duplicate = True
+                        stats["hash_duplicate"] += 1
+                    elif hash_distance is not None and hash_distance >= VIDEO_FRAME_HASH_DISTINCT_DISTANCE and not require_score:
+                        duplicate = False
+                        stats["hash_distinct"] += 1
+                    else:
+                        # Ambiguous: fall through to the embedding comparison
+                        for k in kept:
+                            if k["vector"] is None:
+                                k["vector"] = request_embedding(k["index"]).result()
+                        cur_vector = request_embedding(i).result()
+                        stats["embedding"] += 1
+
+                        # similarity score: compare with previous kept images
+                        score = frame_similarity.similarity_score(cur_vector, [k["vector"] for k in kept], VIDEO_FRAME_SIMILARITY_METRIC)
+                        duplicate = score is not None and score <= similarity_threshold
+
+                    if duplicate:
+                        # Delete image on S3 and from DB video_frame table (after the walk)
+                        dropped.append((cur_ts, s3_key))
+
+                    else:
+                        # set current image as prev
+                        kept.append({"index": i, "hash": cur_hash, "vector": cur_vector})
+                        kept = kept[-VIDEO_FRAME_SIMILARITY_WINDOW:]
+
+                        total_sampled += 1
+                        
+                        # update frame in db: include similarity score (after the walk)
+                        if score:
+                            scores[f'{task_id}_{cur_ts}'] = score
+
+            except Exception as e:
+                print(e)
+
+        # Speculative embeddings the walk did not use
+        stats["embedding_requested"] = len(embeddings)
+        stats["embedding_cache"] = embedding_cache.get_counters()
+        for future in embeddings.values():
+            future.cancel()
+    print("Dedup decisions:", stats)
+
+    # Apply writes in bulk. Deletes come first: a failure raises before the sampled counter is incremented
+    delete_frames(s3_bucket, task_id, dropped)
+    failed = utils.update_items_with_similarity_score(DYNAMO_VIDEO_FRAME_TABLE, task_id, scores, max_workers=VIDEO_FRAME_DEDUP_CONCURRENCY)
+    if failed > 0:
+        # Shot detection reads the scores, retried like the deletes (before the sampled counter is incremented)
+        raise utils.UnprocessedItemsError(f"{failed} of {len(scores)} frame similarity scores not written")
+
+    # update video_task table: chunks run concurrently, so increment the counter atomically
+    utils.dynamodb_task_update(DYNAMO_VIDEO_TASK_TABLE, task_id, add_values={"MetaData.VideoFrameS3.TotalFramesSampled": total_sampled})
+
+def delete_frames(s3_bucket, task_id, frames):
+    '''
+    frames: [(ts, s3_key)]. S3 DeleteObjects takes up to 1000 keys, DynamoDB deletes go in batches of 25.
+    Failed deletes raise UnprocessedItemsError, so the Map retries the chunk instead of keeping duplicate frames.
+    Rows are deleted before images: the retry finds the frames again by listing S3.
+    '''
+    utils.dynamodb_batch_delete(DYNAMO_VIDEO_FRAME_TABLE, [{"id": f"{task_id}_{ts}", "task_id": task_id} for ts, key in frames])
+
+    failed = 0
+    for i in range(0, len(frames), S3_DELETE_BATCH_SIZE):
+        batch = frames[i:i + S3_DELETE_BATCH_SIZE]
+        try:
+            response = s3.delete_objects(Bucket=s3_bucket, Delete={"Objects": [{"Key": key} for ts, key in batch], "Quiet": True})
+            for error in response.get("Errors", []):
+                print(f"Failed to delete {error.get('Key')}: {error.get('Message')}")
+                failed += 1
+        except Exception as ex:
+            print(ex)
+            failed += len(batch)
+    if failed > 0:
+        raise utils.UnprocessedItemsError(f"{failed} of {len(frames)} duplicate frame images not deleted from {s3_bucket}")
+
+def fetch_frame(s3_bucket, s3_prefix, cur_ts):
+    s3_key = f"{s3_prefix}/{VIDEO_SAMPLE_FILE_PREFIX}{cur_ts}.jpg"
+    frame = {"ts": cur_ts, "s3_key": s3_key, "image": None, "hash": None}
+
+    # Get image bytes
     try:
-        # Get task from DB
-        task_db = utils.dynamodb_get_by_id(DYNAMO_VIDEO_TASK_TABLE, task_id)
-        sampled = float(task_db["MetaData"]["VideoFrameS3"]["TotalFramesSampled"])
-        task_db["MetaData"]["VideoFrameS3"]["TotalFramesSampled"] = sampled + float(total_sampled)
-        # Update DB
-        utils.dynamodb_table_upsert(DYNAMO_VIDEO_TASK_TABLE, task_db)
+        response = s3.get_object(Bucket=s3_bucket, Key=s3_key)
+        frame["image"] = response['Body'].read()
     except Exception as ex:
         print(ex)
 
-def similarity_check(task_id, pre_ts, pre_vector, cur_ts, cur_vector, input_text=None):
-    if pre_vector is None or cur_vector is None:
-        return None
-
-    prev_doc_id = f'{task_id}_{pre_ts}'
-
-    # Store previous vector to DB
-    vector_store = FAISS.from_embeddings(text_embeddings=[("", pre_vector)], embedding=None, metadatas=[{"ts":pre_ts}])
-    results = vector_store.similarity_search_with_score_by_vector(embedding=cur_vector, k=10, filter=dict(ts=pre_ts))
-    
-    score = None
-    if results and len(results) > 0:
-        score = results[0][1]
+    if frame["image"] and VIDEO_FRAME_HASH_PREFILTER:
+        frame["hash"] = frame_similarity.compute_dhash(frame["image"])
+    return frame
 
-    # Delete temp index
-    vector_store.index.reset()
+def embedding_candidates(frames, require_score):
+    # Frames the walk will most likely embed, judged by the hash distance to the previous sampled frame.
+    # Without hashes (prefilter off) every frame is compared by embedding.
+    candidates = []
+    for i in range(1, len(frames)):
+        if not frames[i]["image"] or not frames[i - 1]["image"]:
+            continue
+        distance = frame_similarity.hamming_distance(frames[i - 1]["hash"], frames[i]["hash"])
+        if distance is None or (distance > VIDEO_FRAME_HASH_DUPLICATE_DISTANCE and (distance < VIDEO_FRAME_HASH_DISTINCT_DISTANCE or require_score)):
+            # The previous frame is the likely reference when it is not a near-duplicate itself
+            prev_distance = frame_similarity.hamming_distance(frames[i - 2]["hash"], frames[i - 1]["hash"]) if i > 1 else None
+            if i == 1 or prev_distance is None or prev_distance > VIDEO_FRAME_HASH_DUPLICATE_DISTANCE:
+                candidates.append(i - 1)
+            candidates.append(i)
+    return candidates
 
-    return score
+def get_frame_vector(image_data):
+    # Image-only embedding, looked up in the content-addressed cache first
+    embedding, cache_hit = embedding_cache.get_or_compute(BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID, 
+                                lambda: get_mm_vector(base64.b64encode(image_data).decode('utf-8')), 
+                                image_bytes=image_data)
+    return embedding
 
 def get_mm_vector(base64_encoded_image, input_text=None):
     request_body = {}
@@ -140,18 +248,28 @@ def get_mm_vector(base64_encoded_image, input_text=None):
     body = json.dumps(request_body)
     
     embedding = None
-    try:
-        response = bedrock.invoke_model(
-            body=body, 
-            modelId=BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID, 
-            accept="application/json", 
-            contentType="application/json"
-        )
-        
-        response_body = json.loads(response.get('body').read())
-        embedding = response_body.get("embedding")
-    except Exception as ex:
-        print(ex)
+    for attempt in range(BEDROCK_MAX_RETRIES + 1):
+        try:
+            response = bedrock.invoke_model(
+                body=body, 
+                modelId=BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID, 
+                accept="application/json", 
+                contentType="application/json"
+            )
+            
+            response_body = json.loads(response.get('body').read())
+            embedding = response_body.get("embedding")
+            break
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] in BEDROCK_THROTTLING_ERRORS and attempt < BEDROCK_MAX_RETRIES:
+                # Back off with full jitter so concurrent workers do not retry in lockstep
+                time.sleep(random.uniform(0, min(BEDROCK_RETRY_MAX_DELAY_S, BEDROCK_RETRY_BASE_DELAY_S * (2 ** attempt))))
+                continue
+            print(ex)
+            break
+        except Exception as ex:
+            print(ex)
+            break
 
     return embedding
 
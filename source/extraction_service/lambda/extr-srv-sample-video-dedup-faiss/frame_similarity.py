@@ -0,0 +1,54 @@
+'''
+In-process similarity helpers used by smart sampling
+1. Perceptual hash (dHash) prefilter
+2. Vector distance between frame embeddings
+
+Vector scores follow the FAISS IndexFlatL2 convention used by the previous LangChain store:
+squared L2 distance, lower means more similar.
+'''
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+def compute_dhash(image_data, hash_size=8):
+    # Difference hash: compare adjacent pixels of a (hash_size+1) x hash_size grayscale thumbnail
+    try:
+        image = Image.open(BytesIO(image_data))
+        # Let the JPEG decoder downscale while decoding
+        image.draft("L", (hash_size * 8, hash_size * 8))
+        pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR), dtype=np.int16)
+        return np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    except Exception as ex:
+        print(ex)
+    return None
+
+def hamming_distance(hash_a, hash_b):
+    if hash_a is None or hash_b is None:
+        return None
+    return int(np.unpackbits(np.bitwise_xor(hash_a, hash_b)).sum())
+
+def min_hamming_distance(cur_hash, hashes):
+    # Closest hash in the window, None when there is nothing to compare
+    distances = [d for d in (hamming_distance(h, cur_hash) for h in hashes) if d is not None]
+    return min(distances) if distances else None
+
+def vector_distances(cur_vector, vectors, metric="l2"):
+    '''
+    Distance between cur_vector and each row of vectors.
+    l2: squared euclidean distance (same as FAISS IndexFlatL2)
+    cosine: 1 - cosine similarity
+    '''
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    query = np.asarray(cur_vector, dtype=np.float32)
+    if metric == "cosine":
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        return 1.0 - (matrix @ query) / np.maximum(norms, 1e-12)
+    diff = matrix - query
+    return np.einsum("ij,ij->i", diff, diff)
+
+def similarity_score(cur_vector, vectors, metric="l2"):
+    # Distance to the closest vector in the window, None when there is nothing to compare
+    vectors = [v for v in vectors if v is not None]
+    if cur_vector is None or len(vectors) == 0:
+        return None
+    return float(vector_distances(cur_vector, vectors, metric).min())
@@ -1,8 +1,16 @@
 import boto3
 import numbers,decimal
+import time, random
+from concurrent.futures import ThreadPoolExecutor
 from boto3.dynamodb.types import TypeDeserializer
 from boto3.dynamodb.conditions import Key
 
+DYNAMO_BATCH_WRITE_SIZE = 25 # BatchWriteItem limit
+
+class UnprocessedItemsError(Exception):
+    # Items still unprocessed once the batch write retries are used up
+    pass
+
 dynamodb = boto3.resource('dynamodb')
 
 def dynamodb_table_upsert(table_name, document):
@@ -52,26 +60,86 @@ def dynamodb_delete_by_id(table_name, id, task_id):
         print(f"Error deleting item with id {id} from table {table_name}: {str(e)}")
     return None
 
-def dynamodb_task_update_status(table_name, task_id, new_status):    
+def dynamodb_batch_delete(table_name, keys, max_retries=8, base_delay_s=0.05):
+    """
+    Delete items in BatchWriteItem requests of up to 25 keys.
+    Unprocessed items are retried with exponential backoff, UnprocessedItemsError is raised for items left after max_retries.
+    """
+    requests = [{"DeleteRequest": {"Key": k}} for k in keys]
+    return dynamodb_batch_write_requests(table_name, requests, max_retries, base_delay_s)
+
+def dynamodb_batch_write_requests(table_name, requests, max_retries=8, base_delay_s=0.05):
+    # Same request shape as Table.batch_writer, plus backoff between unprocessed item retries
+    client = dynamodb.meta.client
+    unprocessed_total = 0
+    for i in range(0, len(requests), DYNAMO_BATCH_WRITE_SIZE):
+        pending = requests[i:i + DYNAMO_BATCH_WRITE_SIZE]
+        retries = 0
+        while pending:
+            response = client.batch_write_item(RequestItems={table_name: pending})
+            pending = response.get("UnprocessedItems", {}).get(table_name, [])
+            if not pending:
+                break
+            if retries >= max_retries:
+                print(f"dynamodb_batch_write_requests: {len(pending)} unprocessed items left in {table_name}")
+                unprocessed_total += len(pending)
+                break
+            time.sleep(min(base_delay_s * (2 ** retries), 5) * (0.5 + random.random() / 2))
+            retries += 1
+    if unprocessed_total > 0:
+        # Raised after all chunks are sent, the state machine retries the invocation (writes are idempotent)
+        raise UnprocessedItemsError(f"{unprocessed_total} of {len(requests)} items not written to {table_name}")
+    return unprocessed_total
+
+def dynamodb_task_update(table_name, task_id, set_values=None, add_values=None, key_name="Id"):
+    """
+    Partial, atomic update of a task item.
+    set_values: {"Status": "processing", "MetaData.VideoMetaData": {...}} -> SET
+    add_values: {"MetaData.VideoFrameS3.TotalFramesSampled": 3} -> ADD (atomic counter)
+    Nested paths are separated by "."; their parent maps must already exist.
+    """
+    names, values, set_clauses, add_clauses = {}, {}, [], []
+
+    def path_expression(path):
+        parts = []
+        for name in path.split("."):
+            placeholder = f"#n{len(names)}"
+            names[placeholder] = name
+            parts.append(placeholder)
+        return ".".join(parts)
+
+    for path, value in (set_values or {}).items():
+        placeholder = f":v{len(values)}"
+        values[placeholder] = convert_to_json_serializable(value)
+        set_clauses.append(f"{path_expression(path)} = {placeholder}")
+    for path, value in (add_values or {}).items():
+        placeholder = f":v{len(values)}"
+        values[placeholder] = convert_to_json_serializable(value)
+        add_clauses.append(f"{path_expression(path)} {placeholder}")
+
+    update_expression = []
+    if set_clauses:
+        update_expression.append("SET " + ", ".join(set_clauses))
+    if add_clauses:
+        update_expression.append("ADD " + ", ".join(add_clauses))
+    if not update_expression:
+        return None
+
     try:
-        response = dynamodb.update_item(
-            TableName=table_name,
-            Key={
-                'Id': {'S': task_id}
-            },
-            UpdateExpression="SET #status = :new_status",
-            ExpressionAttributeNames={
-                '#status': 'Status'
-            },
-            ExpressionAttributeValues={
-                ':new_status': {'S': new_status}
-            },
+        table = dynamodb.Table(table_name)
+        return table.update_item(
+            Key={key_name: task_id},
+            UpdateExpression=" ".join(update_expression),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
             ReturnValues="UPDATED_NEW"
         )
-        print(f"Update succeeded: {response}")
     except Exception as e:
-        print(f"Error updating item in table {table_name}: {str(e)}")
+        print(f"Error updating item {task_id} in table {table_name}: {str(e)}")
+    return None
 
+def dynamodb_task_update_status(table_name, task_id, new_status):
+    return dynamodb_task_update(table_name, task_id, set_values={"Status": new_status})
 
 def update_item_with_similarity_score(table_name, frame_id, task_id, similarity_score):
     table = dynamodb.Table(table_name)
@@ -91,6 +159,32 @@ def update_item_with_similarity_score(table_name, frame_id, task_id, similarity_
 
     return response
 
+def update_items_with_similarity_score(table_name, task_id, scores, max_workers=8):
+    """
+    Set similarity_score on many frames. scores: {frame_id: score}
+    BatchWriteItem has no update operation, so the UpdateItem calls run concurrently.
+    Uses the low-level client, which is safe to share between threads.
+    """
+    client = dynamodb.meta.client
+    def update(frame_id, score):
+        try:
+            client.update_item(
+                TableName=table_name,
+                Key={'id': frame_id, 'task_id': task_id},
+                UpdateExpression='SET similarity_score = :val',
+                ExpressionAttributeValues={':val': decimal.Decimal(str(score))}
+            )
+            return True
+        except Exception as e:
+            print(f"Error updating similarity score of {frame_id} in table {table_name}: {str(e)}")
+        return False
+
+    if not scores:
+        return 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda item: update(*item), scores.items()))
+    return results.count(False)
+
 def convert_to_json_serializable(item):
     """
     Recursively convert a DynamoDB item to a JSON serializable format.
@@ -4,6 +4,12 @@ import os
 from opensearchpy import OpenSearch
 import utils
 import base64
+import similarity_backend
+import embedding_cache
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 OPENSEARCH_DOMAIN_ENDPOINT = os.environ.get("OPENSEARCH_DOMAIN_ENDPOINT")
@@ -15,18 +21,34 @@ BEDROCK_REGION = os.environ.get("BEDROCK_REGION", os.environ.get('AWS_REGION'))
 DYNAMO_VIDEO_FRAME_TABLE = os.environ.get("DYNAMO_VIDEO_FRAME_TABLE")
 DYNAMO_VIDEO_TASK_TABLE = os.environ.get("DYNAMO_VIDEO_TASK_TABLE")
 BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID = os.environ.get("BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID")
-
-s3 = boto3.client('s3')
-
-opensearch_client = OpenSearch(
-        hosts=[{'host': OPENSEARCH_DOMAIN_ENDPOINT, 'port': OPENSEARCH_PORT}],
-        http_compress=True,
-        use_ssl=True,
-        verify_certs=True,
-        ssl_assert_hostname=False,
-        ssl_show_warn=False,
-    )
-bedrock = boto3.client('bedrock-runtime', region_name=BEDROCK_REGION) 
+# memory: compare vectors in the lambda process | opensearch: temporary k-NN index per chunk
+VIDEO_FRAME_SIMILARITY_BACKEND = os.environ.get("VIDEO_FRAME_SIMILARITY_BACKEND", "memory")
+
+# Number of S3 reads / Bedrock embedding calls in flight
+VIDEO_FRAME_DEDUP_CONCURRENCY = max(1, int(os.environ.get("VIDEO_FRAME_DEDUP_CONCURRENCY", 8)))
+# Retries for throttled Bedrock calls (capped exponential backoff with jitter)
+BEDROCK_MAX_RETRIES = int(os.environ.get("BEDROCK_MAX_RETRIES", 6))
+BEDROCK_RETRY_BASE_DELAY_S = 0.2
+BEDROCK_RETRY_MAX_DELAY_S = 8
+BEDROCK_THROTTLING_ERRORS = ["ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException", "ModelNotReadyException"]
+
+S3_DELETE_BATCH_SIZE = 1000 # DeleteObjects limit
+
+s3 = boto3.client('s3', config=Config(max_pool_connections=max(10, VIDEO_FRAME_DEDUP_CONCURRENCY)))
+
+opensearch_client = None
+if VIDEO_FRAME_SIMILARITY_BACKEND == "opensearch":
+    opensearch_client = OpenSearch(
+            hosts=[{'host': OPENSEARCH_DOMAIN_ENDPOINT, 'port': OPENSEARCH_PORT}],
+            http_compress=True,
+            use_ssl=True,
+            verify_certs=True,
+            ssl_assert_hostname=False,
+            ssl_show_warn=False,
+        )
+# Throttling retries are handled in get_mm_vector
+bedrock = boto3.client('bedrock-runtime', region_name=BEDROCK_REGION, 
+                config=Config(max_pool_connections=max(10, VIDEO_FRAME_DEDUP_CONCURRENCY), retries={"max_attempts": 1})) 
 
 def lambda_handler(event, context):
     task_id, start_ts, end_ts = None, None, None
@@ -59,11 +81,14 @@ def lambda_handler(event, context):
             print(ex)
 
             
-    # Create similiarity check index
+    # Similarity backend lives for the chunk
     opensearch_temp_index_name = f'{OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_TEMP_PREFIX}{task_id[0:5]}_{start_ts}_{end_ts}'
-    print("opensearch_temp_index_name: ",opensearch_temp_index_name)
-    if not opensearch_client.indices.exists(index=opensearch_temp_index_name):
-        opensearch_client.indices.create(index=opensearch_temp_index_name, body=OPENSEARCH_VIDEO_FRAME_SIMILAIRTY_INDEX_MAPPING)
+    backend = similarity_backend.create_backend(VIDEO_FRAME_SIMILARITY_BACKEND, 
+                    opensearch_client=opensearch_client, 
+                    index_name=opensearch_temp_index_name, 
+                    index_mapping=OPENSEARCH_VIDEO_FRAME_SIMILAIRTY_INDEX_MAPPING)
+    print("similarity backend: ", backend.name)
+    backend.open()
 
     # Read image frames from S3
     s3_bucket = task["MetaData"]["VideoFrameS3"]["S3Bucket"]
@@ -72,7 +97,8 @@ def lambda_handler(event, context):
     paginator = s3.get_paginator('list_objects_v2')
     page_iterator = paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix)
 
-    prev_ts, prev_vector, total_sampled = start_ts, None, 0
+    # List the chunk's frames, in timestamp order
+    frames = []
     for page in page_iterator:
         if 'Contents' in page:
             for obj in page['Contents']:
@@ -85,98 +111,108 @@ def lambda_handler(event, context):
                     cur_ts = float(obj_key.replace(".jpg","").split('_')[-1])
                     if cur_ts <= start_ts or cur_ts > end_ts:
                         continue
-
-                    # Get image base64 str
-                    response = s3.get_object(Bucket=s3_bucket, Key=obj_key)
-                    image_data = response['Body'].read()
-                    base64_encoded_image = base64.b64encode(image_data).decode('utf-8')
-
-                    if base64_encoded_image:
-                        # similarity check: compare with previous image
-                        cur_vector = get_mm_vector(base64_encoded_image)
-                        score = similarity_check(task_id, prev_ts, prev_vector, cur_ts, cur_vector, opensearch_temp_index_name)
-                        if score is not None and score > OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_THRESHOLD:
-                            # Delete image on S3
-                            s3.delete_object(Bucket=s3_bucket, Key=obj_key)
-
-                            # Delete from DB video_frame table
-                            frame_id = f'{task_id}_{cur_ts}'
-                            response = utils.dynamodb_delete_by_id(DYNAMO_VIDEO_FRAME_TABLE, frame_id, task_id)
-
-                        else:
-                            # set current image as prev
-                            prev_vector = cur_vector
-                            prev_ts = cur_ts
-
-                            total_sampled += 1
-                            
-                            # update frame in db: include similarity score
-                            if score:
-                                response = utils.update_item_with_similarity_score(DYNAMO_VIDEO_FRAME_TABLE, f'{task_id}_{cur_ts}', task_id, score)
-
+                    frames.append((cur_ts, obj_key))
                 except Exception as e:
                     print(e)
+    frames.sort()
 
-    # update video_task table
-    try:
-        # Get task from DB
-        task_db = utils.dynamodb_get_by_id(DYNAMO_VIDEO_TASK_TABLE, task_id)
-        sampled = float(task_db["MetaData"]["VideoFrameS3"]["TotalFramesSampled"])
-        task_db["MetaData"]["VideoFrameS3"]["TotalFramesSampled"] = sampled + float(total_sampled)
-        # Update DB
-        utils.dynamodb_table_upsert(DYNAMO_VIDEO_TASK_TABLE, task_db)
-    except Exception as ex:
-        print(ex)
-                
-    # Delete temp index
-    try:
-        opensearch_client.indices.delete(index=opensearch_temp_index_name)
-    except Exception as ex:
-        print(ex)
+    # Prefetch: read images and compute embeddings in parallel. Decisions below stay sequential.
+    embedding_cache.reset_counters()
+    with ThreadPoolExecutor(max_workers=VIDEO_FRAME_DEDUP_CONCURRENCY) as executor:
+        results = list(executor.map(lambda f: fetch_frame_vector(s3_bucket, f[1]), frames))
+    print("Embedding cache:", embedding_cache.get_counters())
+
+    prev_ts, prev_vector, total_sampled = start_ts, None, 0
+    # Writes are applied after the walk: dropped frames [(ts, s3_key)] and scores of kept frames {frame_id: score}
+    dropped, scores = [], {}
+    for (cur_ts, obj_key), (image_found, cur_vector) in zip(frames, results):
+        try:
+            if image_found:
+                # similarity check: compare with previous image
+                score = similarity_check(backend, task_id, prev_ts, prev_vector, cur_vector)
+                if score is not None and score > similarity_threshold:
+                    # Delete image on S3 and from DB video_frame table (after the walk)
+                    dropped.append((cur_ts, obj_key))
+
+                else:
+                    # set current image as prev
+                    prev_vector = cur_vector
+                    prev_ts = cur_ts
+
+                    total_sampled += 1
+                    
+                    # update frame in db: include similarity score (after the walk)
+                    if score:
+                        scores[f'{task_id}_{cur_ts}'] = score
+
+        except Exception as e:
+            print(e)
+
+    # Release backend (deletes the OpenSearch temp index) before the writes, which raise on failed deletes
+    backend.close()
+
+    # Apply writes in bulk. Deletes come first: a failure raises before the sampled counter is incremented
+    delete_frames(s3_bucket, task_id, dropped)
+    failed = utils.update_items_with_similarity_score(DYNAMO_VIDEO_FRAME_TABLE, task_id, scores, max_workers=VIDEO_FRAME_DEDUP_CONCURRENCY)
+    if failed > 0:
+        # Shot detection reads the scores, retried like the deletes (before the sampled counter is incremented)
+        raise utils.UnprocessedItemsError(f"{failed} of {len(scores)} frame similarity scores not written")
+
+    # update video_task table: chunks run concurrently, so increment the counter atomically
+    utils.dynamodb_task_update(DYNAMO_VIDEO_TASK_TABLE, task_id, add_values={"MetaData.VideoFrameS3.TotalFramesSampled": total_sampled})
     return event
 
         
-def similarity_check(task_id, pre_ts, pre_vector, cur_ts, cur_vector, opensearch_temp_index_name, input_text=None):
+def similarity_check(backend, task_id, pre_ts, pre_vector, cur_vector):
     if pre_vector is None or cur_vector is None:
-        return False
+        return None
 
     prev_doc_id = f'{task_id}_{pre_ts}'
 
-    # Store previous vector to DB
-    opensearch_client.index(index=opensearch_temp_index_name, id=prev_doc_id, body={"mm_embedding": pre_vector}, refresh=True)
-
-    # Apply similiarity search
-    query = {
-          "_source": False,
-          "query": {
-            "bool": {
-              "must": [
-                {
-                  "terms": {
-                    "_id": [prev_doc_id]
-                  }
-                },
-                {
-                  "knn": {
-                    "mm_embedding": {
-                      "vector": cur_vector,
-                      "k": 10
-                    }
-                  }
-                }
-              ]
-            }
-          }
-    }
-
-    response = opensearch_client.search(
-                index=opensearch_temp_index_name,
-                body=query
-            )    
-    score = None
-    if len(response["hits"]["hits"]) > 0:
-        score = response["hits"]["hits"][0]["_score"]
-    return score
+    # Store previous vector, then score the current vector against it
+    backend.add(prev_doc_id, pre_vector)
+    return backend.score(prev_doc_id, cur_vector)
+
+def delete_frames(s3_bucket, task_id, frames):
+    '''
+    frames: [(ts, s3_key)]. S3 DeleteObjects takes up to 1000 keys, DynamoDB deletes go in batches of 25.
+    Failed deletes raise UnprocessedItemsError, so the Map retries the chunk instead of keeping duplicate frames.
+    Rows are deleted before images: the retry finds the frames again by listing S3.
+    '''
+    utils.dynamodb_batch_delete(DYNAMO_VIDEO_FRAME_TABLE, [{"id": f"{task_id}_{ts}", "task_id": task_id} for ts, key in frames])
+
+    failed = 0
+    for i in range(0, len(frames), S3_DELETE_BATCH_SIZE):
+        batch = frames[i:i + S3_DELETE_BATCH_SIZE]
+        try:
+            response = s3.delete_objects(Bucket=s3_bucket, Delete={"Objects": [{"Key": key} for ts, key in batch], "Quiet": True})
+            for error in response.get("Errors", []):
+                print(f"Failed to delete {error.get('Key')}: {error.get('Message')}")
+                failed += 1
+        except Exception as ex:
+            print(ex)
+            failed += len(batch)
+    if failed > 0:
+        raise utils.UnprocessedItemsError(f"{failed} of {len(frames)} duplicate frame images not deleted from {s3_bucket}")
+
+def fetch_frame_vector(s3_bucket, obj_key):
+    # Returns (image found, embedding). The embedding is None when Bedrock fails.
+    try:
+        # Get image bytes
+        response = s3.get_object(Bucket=s3_bucket, Key=obj_key)
+        image_data = response['Body'].read()
+        if image_data:
+            return True, get_frame_vector(image_data)
+    except Exception as ex:
+        print(ex)
+    return False, None
+
+def get_frame_vector(image_data):
+    # Image-only embedding, looked up in the content-addressed cache first
+    embedding, cache_hit = embedding_cache.get_or_compute(BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID, 
+                                lambda: get_mm_vector(base64.b64encode(image_data).decode('utf-8')), 
+                                image_bytes=image_data)
+    return embedding
 
 def get_mm_vector(base64_encoded_image, input_text=None):
     request_body = {}
@@ -190,17 +226,27 @@ def get_mm_vector(base64_encoded_image, input_text=None):
     body = json.dumps(request_body)
     
     embedding = None
-    try:
-        response = bedrock.invoke_model(
-            body=body, 
-            modelId=BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID, 
-            accept="application/json", 
-            contentType="application/json"
-        )
-        
-        response_body = json.loads(response.get('body').read())
-        embedding = response_body.get("embedding")
-    except Exception as ex:
-        print(ex)
+    for attempt in range(BEDROCK_MAX_RETRIES + 1):
+        try:
+            response = bedrock.invoke_model(
+                body=body, 
+                modelId=BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID, 
+                accept="application/json", 
+                contentType="application/json"
+            )
+            
+            response_body = json.loads(response.get('body').read())
+            embedding = response_body.get("embedding")
+            break
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] in BEDROCK_THROTTLING_ERRORS and attempt < BEDROCK_MAX_RETRIES:
+                # Back off with full jitter so concurrent workers do not retry in lockstep
+                time.sleep(random.uniform(0, min(BEDROCK_RETRY_MAX_DELAY_S, BEDROCK_RETRY_BASE_DELAY_S * (2 ** attempt))))
+                continue
+            print(ex)
+            break
+        except Exception as ex:
+            print(ex)
+            break
 
     return embedding
\ No newline at end of file
@@ -0,0 +1,106 @@
+'''
+Similarity backends used by smart sampling dedup.
+1. memory: vectors are kept in the lambda process for the lifetime of a chunk (default)
+2. opensearch: vectors are stored in a temporary OpenSearch k-NN index (previous behaviour)
+
+Both backends return the score the OpenSearch temp index used to return, so the existing
+threshold (OPENSEARCH_INDEX_NAME_VIDEO_FRAME_SIMILAIRTY_THRESHOLD) keeps its meaning:
+  score = 1 (terms filter on _id) + 1 / (1 + squared L2 distance) (lucene l2 space)
+Higher score means more similar.
+'''
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def opensearch_l2_score(distance):
+    # Same scoring as the bool(terms + knn) query on a lucene/l2 index
+    return 1.0 + 1.0 / (1.0 + distance)
+
+def squared_l2(vector_a, vector_b):
+    if np is not None:
+        diff = np.asarray(vector_a, dtype=np.float32) - np.asarray(vector_b, dtype=np.float32)
+        return float(np.dot(diff, diff))
+    return sum((a - b) * (a - b) for a, b in zip(vector_a, vector_b))
+
+class InMemoryBackend:
+    name = "memory"
+
+    def __init__(self):
+        self.vectors = {}
+
+    def open(self):
+        pass
+
+    def add(self, doc_id, vector):
+        self.vectors[doc_id] = vector
+
+    def score(self, doc_id, vector):
+        prev_vector = self.vectors.get(doc_id)
+        if prev_vector is None or vector is None:
+            return None
+        return opensearch_l2_score(squared_l2(prev_vector, vector))
+
+    def close(self):
+        self.vectors = {}
+
+class OpenSearchBackend:
+    name = "opensearch"
+
+    def __init__(self, opensearch_client, index_name, index_mapping):
+        self.client = opensearch_client
+        self.index_name = index_name
+        self.index_mapping = index_mapping
+
+    def open(self):
+        # Create similiarity check index
+        if not self.client.indices.exists(index=self.index_name):
+            self.client.indices.create(index=self.index_name, body=self.index_mapping)
+
+    def add(self, doc_id, vector):
+        self.client.index(index=self.index_name, id=doc_id, body={"mm_embedding": vector}, refresh=True)
+
+    def score(self, doc_id, vector):
+        if vector is None:
+            return None
+        # Apply similiarity search
+        query = {
+              "_source": False,
+              "query": {
+                "bool": {
+                  "must": [
+                    {
+                      "terms": {
+                        "_id": [doc_id]
+                      }
+                    },
+                    {
+                      "knn": {
+                        "mm_embedding": {
+                          "vector": vector,
+                          "k": 10
+                        }
+                      }
+                    }
+                  ]
+                }
+              }
+        }
+        response = self.client.search(index=self.index_name, body=query)
+        if len(response["hits"]["hits"]) > 0:
+            return response["hits"]["hits"][0]["_score"]
+        return None
+
+    def close(self):
+        # Delete temp index
+        try:
+            self.client.indices.delete(index=self.index_name)
+        except Exception as ex:
+            print(ex)
+
+def create_backend(name, opensearch_client=None, index_name=None, index_mapping=None):
+    if name == OpenSearchBackend.name:
+        return OpenSearchBackend(opensearch_client, index_name, index_mapping)
+    if name != InMemoryBackend.name:
+        print(f"Unknown similarity backend {name}, fall back to {InMemoryBackend.name}")
+    return InMemoryBackend()
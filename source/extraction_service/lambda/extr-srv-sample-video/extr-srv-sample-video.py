@@ -4,12 +4,19 @@ import boto3
 import os
 import utils
 import base64
+from io import BytesIO
 from PIL import Image
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 
 VIDEO_SAMPLE_CHUNK_DURATION_S = float(os.environ.get("VIDEO_SAMPLE_CHUNK_DURATION_S", 600)) # default to 10 minutes
 VIDEO_SAMPLE_S3_BUCKET = os.environ.get("VIDEO_SAMPLE_S3_BUCKET")
 VIDEO_SAMPLE_S3_PREFIX = os.environ.get("VIDEO_SAMPLE_S3_PREFIX")
 VIDEO_SAMPLE_FILE_PREFIX = os.environ.get("VIDEO_SAMPLE_FILE_PREFIX")
+VIDEO_SAMPLE_DECODE_MODE = os.environ.get("VIDEO_SAMPLE_DECODE_MODE", "single_pass") # single_pass | seek
+VIDEO_SAMPLE_UPLOAD_THREADS = int(os.environ.get("VIDEO_SAMPLE_UPLOAD_THREADS", 8))
+VIDEO_SAMPLE_UPLOAD_QUEUE_SIZE = int(os.environ.get("VIDEO_SAMPLE_UPLOAD_QUEUE_SIZE", 32)) # Max encoded frames held in memory waiting for upload
 
 DYNAMO_VIDEO_TASK_TABLE = os.environ.get("DYNAMO_VIDEO_TASK_TABLE")
 DYNAMO_VIDEO_FRAME_TABLE = os.environ.get("DYNAMO_VIDEO_FRAME_TABLE")
@@ -17,7 +24,7 @@ DYNAMO_VIDEO_FRAME_TABLE = os.environ.get("DYNAMO_VIDEO_FRAME_TABLE")
 IMAGE_MAX_WIDTH = 2048
 IMAGE_MAX_HEIGHT = 2048
 
-s3 = boto3.client('s3')
+s3 = boto3.client('s3', config=Config(max_pool_connections=max(10, VIDEO_SAMPLE_UPLOAD_THREADS)))
 
 local_path = '/tmp/'
 
@@ -48,17 +55,18 @@ def lambda_handler(event, context):
     # Create image frames
     resolution = task["MetaData"]["VideoMetaData"].get("Resolution")
     width, height = None, None
-    if resolution is None or len(resolution) == 0:
+    if resolution is not None and len(resolution) == 2:
         width = float(resolution[0])
         height = float(resolution[1])
-    need_resize = width is None or width > IMAGE_MAX_WIDTH or height is None or resolution[1] > IMAGE_MAX_HEIGHT
+    need_resize = width is None or width > IMAGE_MAX_WIDTH or height is None or height > IMAGE_MAX_HEIGHT
     frames = sample_video_at_timestamps(video_clip, timestamps, task_id, need_resize, start_ts)
 
     # Add to video_frame table
     for f in frames:
         f["task_id"] = task_id
         f["id"] = f'{task_id}_{f["timestamp"]}'
-        utils.dynamodb_table_upsert(DYNAMO_VIDEO_FRAME_TABLE, document=f)
+    # Raises UnprocessedItemsError when frames are not written, the Map retries the chunk
+    utils.dynamodb_batch_put(DYNAMO_VIDEO_FRAME_TABLE, frames)
     return event
 
 def generate_sample_timestamps(setting, duration, sample_start_s, sample_end_s):
@@ -77,10 +85,7 @@ def generate_sample_timestamps(setting, duration, sample_start_s, sample_end_s):
 
     return timestamps
 
-def resize_if_large(file_path):
-    # Open the image file
-    image = Image.open(file_path)
-    
+def resize_if_large(image):
     # Get the current dimensions of the image
     width, height = image.size
     
@@ -92,56 +97,98 @@ def resize_if_large(file_path):
         new_height = int(height * ratio)
         
         # Resize the image
-        resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Save the resized image back to the same file path
-        resized_image.save(file_path)
-    else:
-        print(f"Image does not need resizing. Width: {width}, height: {height}")
-        
-def sample_video_at_timestamps(video_clip, timestamps, task_id, need_resize, sample_start_s):
-    # Save the sampled frame as an image
-    result = []
-    prev_ts = sample_start_s
+        return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    print(f"Image does not need resizing. Width: {width}, height: {height}")
+    return image
+
+def encode_frame(frame, need_resize):
+    # Convert the decoded RGB frame to JPEG bytes in memory
+    image = Image.fromarray(frame)
+    if need_resize:
+        image = resize_if_large(image)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def decode_frames_single_pass(video_clip, timestamps):
+    '''
+    Walk the chunk once in timestamp order using a single ffmpeg pipe.
+    Frames between two sample points are skipped on the pipe instead of re-seeking from the nearest keyframe.
+    '''
+    reader = video_clip.reader
+    cur_pos, frame = None, None
     for ts in timestamps:
-        # save frame to local disk
-        output_file = f'{VIDEO_SAMPLE_FILE_PREFIX}{ts["ts"]}.jpg'
-        output_path = f'{local_path}{output_file}'
-        video_clip.save_frame(output_path, ts["ts"])
-        if need_resize:
-            resize_if_large(output_path)
-
-        # upload to s3
-        upload_file_key = f'tasks/{task_id}/{VIDEO_SAMPLE_S3_PREFIX}/{output_file}'
-        s3.upload_file(output_path, VIDEO_SAMPLE_S3_BUCKET, upload_file_key)
-        
-        # include image to result
-        frame = {
-            "s3_bucket": VIDEO_SAMPLE_S3_BUCKET,
-            "s3_key": upload_file_key,
-            "timestamp": ts["ts"],
-            "prev_timestamp": prev_ts
-        }
-        result.append(frame)
-        prev_ts = ts["ts"]
-
-        # delete image from local
+        # Same frame index calculation as moviepy FFMPEG_VideoReader.get_frame
+        pos = int(reader.fps * ts["ts"] + 0.00001) + 1
+        if cur_pos is None:
+            # Seek once to the first sample point of the chunk
+            reader.initialize(ts["ts"])
+            frame = reader.read_frame()
+            cur_pos = pos
+        elif pos > cur_pos:
+            reader.skip_frames(pos - cur_pos - 1)
+            frame = reader.read_frame()
+            cur_pos = pos
+        # pos == cur_pos: the timestamp maps to the frame already decoded
+        reader.pos = cur_pos
+        yield ts["ts"], frame
+
+def decode_frames_seek(video_clip, timestamps):
+    # Legacy mode: let moviepy seek for every timestamp
+    for ts in timestamps:
+        yield ts["ts"], video_clip.get_frame(ts["ts"])
+
+def upload_frames(upload_queue, errors):
+    # Consumer: upload encoded frames from memory until the end-of-stream marker
+    while True:
+        item = upload_queue.get()
+        if item is None:
+            break
+        s3_key, image_bytes = item
         try:
-            os.remove(output_path)
+            s3.put_object(Bucket=VIDEO_SAMPLE_S3_BUCKET, Key=s3_key, Body=image_bytes, ContentType="image/jpeg")
         except Exception as ex:
-            print(f"Failed to delete {output_path}", ex)
+            print(f"Failed to upload {s3_key}", ex)
+            errors.append(ex)
+
+def sample_video_at_timestamps(video_clip, timestamps, task_id, need_resize, sample_start_s):
+    result, errors = [], []
+    prev_ts = sample_start_s
+    if VIDEO_SAMPLE_DECODE_MODE == "seek":
+        frames = decode_frames_seek(video_clip, timestamps)
+    else:
+        frames = decode_frames_single_pass(video_clip, timestamps)
+
+    # Producer: decode and encode in this thread, upload concurrently from a bounded queue
+    upload_queue = Queue(maxsize=VIDEO_SAMPLE_UPLOAD_QUEUE_SIZE)
+    with ThreadPoolExecutor(max_workers=VIDEO_SAMPLE_UPLOAD_THREADS) as executor:
+        for _ in range(VIDEO_SAMPLE_UPLOAD_THREADS):
+            executor.submit(upload_frames, upload_queue, errors)
+        try:
+            for ts, image in frames:
+                # encode frame in memory
+                output_file = f'{VIDEO_SAMPLE_FILE_PREFIX}{ts}.jpg'
+                image_bytes = encode_frame(image, need_resize)
+
+                # queue for upload, blocks while the uploaders are behind
+                upload_file_key = f'tasks/{task_id}/{VIDEO_SAMPLE_S3_PREFIX}/{output_file}'
+                upload_queue.put((upload_file_key, image_bytes))
+
+                # include image to result, in decode order
+                frame = {
+                    "s3_bucket": VIDEO_SAMPLE_S3_BUCKET,
+                    "s3_key": upload_file_key,
+                    "timestamp": ts,
+                    "prev_timestamp": prev_ts
+                }
+                result.append(frame)
+                prev_ts = ts
+        finally:
+            for _ in range(VIDEO_SAMPLE_UPLOAD_THREADS):
+                upload_queue.put(None)
+
+    if len(errors) > 0:
+        raise errors[0]
 
     return result
-    
-    # construct metadata
-    metadata = {
-        'Size': os.path.getsize(file_path),
-        'Resolution': video_clip.size,
-        'Duration': video_clip.duration,
-        'Fps': video_clip.fps,
-        'NameFormat': file_path.split('.')[-1],
-        'ThumbnailS3Bucket': thumbnail_s3_bucket,
-        'ThumbnailS3Key': thumbnail_s3_key,
-    }
-
-    return metadata
@@ -1,7 +1,14 @@
 import boto3
 import numbers,decimal
+import time, random
 from boto3.dynamodb.types import TypeDeserializer
 
+DYNAMO_BATCH_WRITE_SIZE = 25 # BatchWriteItem limit
+
+class UnprocessedItemsError(Exception):
+    # Items still unprocessed once the batch write retries are used up
+    pass
+
 dynamodb = boto3.resource('dynamodb')
 
 def dynamodb_table_upsert(table_name, document):
@@ -27,6 +34,37 @@ def dynamodb_get_by_id(table_name, id, key_name="Id"):
         return None
     return None
 
+def dynamodb_batch_put(table_name, documents, max_retries=8, base_delay_s=0.05):
+    """
+    Write items in BatchWriteItem requests of up to 25 items.
+    Unprocessed items are retried with exponential backoff, UnprocessedItemsError is raised for items left after max_retries.
+    """
+    requests = [{"PutRequest": {"Item": convert_item_to_dynamo_format(d)}} for d in documents]
+    return dynamodb_batch_write_requests(table_name, requests, max_retries, base_delay_s)
+
+def dynamodb_batch_write_requests(table_name, requests, max_retries=8, base_delay_s=0.05):
+    # Same request shape as Table.batch_writer, plus backoff between unprocessed item retries
+    client = dynamodb.meta.client
+    unprocessed_total = 0
+    for i in range(0, len(requests), DYNAMO_BATCH_WRITE_SIZE):
+        pending = requests[i:i + DYNAMO_BATCH_WRITE_SIZE]
+        retries = 0
+        while pending:
+            response = client.batch_write_item(RequestItems={table_name: pending})
+            pending = response.get("UnprocessedItems", {}).get(table_name, [])
+            if not pending:
+                break
+            if retries >= max_retries:
+                print(f"dynamodb_batch_write_requests: {len(pending)} unprocessed items left in {table_name}")
+                unprocessed_total += len(pending)
+                break
+            time.sleep(min(base_delay_s * (2 ** retries), 5) * (0.5 + random.random() / 2))
+            retries += 1
+    if unprocessed_total > 0:
+        # Raised after all chunks are sent, the state machine retries the invocation (writes are idempotent)
+        raise UnprocessedItemsError(f"{unprocessed_total} of {len(requests)} items not written to {table_name}")
+    return unprocessed_total
+
 def convert_to_dynamo_format(item):
     """
     Recursively convert a DynamoDB item to a JSON serializable format.
@@ -42,6 +80,17 @@ def convert_to_dynamo_format(item):
     else:
         return item
 
+def convert_item_to_dynamo_format(item):
+    # Flat records (e.g. frames) only need their top-level floats converted
+    result = {}
+    for k, v in item.items():
+        if isinstance(v, float):
+            result[k] = decimal.Decimal(str(v))
+        elif isinstance(v, (dict, list)):
+            result[k] = convert_to_dynamo_format(v)
+        else:
+            result[k] = v
+    return result
 
 def convert_decimal_to_float(obj):
     if isinstance(obj, list):
@@ -8,6 +8,8 @@ from opensearchpy import OpenSearch
 import re
 from urllib.parse import urlparse
 import utils
+import embedding_client
+import vector_encoding
 
 OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME = os.environ.get("OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME")
 OPENSEARCH_DOMAIN_ENDPOINT = os.environ.get("OPENSEARCH_DOMAIN_ENDPOINT")
@@ -16,7 +18,6 @@ OPENSEARCH_DEFAULT_K = os.environ.get("OPENSEARCH_DEFAULT_K", 10)
 S3_PRESIGNED_URL_EXPIRY_S = os.environ.get("S3_PRESIGNED_URL_EXPIRY_S", 3600) # Default 1 hour 
 
 DYNAMO_VIDEO_TASK_TABLE = os.environ.get("DYNAMO_VIDEO_TASK_TABLE")
-LAMBDA_FUNCTION_ARN_EMBEDDING = os.environ.get("LAMBDA_FUNCTION_ARN_EMBEDDING")
 OPENSEARCH_SCORE_DEFAULT_THRESHOLD = 0.5
 
 opensearch_client = OpenSearch(
@@ -28,7 +29,6 @@ opensearch_client = OpenSearch(
         ssl_show_warn=False,
     )
 s3 = boto3.client('s3')
-lambda_client = boto3.client('lambda')
 
 def lambda_handler(event, context):
     search_text = event.get("SearchText", "")
@@ -116,18 +116,12 @@ def lambda_handler(event, context):
 
 def search_text_embedding(input_text, task_ids, score_threshold, opensearch_indices):
     # generate text embedding
-    response = lambda_client.invoke(
-        FunctionName=LAMBDA_FUNCTION_ARN_EMBEDDING,  
-        InvocationType='RequestResponse',
-        Payload=json.dumps({
-                "embedding_type": "txt",
-                "text_input": input_text
-            }
-        )
-    )
-    response_payload = json.loads(response['Payload'].read())
-    embedding = response_payload.get("body")
-
+    embedding = get_vector({
+            "embedding_type": "txt",
+            "text_input": input_text
+        })
+    if embedding is None:
+        return None
 
     # Search DB
     query = {
@@ -204,13 +198,7 @@ def search_mm_embedding(input_text, input_image_base64, score_threshold, task_id
         request_body["image_input"] = input_image_base64
     
 
-    response = lambda_client.invoke(
-        FunctionName=LAMBDA_FUNCTION_ARN_EMBEDDING,  
-        InvocationType='RequestResponse',
-        Payload=json.dumps(request_body)
-    )
-    response_payload = json.loads(response['Payload'].read())
-    embedding = response_payload.get("body")
+    embedding = get_vector(request_body)
 
     if embedding is None:
         return None
@@ -248,6 +236,11 @@ def search_mm_embedding(input_text, input_image_base64, score_threshold, task_id
             )
     return format_frame_result(response, score_threshold)
 
+def get_vector(request_body):
+    # Embedding client layer: Bedrock in process, or the embedding lambda (EMBEDDING_TRANSPORT).
+    # Encoded like the indexed frame vectors (OPENSEARCH_VECTOR_ENCODING)
+    return vector_encoding.encode_vector(embedding_client.get_vector(request_body))
+
 def format_frame_result(response, score_threshold):
     result = {}
     for r in response["hits"]["hits"]:
@@ -1,13 +1,15 @@
 '''
 1. Read Transcribe transcription and subtitle from s3
 2. Update DB
-3. Start extraction step functions workflow
+3. Save subtitle interval index to S3
+4. Start extraction step functions workflow
 '''
 import json
 import boto3
 import os
 import utils
 import re
+import subtitle_index
 
 SQS_URL = os.environ.get("SQS_URL")
 DYNAMO_VIDEO_TASK_TABLE = os.environ.get("DYNAMO_VIDEO_TASK_TABLE")
@@ -53,14 +55,12 @@ def lambda_handler(event, context):
     
     if doc is not None:
         # Update video task status
-        try:
-            doc["Status"] = "transcription_completed"
-            doc["Id"] = task_id
-        
-            # update DB: video_task
-            utils.dynamodb_table_upsert(DYNAMO_VIDEO_TASK_TABLE, doc)
-        except Exception as ex:
-            print('Failed to update video task status',ex)
+        doc["Status"] = "transcription_completed"
+        doc["Id"] = task_id
+
+        # update DB: video_task
+        if utils.dynamodb_task_update_status(DYNAMO_VIDEO_TASK_TABLE, task_id, doc["Status"]) is None:
+            print('Failed to update video task status')
 
         # Get transcription
         transcripts = []
@@ -79,6 +79,12 @@ def lambda_handler(event, context):
             utils.dynamodb_table_upsert(DYNAMO_VIDEO_TRANS_TABLE, trans_doc)
         except Exception as ex:
             print('Failed to update transcription to DB',ex)
+
+        # Sorted subtitle index used by image extraction to align frames with subtitles
+        try:
+            subtitle_index.save(s3_bucket, task_id, subtitle_data)
+        except Exception as ex:
+            print('Failed to save subtitle index',ex)
     
     doc = utils.convert_decimal_to_float(doc)
     response = sqs.send_message(QueueUrl=SQS_URL, MessageBody=json.dumps(doc))
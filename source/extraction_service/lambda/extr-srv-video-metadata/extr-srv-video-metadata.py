@@ -66,13 +66,21 @@ def lambda_handler(event, context):
     frame_metadata["S3Prefix"] = f'tasks/{task_id}/{VIDEO_SAMPLE_S3_PREFIX}'
     task["MetaData"]["VideoFrameS3"] = frame_metadata
 
+    # Detector cache counters, incremented by image extraction
+    task["MetaData"]["DetectorCache"] = {"Hits": 0, "Misses": 0}
+
     task["Status"] = "processing"
 
-    try:
-        # update video_task index
+    # update video_task index: only the fields set here, TotalFramesSampled is incremented by the dedup chunks
+    if task_db and "MetaData" in task_db:
+        utils.dynamodb_task_update(DYNAMO_VIDEO_TASK_TABLE, task_id, set_values={
+            "MetaData.VideoMetaData": task["MetaData"]["VideoMetaData"],
+            "MetaData.VideoFrameS3": task["MetaData"]["VideoFrameS3"],
+            "MetaData.DetectorCache": task["MetaData"]["DetectorCache"],
+            "Status": task["Status"]
+        })
+    else:
         utils.dynamodb_table_upsert(DYNAMO_VIDEO_TASK_TABLE, document=task)
-    except Exception as ex:
-        print(ex)
         
     # Create array for chunk iteration
     chunks = []
@@ -0,0 +1,107 @@
+'''
+Content-addressed embedding cache
+1. Key: model id + SHA-256 of the image bytes + SHA-256 of the input text
+2. Vectors are stored in S3 as raw float32 (4 KB for a 1024 dimension vector)
+3. Recently used vectors are also kept in the lambda container
+'''
+import os
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_S3_BUCKET = os.environ.get("EMBEDDING_CACHE_S3_BUCKET")
+EMBEDDING_CACHE_S3_PREFIX = os.environ.get("EMBEDDING_CACHE_S3_PREFIX", "embedding_cache")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.environ.get("EMBEDDING_CACHE_MEMORY_SIZE", 512)) # vectors kept in the container
+
+s3 = boto3.client('s3', config=Config(max_pool_connections=25))
+
+memory_cache = OrderedDict()
+counters = {"hit": 0, "miss": 0, "memory_hit": 0, "error": 0}
+lock = threading.Lock()
+
+def is_enabled():
+    return EMBEDDING_CACHE_ENABLED and EMBEDDING_CACHE_S3_BUCKET is not None and len(EMBEDDING_CACHE_S3_BUCKET) > 0
+
+def cache_key(model_id, image_bytes=None, text=None, variant=None):
+    image_hash = hashlib.sha256(image_bytes).hexdigest() if image_bytes else "none"
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest() if text else "none"
+    model = model_id.replace(":", "_")
+    if variant:
+        model += f"_{variant}"
+    return f"{EMBEDDING_CACHE_S3_PREFIX}/{model}/{image_hash[0:2]}/{image_hash}_{text_hash}.f32"
+
+def count(name):
+    with lock:
+        counters[name] += 1
+
+def get_counters():
+    with lock:
+        return dict(counters)
+
+def reset_counters():
+    with lock:
+        for name in counters:
+            counters[name] = 0
+
+def get(key):
+    with lock:
+        if key in memory_cache:
+            memory_cache.move_to_end(key)
+            counters["hit"] += 1
+            counters["memory_hit"] += 1
+            return list(memory_cache[key])
+    try:
+        response = s3.get_object(Bucket=EMBEDDING_CACHE_S3_BUCKET, Key=key)
+        vector = array('f')
+        vector.frombytes(response['Body'].read())
+        remember(key, vector)
+        count("hit")
+        return vector.tolist()
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] not in ["NoSuchKey", "404"]:
+            print(f"embedding cache get {key}: {ex}")
+            count("error")
+    except Exception as ex:
+        print(f"embedding cache get {key}: {ex}")
+        count("error")
+    count("miss")
+    return None
+
+def put(key, vector):
+    vector = array('f', vector)
+    remember(key, vector)
+    try:
+        s3.put_object(Bucket=EMBEDDING_CACHE_S3_BUCKET, Key=key, Body=vector.tobytes(), ContentType="application/octet-stream")
+    except Exception as ex:
+        print(f"embedding cache put {key}: {ex}")
+        count("error")
+
+def remember(key, vector):
+    with lock:
+        memory_cache[key] = vector
+        memory_cache.move_to_end(key)
+        while len(memory_cache) > EMBEDDING_CACHE_MEMORY_SIZE:
+            memory_cache.popitem(last=False)
+
+def get_or_compute(model_id, compute, image_bytes=None, text=None, variant=None):
+    '''
+    Return the cached embedding, or call compute() and cache its result.
+    Returns (embedding, cache hit)
+    '''
+    if not is_enabled():
+        return compute(), False
+
+    key = cache_key(model_id, image_bytes, text, variant)
+    embedding = get(key)
+    if embedding is not None:
+        return embedding, True
+
+    embedding = compute()
+    if embedding:
+        put(key, embedding)
+    return embedding, False
@@ -0,0 +1,170 @@
+'''
+Embedding client, shared through the embedding client layer
+1. Transport "bedrock": Titan embedding models are called in process, with a pooled keep-alive
+   Bedrock client, the shared rate limiter (throttling and transient errors retried) and the embedding cache
+2. Transport "lambda": batch request to extr-srv-generate-embedding, which runs the same code
+3. Inputs use the batch request shape: {"embedding_type": "txt" | "mm", "text_input", "image_input" (base64)}
+'''
+import json
+import os
+import base64
+import boto3
+import embedding_cache
+import rate_limiter
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+
+EMBEDDING_TRANSPORT = os.environ.get("EMBEDDING_TRANSPORT", "bedrock") # bedrock | lambda
+LAMBDA_FUNCTION_ARN_EMBEDDING = os.environ.get("LAMBDA_FUNCTION_ARN_EMBEDDING")
+
+BEDROCK_REGION = os.environ.get("BEDROCK_REGION", os.environ.get('AWS_REGION'))
+BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID = os.environ.get("BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID")
+BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID = os.environ.get("BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID")
+# Account-wide calls per second, per embedding model
+BEDROCK_EMBEDDING_RATE_LIMIT = float(os.environ.get("BEDROCK_EMBEDDING_RATE_LIMIT", 30))
+# Bedrock calls in flight for one batch
+EMBEDDING_BATCH_CONCURRENCY = max(1, int(os.environ.get("EMBEDDING_BATCH_CONCURRENCY", 8)))
+
+# Created once per container and reused across invocations.
+# Throttling is retried by the rate limiter (AIMD), so botocore does not retry it on its own
+bedrock = boto3.client('bedrock-runtime', region_name=BEDROCK_REGION, config=Config(
+    retries={"max_attempts": 1, "mode": "standard"},
+    max_pool_connections=max(10, EMBEDDING_BATCH_CONCURRENCY * 2),
+    tcp_keepalive=True
+))
+lambda_client = boto3.client('lambda')
+
+def get_vector(item):
+    return get_vectors([item])[0]
+
+def get_vectors(inputs):
+    '''
+    Embed a list of inputs, returns one vector (list of floats) per input, None for inputs that failed
+    '''
+    if len(inputs) == 0:
+        return []
+    if EMBEDDING_TRANSPORT == "lambda":
+        results = invoke_embedding_lambda(inputs)
+    else:
+        results = embed_batch(inputs)
+
+    vectors = []
+    for result in results:
+        if result.get("embedding") is None:
+            print("Embedding failed:", result.get("error"))
+        vectors.append(result.get("embedding"))
+    return vectors
+
+def invoke_embedding_lambda(inputs):
+    # Remote transport, vectors come back as base64 float32 (a quarter of the JSON size)
+    response = lambda_client.invoke(
+        FunctionName=LAMBDA_FUNCTION_ARN_EMBEDDING,
+        InvocationType='RequestResponse',
+        Payload=json.dumps({"inputs": inputs, "output_format": "base64"})
+    )
+    response_payload = json.loads(response['Payload'].read())
+    results = response_payload.get("body")
+    if not isinstance(results, list):
+        return [{"error": f"Embedding request failed: {results}"}] * len(inputs)
+
+    for result in results:
+        if result.get("embedding") is not None:
+            result["embedding"] = decode_vector(result["embedding"])
+    return results
+
+def embed_batch(inputs, output_format="json"):
+    # In process: one result per input, in order: {"embedding", "cache_hit"} or {"error"}
+    if len(inputs) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(inputs), EMBEDDING_BATCH_CONCURRENCY)) as executor:
+        return list(executor.map(lambda item: embed_input(item, output_format), inputs))
+
+def embed_input(item, output_format="json"):
+    # One input of a batch, errors are reported per input
+    if not isinstance(item, dict):
+        return {"error": "Invalid input"}
+    embedding_type = item.get("embedding_type", "txt")
+    text_input = item.get("text_input")
+    image_input = item.get("image_input")
+    if embedding_type not in ["txt", "mm"] or (not text_input and not image_input) or (embedding_type == "txt" and not text_input):
+        return {"error": "Invalid input"}
+
+    try:
+        embedding, cache_hit = get_embedding(embedding_type, text_input, image_input)
+    except Exception as ex:
+        print(ex)
+        return {"error": str(ex)}
+    if embedding is None:
+        return {"error": "No embedding returned"}
+
+    if output_format == "base64":
+        embedding = encode_vector(embedding)
+    return {"embedding": embedding, "cache_hit": cache_hit}
+
+def encode_vector(vector):
+    # base64 of the little-endian float32 values
+    return base64.b64encode(array('f', vector).tobytes()).decode('utf-8')
+
+def decode_vector(data):
+    vector = array('f')
+    vector.frombytes(base64.b64decode(data))
+    return vector.tolist()
+
+def get_embedding(embedding_type, text_input, image_input):
+    # Returns (embedding, cache hit), Bedrock errors are raised
+    embedding, cache_hit = None, False
+    if embedding_type == "txt":
+        embedding, cache_hit = embedding_cache.get_or_compute(BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID,
+                                    lambda: get_text_embedding(text_input),
+                                    text=text_input, variant="1024_normalized")
+    elif embedding_type == "mm":
+        # Hash the decoded image bytes, so the key matches callers that embed raw frames
+        image_bytes = None
+        try:
+            image_bytes = base64.b64decode(image_input) if image_input else None
+        except Exception as ex:
+            print(ex)
+        embedding, cache_hit = embedding_cache.get_or_compute(BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID,
+                                    lambda: get_mm_embedding(text_input, image_input),
+                                    image_bytes=image_bytes, text=text_input if text_input else None)
+    return embedding, cache_hit
+
+def bedrock_limiter(model_id):
+    return rate_limiter.get_limiter(f"bedrock:{BEDROCK_REGION}:{model_id}", BEDROCK_EMBEDDING_RATE_LIMIT)
+
+def get_text_embedding(text_input):
+    body = json.dumps({
+            "inputText": f"{text_input}",
+            "dimensions": 1024,
+            "normalize": True
+        })
+    response = bedrock_limiter(BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID).call(bedrock.invoke_model,
+        body=body,
+        modelId=BEDROCK_TITAN_TEXT_EMBEDDING_MODEL_ID,
+        accept="application/json",
+        contentType="application/json"
+    )
+
+    response_body = json.loads(response.get("body").read())
+    return response_body.get("embedding")
+
+def get_mm_embedding(text_input, image_input):
+    request_body = {}
+    if text_input is not None and len(text_input) > 0:
+        request_body["inputText"] = text_input
+
+    if image_input:
+        request_body["inputImage"] = image_input
+
+    body = json.dumps(request_body)
+
+    response = bedrock_limiter(BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID).call(bedrock.invoke_model,
+        body=body,
+        modelId=BEDROCK_TITAN_MULTIMODEL_EMBEDDING_MODEL_ID,
+        accept="application/json",
+        contentType="application/json"
+    )
+
+    response_body = json.loads(response.get('body').read())
+    return response_body.get("embedding")
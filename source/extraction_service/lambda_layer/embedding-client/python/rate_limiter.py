@@ -0,0 +1,193 @@
+'''
+Account-wide rate limiter for Rekognition and Bedrock calls
+1. Token bucket per API, shared by every lambda container through a DynamoDB counter per second
+   (Id = "<api>#<epoch second>"); containers lease a few tokens at a time
+2. AIMD: the shared rate is halved on ThrottlingException and increased by a step
+   while calls succeed, never above the configured rate
+3. Without RATE_LIMIT_TABLE the bucket is local to the container
+'''
+import os
+import time
+import random
+import threading
+import boto3
+from botocore.exceptions import ClientError
+
+RATE_LIMIT_TABLE = os.environ.get("RATE_LIMIT_TABLE")
+RATE_LIMIT_LEASE_SIZE = int(os.environ.get("RATE_LIMIT_LEASE_SIZE", 5)) # tokens taken per DynamoDB update
+RATE_LIMIT_DECREASE_FACTOR = 0.5
+RATE_LIMIT_DECREASE_COOLDOWN_S = 2 # one decrease per window, however many containers were throttled
+RATE_LIMIT_INCREASE_INTERVAL_S = 5
+RATE_LIMIT_MAX_ATTEMPTS = 8
+
+THROTTLING_ERRORS = ["ThrottlingException", "ProvisionedThroughputExceededException", "TooManyRequestsException", "ServiceQuotaExceededException"]
+# Retried without changing the rate
+TRANSIENT_ERRORS = ["InternalServerError", "InternalFailure", "ServiceUnavailable", "ServiceUnavailableException", "ModelNotReadyException"]
+
+dynamodb = boto3.client('dynamodb')
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+def error_code(ex):
+    return ex.response.get("Error", {}).get("Code") if isinstance(ex, ClientError) else None
+
+def is_throttling(ex):
+    return error_code(ex) in THROTTLING_ERRORS
+
+class RateLimiter:
+    def __init__(self, name, max_rate, min_rate=1, step=None, table_name=RATE_LIMIT_TABLE):
+        self.name = name
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.step = float(step) if step else max(1.0, self.max_rate / 10)
+        self.table_name = table_name
+        self.lock = threading.Lock()
+        self.rate = self.max_rate
+        self.rate_read_at = 0
+        self.increase_tried_at = time.time()
+        # Tokens leased for the current second
+        self.window = None
+        self.tokens = 0
+
+    def acquire(self):
+        # Block until a token is available. The lock only guards the local token count,
+        # the DynamoDB lease runs outside it so the other threads do not wait on the round trip
+        while True:
+            with self.lock:
+                window = int(time.time())
+                if self.window != window:
+                    self.window, self.tokens = window, 0
+                    if not self.table_name:
+                        # Local bucket, the whole rate belongs to this container, one refill per second
+                        self.tokens = int(max(1, self.rate))
+                if self.tokens > 0:
+                    self.tokens -= 1
+                    return
+
+            if self.table_name:
+                leased = self.lease(window)
+                if leased > 0:
+                    with self.lock:
+                        # One token is used by this call, the rest are kept unless the second is over
+                        if self.window == window:
+                            self.tokens += leased - 1
+                    return
+            # Bucket empty for this second
+            time.sleep(max(0.0, window + 1 - time.time()) + random.random() * 0.05)
+
+    def lease(self, window):
+        # Take a few tokens of the shared bucket for this second, 0 when it is empty
+        rate = self.current_rate()
+        size = int(max(1, min(RATE_LIMIT_LEASE_SIZE, rate // 10)))
+        try:
+            dynamodb.update_item(
+                TableName=self.table_name,
+                Key={"Id": {"S": f"{self.name}#{window}"}},
+                UpdateExpression="ADD #used :n SET #exp = :exp",
+                ConditionExpression="attribute_not_exists(#used) OR #used <= :max",
+                ExpressionAttributeNames={"#used": "Used", "#exp": "ExpiresAt"},
+                ExpressionAttributeValues={
+                    ":n": {"N": str(size)},
+                    ":max": {"N": str(int(max(1, rate)) - size)},
+                    ":exp": {"N": str(window + 300)},
+                },
+            )
+            return size
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return 0
+            print(f"rate limiter {self.name} lease: {ex}")
+        except Exception as ex:
+            print(f"rate limiter {self.name} lease: {ex}")
+        # Fail open, the service side throttling and AIMD still apply
+        return size
+
+    def current_rate(self):
+        # Shared rate, re-read at most once per second
+        now = time.time()
+        if not self.table_name or now - self.rate_read_at < 1:
+            return self.rate
+        self.rate_read_at = now
+        try:
+            response = dynamodb.get_item(TableName=self.table_name, Key={"Id": {"S": self.name}}, ConsistentRead=False)
+            if "Item" in response and "Rate" in response["Item"]:
+                self.rate = min(self.max_rate, max(self.min_rate, float(response["Item"]["Rate"]["N"])))
+            else:
+                self.rate = self.max_rate
+        except Exception as ex:
+            print(f"rate limiter {self.name} rate: {ex}")
+        return self.rate
+
+    def on_throttle(self):
+        # Multiplicative decrease
+        with self.lock:
+            new_rate = max(self.min_rate, self.rate * RATE_LIMIT_DECREASE_FACTOR)
+            self.rate = new_rate
+            self.tokens = 0
+        print(f"rate limiter {self.name}: throttled, rate {new_rate}")
+        self.update_rate(new_rate, RATE_LIMIT_DECREASE_COOLDOWN_S)
+
+    def on_success(self):
+        # Additive increase, tried at most once per interval by each container
+        now = time.time()
+        with self.lock:
+            if self.rate >= self.max_rate or now - self.increase_tried_at < RATE_LIMIT_INCREASE_INTERVAL_S:
+                return
+            self.increase_tried_at = now
+            new_rate = min(self.max_rate, self.rate + self.step)
+            self.rate = new_rate
+        self.update_rate(new_rate, RATE_LIMIT_INCREASE_INTERVAL_S)
+
+    def update_rate(self, new_rate, min_interval_s):
+        # Conditional write: only one container changes the shared rate per interval
+        if not self.table_name:
+            return
+        now = time.time()
+        try:
+            dynamodb.update_item(
+                TableName=self.table_name,
+                Key={"Id": {"S": self.name}},
+                UpdateExpression="SET #rate = :rate, #ts = :now",
+                ConditionExpression="attribute_not_exists(#ts) OR #ts < :since",
+                ExpressionAttributeNames={"#rate": "Rate", "#ts": "UpdatedAt"},
+                ExpressionAttributeValues={
+                    ":rate": {"N": str(round(new_rate, 3))},
+                    ":now": {"N": str(now)},
+                    ":since": {"N": str(now - min_interval_s)},
+                },
+            )
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                print(f"rate limiter {self.name} update rate: {ex}")
+        except Exception as ex:
+            print(f"rate limiter {self.name} update rate: {ex}")
+
+    def call(self, fn, *args, max_attempts=RATE_LIMIT_MAX_ATTEMPTS, **kwargs):
+        '''
+        Call fn under the rate limit, retrying throttling and transient service errors with backoff.
+        Other errors are raised to the caller.
+        '''
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = fn(*args, **kwargs)
+                self.on_success()
+                return result
+            except Exception as ex:
+                if is_throttling(ex):
+                    self.on_throttle()
+                elif error_code(ex) not in TRANSIENT_ERRORS:
+                    raise
+                attempt += 1
+                if attempt >= max_attempts:
+                    raise
+                # Full jitter
+                time.sleep(random.uniform(0, min(20, 0.5 * (2 ** attempt))))
+
+def get_limiter(name, max_rate, min_rate=1):
+    with limiters_lock:
+        if name not in limiters:
+            limiters[name] = RateLimiter(name, max_rate, min_rate)
+        return limiters[name]
@@ -0,0 +1,147 @@
+'''
+Frame vector save, shared by extr-srv-image-vector-save and extr-srv-frame-processor (frame-vector layer)
+Index frame documents (metadata and vectors) into the current OpenSearch frame index
+utils is the module of the function using the layer
+'''
+import json
+import boto3
+import os
+from opensearchpy import OpenSearch
+import base64
+from io import BytesIO
+import re
+import time
+import random
+from datetime import datetime
+import utils
+import index_rollover
+import vector_encoding
+from opensearchpy import OpenSearch, helpers
+from botocore.exceptions import ClientError
+
+OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME = os.environ.get("OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME")
+OPENSEARCH_DOMAIN_ENDPOINT = os.environ.get("OPENSEARCH_DOMAIN_ENDPOINT")
+OPENSEARCH_PORT = os.environ.get("OPENSEARCH_PORT")
+DYNAMO_VIDEO_TASK_TABLE = os.environ.get("DYNAMO_VIDEO_TASK_TABLE")
+
+# Bulk indexing: documents and bytes per bulk request, attempts for documents rejected with a retryable status
+OPENSEARCH_BULK_CHUNK_SIZE = int(os.environ.get("OPENSEARCH_BULK_CHUNK_SIZE", 500))
+OPENSEARCH_BULK_MAX_BYTES = int(os.environ.get("OPENSEARCH_BULK_MAX_BYTES", 10 * 1024 * 1024))
+OPENSEARCH_BULK_MAX_ATTEMPTS = int(os.environ.get("OPENSEARCH_BULK_MAX_ATTEMPTS", 4))
+OPENSEARCH_BULK_RETRY_STATUS = [429, 500, 502, 503, 504, "N/A"]
+
+class FrameIndexError(Exception):
+    # Frame documents still rejected after the bulk retries, retried by the workflow
+    pass
+
+opensearch_client = OpenSearch(
+        hosts=[{'host': OPENSEARCH_DOMAIN_ENDPOINT, 'port': OPENSEARCH_PORT}],
+        http_compress=True,
+        use_ssl=True,
+        verify_certs=True,
+        ssl_assert_hostname=False,
+        ssl_show_warn=False,
+    )
+
+# (task_id, index name) pairs already recorded in the task table by this container
+registered_indices = set()
+
+def save_documents(frame_docs):
+    # frame_docs: (task_id, frame_id, frame document) of one task, indexed with bulk requests
+    if len(frame_docs) == 0:
+        return 0
+
+    frame_index_name = get_index(len(frame_docs))
+    register_indices(frame_docs[0][0], [frame_index_name])
+    return bulk_index(frame_index_name, [(frame_id, frame) for task_id, frame_id, frame in frame_docs])
+
+def bulk_index(index_name, docs):
+    '''
+    Index (frame_id, frame) documents in size bounded bulk requests, returns the number indexed.
+    Documents rejected with a retryable status (429, 5xx, connection error) are sent again with backoff.
+    Raises FrameIndexError if documents are still not indexed, documents have fixed ids so indexing them again is safe.
+    '''
+    saved, pending = 0, docs
+    for attempt in range(OPENSEARCH_BULK_MAX_ATTEMPTS):
+        documents = dict(pending)
+        actions = [{"_index": index_name, "_id": frame_id, "_source": frame} for frame_id, frame in pending]
+        retry = []
+        for ok, item in helpers.streaming_bulk(opensearch_client, actions,
+                                chunk_size=OPENSEARCH_BULK_CHUNK_SIZE, max_chunk_bytes=OPENSEARCH_BULK_MAX_BYTES,
+                                raise_on_error=False, raise_on_exception=False):
+            if ok:
+                saved += 1
+                continue
+            result = item.get("index", {})
+            if result.get("status") in OPENSEARCH_BULK_RETRY_STATUS and result.get("_id") in documents:
+                retry.append((result["_id"], documents[result["_id"]]))
+            else:
+                print("Bulk index error:", result.get("_id"), result.get("status"), result.get("error"))
+        if len(retry) == 0:
+            break
+        pending = retry
+        if attempt + 1 < OPENSEARCH_BULK_MAX_ATTEMPTS:
+            time.sleep(random.uniform(0, min(10, 2 ** attempt)))
+    if saved < len(docs):
+        raise FrameIndexError(f"{len(docs) - saved} of {len(docs)} frame documents not indexed in {index_name}")
+    return saved
+
+def end_ingest(task_id):
+    # Make the frames of the task searchable now rather than at the next scheduled refresh of its indices
+    task = utils.dynamodb_get_by_id(DYNAMO_VIDEO_TASK_TABLE, task_id)
+    index_names = (task or {}).get("VectorMetaData", {}).get("OpenSearch", {}).get("IndexNames") or []
+    refreshed = []
+    for idx in index_names:
+        try:
+            opensearch_client.indices.refresh(index=idx)
+            refreshed.append(idx)
+        except Exception as ex:
+            print(f"Failed to refresh {idx}: {ex}")
+    return {"Refreshed": refreshed}
+
+def get_frame_document(event):
+    # Returns (task_id, frame_id, frame document), None if the request is invalid, False if embedding is disabled
+    if event is None or "Error" in event or "Request" not in event or "Key" not in event:
+        return None
+
+    task_id = event["Request"].get("TaskId")
+    setting = event["Request"].get("ExtractionSetting")
+    s3_bucket = event["MetaData"]["VideoFrameS3"]["S3Bucket"]
+    s3_prefix = event["MetaData"]["VideoFrameS3"]["S3Prefix"]
+    s3_key = event.get("Key")
+    file_name = event["Request"].get("FileName", "")
+    frame = event.get("frame")
+    
+    if frame is None or task_id is None or setting is None or s3_bucket is None or s3_key is None or not s3_key.endswith('.jpg'):
+        return None
+
+    enable_text_embedding, enable_mm_embedding = True, True
+    if "EmbeddingSetting" in event["Request"]:
+        enable_text_embedding = event["Request"]["EmbeddingSetting"]["Text"]
+        enable_mm_embedding = event["Request"]["EmbeddingSetting"]["MultiModal"]
+    if not enable_mm_embedding and not enable_text_embedding:
+        return False
+    
+    frame_id = frame["id"]
+    del frame["id"]
+    frame["timestamp"] = float(frame_id.split('_')[-1])
+    frame["image_s3_uri"] = f"s3://{event['MetaData']['VideoFrameS3']['S3Bucket']}/{event['Key']}"
+    for field in vector_encoding.VECTOR_FIELDS:
+        if frame.get(field) is not None:
+            frame[field] = vector_encoding.encode_vector(frame[field])
+    return task_id, frame_id, frame
+
+def register_indices(task_id, opensearch_indices):
+    # Update task DB with opensearch index names. Indices already registered by this container are skipped.
+    for idx in opensearch_indices:
+        if (task_id, idx) in registered_indices:
+            continue
+        updated = utils.dynamodb_task_list_append(DYNAMO_VIDEO_TASK_TABLE, task_id, "VectorMetaData.OpenSearch.IndexNames", idx)
+        if updated is not None:
+            registered_indices.add((task_id, idx))
+        if updated:
+            print("Opensearch indices updated:", idx)
+
+def get_index(doc_count=1):
+    # Cached write index, see index_rollover
+    return index_rollover.get_write_index(opensearch_client, doc_count)
@@ -0,0 +1,160 @@
+'''
+Frame index rollover
+1. The active write index is cached in the lambda container; the cluster is only asked again
+   every OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S seconds or OPENSEARCH_ROLLOVER_CHECK_DOCS documents
+2. "date" mode: <prefix><yyyy_mm_dd>_<seq>, the next sequence is created once the shard size limit is reached
+3. "ism" mode: writes go to the index behind the <prefix>write alias, rolled over by an ISM policy
+   on the same shard size limit
+New indices get the vector encoding of OPENSEARCH_VECTOR_ENCODING, see vector_encoding, and the refresh interval
+OPENSEARCH_REFRESH_INTERVAL. Indices are shared by tasks, the interval is never changed while frames are written;
+a task refreshes its indices once its frames are saved (frame_vector_save.end_ingest)
+'''
+import os
+import re
+import json
+import time
+import threading
+import vector_encoding
+from datetime import datetime
+
+OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME = os.environ.get("OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME")
+OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING = os.environ.get("OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING")
+OPENSEARCH_SHARD_SIZE_LIMIT = float(os.environ.get("OPENSEARCH_SHARD_SIZE_LIMIT",50 * 1024 * 1024))
+OPENSEARCH_ROLLOVER_MODE = os.environ.get("OPENSEARCH_ROLLOVER_MODE", "date") # date | ism
+OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S = float(os.environ.get("OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S", 300))
+OPENSEARCH_ROLLOVER_CHECK_DOCS = int(os.environ.get("OPENSEARCH_ROLLOVER_CHECK_DOCS", 2000))
+OPENSEARCH_REFRESH_INTERVAL = os.environ.get("OPENSEARCH_REFRESH_INTERVAL", "30s")
+
+WRITE_ALIAS = f"{OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}write"
+ISM_POLICY_ID = f"{OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}rollover"
+
+# Active write index of this container
+state = {"index": None, "date": None, "checked_at": 0, "docs": 0}
+lock = threading.Lock()
+
+def get_write_index(client, doc_count=1):
+    '''
+    Index the next doc_count documents go to. Cached, the size check and index creation
+    only run when the cache is older than the check interval or document count, or the day changed.
+    '''
+    with lock:
+        now = time.time()
+        current_date = datetime.utcnow().strftime('%Y_%m_%d')
+        if state["index"] is not None and (OPENSEARCH_ROLLOVER_MODE == "ism" or state["date"] == current_date) \
+                and now - state["checked_at"] < OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S \
+                and state["docs"] < OPENSEARCH_ROLLOVER_CHECK_DOCS:
+            state["docs"] += doc_count
+            return state["index"]
+
+        if OPENSEARCH_ROLLOVER_MODE == "ism":
+            index = resolve_alias_index(client)
+        else:
+            index = resolve_date_index(client, current_date, state["index"] if state["date"] == current_date else None)
+        state.update({"index": index, "date": current_date, "checked_at": now, "docs": doc_count})
+        return index
+
+def resolve_date_index(client, current_date, cached_index=None):
+    # The cached index stays active while under the limit, otherwise look up the latest index of the day
+    if cached_index is not None and get_shard_size(client, cached_index) < OPENSEARCH_SHARD_SIZE_LIMIT:
+        return cached_index
+
+    pattern = re.compile(rf"{OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}{current_date}_(\d+)$")
+    # Only the indices of the day, not every alias of the cluster
+    index_names = client.indices.get_alias(index=f"{OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}{current_date}_*").keys()
+    matching_indices = [name for name in index_names if pattern.match(name)]
+
+    latest_index, index_seq, full_index = None, 0, None
+    if matching_indices:
+        latest_index = max(matching_indices, key=lambda name: int(pattern.match(name).group(1)))
+        if get_shard_size(client, latest_index) >= OPENSEARCH_SHARD_SIZE_LIMIT:
+            # Exceed limit, create new one
+            index_seq = int(pattern.match(latest_index).group(1)) + 1
+            latest_index, full_index = None, latest_index
+
+    if latest_index is None:
+        latest_index = f"{OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}{current_date}_{index_seq}"
+        # The full index is the PQ training set when the models are missing
+        create_index(client, latest_index, json.dumps(get_index_body(client, training_index=full_index)))
+    return latest_index
+
+def get_index_body(client, training_index=None):
+    # Frame index mapping in the configured vector encoding, with the frame index refresh interval
+    body = json.loads(vector_encoding.get_index_mapping(OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING,
+                                    client=client, training_index=training_index))
+    body.setdefault("settings", {})["index.refresh_interval"] = OPENSEARCH_REFRESH_INTERVAL
+    return body
+
+def get_shard_size(client, index):
+    shard_size = 0
+    shard_stats = client.indices.stats(index=index, metric='store')
+
+    shards = shard_stats['indices'][index].get('shards')
+    if shards:
+        for shard_id, shard_info in shards.items():
+            for shard in shard_info:
+                shard_size = shard['store']['size_in_bytes']
+    else:
+        shard_size = shard_stats['indices'][index]["primaries"]["store"]["size_in_bytes"]
+    return shard_size
+
+def create_index(client, index, body):
+    # Another container may create it at the same time
+    if client.indices.exists(index=index):
+        return
+    try:
+        client.indices.create(index=index, body=body)
+    except Exception as ex:
+        if "resource_already_exists_exception" not in str(ex):
+            print(ex)
+
+def resolve_alias_index(client):
+    # Concrete index behind the write alias, bootstrapped with the ISM policy on first use
+    index = get_alias_write_index(client)
+    if index is None:
+        put_ism_policy(client)
+        # Indices created by the rollover get the frame mapping from the template
+        template = get_index_body(client)
+        template["settings"]["plugins.index_state_management.rollover_alias"] = WRITE_ALIAS
+        try:
+            client.indices.put_index_template(name=ISM_POLICY_ID, body={
+                "index_patterns": [f"{OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}0*"],
+                "template": template
+            })
+        except Exception as ex:
+            print(f"Failed to create index template {ISM_POLICY_ID}: {ex}")
+        create_index(client, f"{OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}000001", json.dumps({"aliases": {WRITE_ALIAS: {"is_write_index": True}}}))
+        index = get_alias_write_index(client)
+    return index
+
+def get_alias_write_index(client):
+    try:
+        response = client.indices.get_alias(name=WRITE_ALIAS)
+    except Exception as ex:
+        if getattr(ex, "status_code", None) != 404:
+            print(f"Failed to get alias {WRITE_ALIAS}: {ex}")
+        return None
+    for index, info in response.items():
+        if info.get("aliases", {}).get(WRITE_ALIAS, {}).get("is_write_index"):
+            return index
+    return next(iter(response), None)
+
+def put_ism_policy(client):
+    # Roll the write alias over on the same shard size limit as the date mode. Indices created
+    # by the rollover are <prefix>000002, ..., the policy attaches itself through the ISM template.
+    policy = {
+        "policy": {
+            "description": "Video frame index rollover",
+            "default_state": "hot",
+            "states": [{
+                "name": "hot",
+                "actions": [{"rollover": {"min_primary_shard_size": f"{int(OPENSEARCH_SHARD_SIZE_LIMIT)}b"}}],
+                "transitions": []
+            }],
+            "ism_template": [{"index_patterns": [f"{OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}0*"], "priority": 100}]
+        }
+    }
+    try:
+        client.transport.perform_request("PUT", f"/_plugins/_ism/policies/{ISM_POLICY_ID}", body=policy)
+    except Exception as ex:
+        if getattr(ex, "status_code", None) != 409:
+            print(f"Failed to create ISM policy {ISM_POLICY_ID}: {ex}")
@@ -0,0 +1,113 @@
+'''
+Frame vector encoding in the OpenSearch frame index
+1. float32: faiss HNSW, 4 bytes per dimension, as in OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING
+2. fp16: faiss HNSW with the fp16 scalar quantization encoder, 2 bytes per dimension (OpenSearch 2.13+)
+3. byte: lucene HNSW on byte vectors, 1 byte per dimension (OpenSearch 2.9+). Vectors are multiplied by
+   OPENSEARCH_VECTOR_BYTE_SCALE and rounded to [-128, 127] when indexed and when queried
+4. pq: faiss HNSW with product quantization, OPENSEARCH_VECTOR_PQ_M bytes per vector (OpenSearch 2.10+).
+   The models are trained from the float32 vectors of a full frame index, see get_index_mapping
+Vector fields can be left out of _source (OPENSEARCH_VECTOR_SOURCE_EXCLUDES), k-NN search reads them from the
+vector index, nothing reads them back from the documents
+'''
+import os
+import json
+
+OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME = os.environ.get("OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME")
+OPENSEARCH_VECTOR_ENCODING = os.environ.get("OPENSEARCH_VECTOR_ENCODING", "float32") # float32 | fp16 | byte | pq
+OPENSEARCH_VECTOR_BYTE_SCALE = float(os.environ.get("OPENSEARCH_VECTOR_BYTE_SCALE", 512))
+OPENSEARCH_VECTOR_PQ_M = int(os.environ.get("OPENSEARCH_VECTOR_PQ_M", 128))
+OPENSEARCH_VECTOR_SOURCE_EXCLUDES = os.environ.get("OPENSEARCH_VECTOR_SOURCE_EXCLUDES", "true").lower() == "true"
+
+VECTOR_FIELDS = ["mm_embedding", "text_embedding"]
+# faiss HNSW only supports 8 bit PQ codes
+PQ_CODE_SIZE = 8
+
+def get_index_mapping(mapping, encoding=None, source_excludes=None, client=None, training_index=None, model_prefix=None):
+    '''
+    Frame index mapping (JSON string) with the vector fields in the given encoding.
+    pq: the fields refer to the trained models. While the models are not created the float32 mapping is kept,
+    and with training_index set, missing models are trained from the float32 vectors of that index.
+    '''
+    encoding = encoding or OPENSEARCH_VECTOR_ENCODING
+    source_excludes = OPENSEARCH_VECTOR_SOURCE_EXCLUDES if source_excludes is None else source_excludes
+    body = json.loads(mapping)
+    properties = body["mappings"]["properties"]
+    fields = [f for f in VECTOR_FIELDS if f in properties]
+
+    if encoding == "pq" and (client is None or not pq_models_ready(client, properties, training_index, model_prefix)):
+        print("PQ models are not created, the index keeps float32 vectors")
+        encoding = "float32"
+
+    for field in fields:
+        properties[field] = get_field_mapping(properties[field], encoding, pq_model_id(field, model_prefix))
+    if source_excludes:
+        body["mappings"]["_source"] = {"excludes": fields}
+    return json.dumps(body)
+
+def get_field_mapping(field_mapping, encoding, model_id=None):
+    dimension = field_mapping.get("dimension")
+    space_type = field_mapping.get("method", {}).get("space_type", "l2")
+    if encoding == "fp16":
+        return {"type": "knn_vector", "dimension": dimension, "method": {"name": "hnsw", "space_type": space_type, "engine": "faiss",
+                    "parameters": {"encoder": {"name": "sq", "parameters": {"type": "fp16"}}}}}
+    elif encoding == "byte":
+        return {"type": "knn_vector", "dimension": dimension, "data_type": "byte",
+                    "method": {"name": "hnsw", "space_type": space_type, "engine": "lucene"}}
+    elif encoding == "pq":
+        return {"type": "knn_vector", "model_id": model_id}
+    return field_mapping
+
+def encode_vector(vector, encoding=None):
+    # Vector as indexed and queried, byte fields take integers in [-128, 127]
+    encoding = encoding or OPENSEARCH_VECTOR_ENCODING
+    if vector is None or encoding != "byte":
+        return vector
+    return [max(-128, min(127, round(v * OPENSEARCH_VECTOR_BYTE_SCALE))) for v in vector]
+
+def pq_model_id(field, model_prefix=None):
+    return f"{model_prefix or OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME}{field}_pq"
+
+def pq_method(space_type="l2"):
+    return {"name": "hnsw", "engine": "faiss", "space_type": space_type,
+            "parameters": {"encoder": {"name": "pq", "parameters": {"code_size": PQ_CODE_SIZE, "m": OPENSEARCH_VECTOR_PQ_M}}}}
+
+def pq_models_ready(client, properties, training_index=None, model_prefix=None):
+    ready = True
+    for field in VECTOR_FIELDS:
+        if field not in properties:
+            continue
+        model_id = pq_model_id(field, model_prefix)
+        state = get_model_state(client, model_id)
+        if state == "created":
+            continue
+        ready = False
+        if state is None and training_index is not None:
+            space_type = properties[field].get("method", {}).get("space_type", "l2")
+            train_pq_model(client, model_id, training_index, field, properties[field]["dimension"], space_type)
+        elif state == "failed":
+            print(f"PQ model {model_id} training failed, delete the model to train it again")
+    return ready
+
+def get_model_state(client, model_id):
+    # created | training | failed, None if the model does not exist
+    try:
+        response = client.transport.perform_request("GET", f"/_plugins/_knn/models/{model_id}")
+        return response.get("state")
+    except Exception as ex:
+        if getattr(ex, "status_code", None) != 404:
+            print(f"Failed to get model {model_id}: {ex}")
+    return None
+
+def train_pq_model(client, model_id, training_index, training_field, dimension, space_type="l2"):
+    # Training runs in the background on the k-NN nodes, the model is usable once its state is "created"
+    try:
+        client.transport.perform_request("POST", f"/_plugins/_knn/models/{model_id}/_train", body={
+            "training_index": training_index,
+            "training_field": training_field,
+            "dimension": dimension,
+            "description": f"Video frame {training_field} product quantization",
+            "method": pq_method(space_type)
+        })
+        print(f"PQ model {model_id} training started from {training_index}")
+    except Exception as ex:
+        print(f"Failed to train model {model_id}: {ex}")
@@ -0,0 +1,110 @@
+'''
+Per-task subtitle interval index
+1. Built once by the transcription S3 trigger and stored next to the transcription in S3
+2. Subtitles are sorted by start_ts, with a running max of end_ts so overlap
+   queries are answered by binary search instead of a scan over every subtitle
+3. Loaded indices are cached in the lambda container
+'''
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import boto3
+from botocore.exceptions import ClientError
+
+SUBTITLE_INDEX_VERSION = 1
+SUBTITLE_INDEX_CACHE_SIZE = 16 # tasks kept in the container
+
+s3 = boto3.client('s3')
+
+cache = OrderedDict()
+lock = threading.Lock()
+
+def index_key(task_id):
+    return f"tasks/{task_id}/subtitle_index.json"
+
+class SubtitleIndex:
+    def __init__(self, starts, ends, texts):
+        self.starts = starts
+        self.ends = ends
+        self.texts = texts
+        # max_ends[i] = max(ends[0..i]), non-decreasing so it can be bisected
+        self.max_ends = []
+        running = float("-inf")
+        for end in ends:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    @classmethod
+    def from_subtitles(cls, subtitles):
+        subtitles = sorted(
+            (s for s in subtitles or [] if s.get("start_ts") is not None and s.get("end_ts") is not None),
+            key=lambda s: (float(s["start_ts"]), float(s["end_ts"]))
+        )
+        return cls(
+            [float(s["start_ts"]) for s in subtitles],
+            [float(s["end_ts"]) for s in subtitles],
+            [s.get("transcription") for s in subtitles],
+        )
+
+    @classmethod
+    def from_json(cls, data):
+        doc = json.loads(data)
+        return cls(doc["start"], doc["end"], doc["text"])
+
+    def to_json(self):
+        return json.dumps({
+            "v": SUBTITLE_INDEX_VERSION,
+            "start": self.starts,
+            "end": self.ends,
+            "text": self.texts,
+        }, separators=(",", ":"), ensure_ascii=False)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlap(self, start_ts, end_ts):
+        '''
+        Subtitles overlapping [start_ts, end_ts], same rule as the previous DynamoDB scan:
+        skip when subtitle.start_ts > end_ts or subtitle.end_ts < start_ts
+        '''
+        start_ts, end_ts = float(start_ts), float(end_ts)
+        # Subtitles after hi start after end_ts, subtitles before lo all end before start_ts
+        hi = bisect_right(self.starts, end_ts)
+        lo = bisect_left(self.max_ends, start_ts, 0, hi)
+        return [
+            {"start_ts": self.starts[i], "end_ts": self.ends[i], "transcription": self.texts[i]}
+            for i in range(lo, hi) if self.ends[i] >= start_ts
+        ]
+
+def save(s3_bucket, task_id, subtitles):
+    index = SubtitleIndex.from_subtitles(subtitles)
+    s3.put_object(Bucket=s3_bucket, Key=index_key(task_id), Body=index.to_json().encode("utf-8"), ContentType="application/json")
+    remember(task_id, index)
+    return index
+
+def load(s3_bucket, task_id):
+    # Returns None when the task has no index in S3
+    with lock:
+        if task_id in cache:
+            cache.move_to_end(task_id)
+            return cache[task_id]
+    try:
+        response = s3.get_object(Bucket=s3_bucket, Key=index_key(task_id))
+        index = SubtitleIndex.from_json(response["Body"].read())
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] not in ["NoSuchKey", "404"]:
+            print(f"subtitle index get {task_id}: {ex}")
+        return None
+    except Exception as ex:
+        print(f"subtitle index get {task_id}: {ex}")
+        return None
+    remember(task_id, index)
+    return index
+
+def remember(task_id, index):
+    with lock:
+        cache[task_id] = index
+        cache.move_to_end(task_id)
+        while len(cache) > SUBTITLE_INDEX_CACHE_SIZE:
+            cache.popitem(last=False)
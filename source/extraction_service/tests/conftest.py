@@ -0,0 +1,30 @@
+'''
+Unit tests of the extraction service lambdas and layers
+1. Lambdas ship modules with the same name (utils.py), load_module imports a module from its lambda or
+   layer directory and drops the modules of other directories first
+2. AWS clients are created when a module is imported, tests replace them on the loaded module
+'''
+import os
+import sys
+import importlib
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.dirname(TESTS_DIR)
+
+# Clients created at import need a region, no call reaches AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+def load_module(directory, name, layers=()):
+    # directory: relative to source/extraction_service, e.g. "lambda/extr-srv-sample-video"
+    # layers: layer names the function uses, searched after the function code as in /opt/python
+    paths = [os.path.join(SOURCE_DIR, directory)] + [os.path.join(SOURCE_DIR, "lambda_layer", layer, "python") for layer in layers]
+    for module_name, module in list(sys.modules.items()):
+        file = getattr(module, "__file__", None) or ""
+        if file.startswith(SOURCE_DIR) and not file.startswith(TESTS_DIR) and os.path.dirname(file) not in paths:
+            del sys.modules[module_name]
+    sys.path[0:0] = paths
+    try:
+        return importlib.import_module(name)
+    finally:
+        for path in paths:
+            sys.path.remove(path)
@@ -0,0 +1,83 @@
+import json
+from io import BytesIO
+import pytest
+from botocore.exceptions import ClientError
+from conftest import load_module
+
+detector_cache = load_module("lambda/extr-srv-image-extraction", "detector_cache")
+
+IMAGE_SHA = detector_cache.image_hash(b"frame")
+CONFIG = {"threshold": 80.0, "region": "us-east-1", "version": "1"}
+
+class FakeS3:
+    def __init__(self, error=None):
+        self.objects = {}
+        self.error = error
+
+    def get_object(self, Bucket, Key):
+        if self.error is not None:
+            raise self.error
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": BytesIO(self.objects[Key].encode("utf-8"))}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+@pytest.fixture
+def s3(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(detector_cache, "s3", s3)
+    monkeypatch.setattr(detector_cache, "DETECTOR_CACHE_ENABLED", True)
+    detector_cache.reset_counters()
+    return s3
+
+def test_cache_key_layout():
+    key = detector_cache.cache_key("detect_label", CONFIG, IMAGE_SHA)
+    prefix, detector, config_hash, shard, file_name = key.split("/")
+    assert (prefix, detector, shard, file_name) == (detector_cache.DETECTOR_CACHE_S3_PREFIX, "detect_label", IMAGE_SHA[0:2], f"{IMAGE_SHA}.json")
+    assert len(config_hash) == 16
+
+def test_cache_key_ignores_config_order():
+    reordered = {"version": "1", "region": "us-east-1", "threshold": 80.0}
+    assert detector_cache.cache_key("detect_label", reordered, IMAGE_SHA) == detector_cache.cache_key("detect_label", CONFIG, IMAGE_SHA)
+
+@pytest.mark.parametrize("change", [
+    {"threshold": 90.0},
+    {"version": "2"},
+    {"region": "eu-west-1"},
+    {"prompt": "Describe the image"},
+])
+def test_cache_key_changes_with_the_configuration(change):
+    assert detector_cache.cache_key("detect_label", dict(CONFIG, **change), IMAGE_SHA) != detector_cache.cache_key("detect_label", CONFIG, IMAGE_SHA)
+
+def test_cache_key_changes_with_detector_and_image():
+    key = detector_cache.cache_key("detect_label", CONFIG, IMAGE_SHA)
+    assert detector_cache.cache_key("detect_text", CONFIG, IMAGE_SHA) != key
+    assert detector_cache.cache_key("detect_label", CONFIG, detector_cache.image_hash(b"other frame")) != key
+
+def test_get_or_compute_caches_results(s3):
+    labels = [{"Name": "Person", "Confidence": 99.1}]
+    assert detector_cache.get_or_compute("bucket", "detect_label", CONFIG, IMAGE_SHA, lambda: labels) == (labels, False)
+    assert json.loads(s3.objects[detector_cache.cache_key("detect_label", CONFIG, IMAGE_SHA)]) == labels
+
+    def fail():
+        raise AssertionError("detector called again")
+    assert detector_cache.get_or_compute("bucket", "detect_label", CONFIG, IMAGE_SHA, fail) == (labels, True)
+    assert detector_cache.get_counters() == {"hit": 1, "miss": 1, "error": 0}
+
+def test_get_or_compute_does_not_cache_missing_results(s3):
+    assert detector_cache.get_or_compute("bucket", "image_caption", CONFIG, IMAGE_SHA, lambda: None) == (None, False)
+    assert s3.objects == {}
+
+def test_get_or_compute_without_image_hash_or_disabled_always_computes(s3, monkeypatch):
+    assert detector_cache.get_or_compute("bucket", "detect_label", CONFIG, None, lambda: []) == ([], False)
+    monkeypatch.setattr(detector_cache, "DETECTOR_CACHE_ENABLED", False)
+    assert detector_cache.get_or_compute("bucket", "detect_label", CONFIG, IMAGE_SHA, lambda: []) == ([], False)
+    assert s3.objects == {}
+    assert detector_cache.get_counters() == {"hit": 0, "miss": 0, "error": 0}
+
+def test_read_errors_are_counted_and_computed(s3):
+    s3.error = ClientError({"Error": {"Code": "AccessDenied"}}, "GetObject")
+    assert detector_cache.get_or_compute("bucket", "detect_label", CONFIG, IMAGE_SHA, lambda: ["label"]) == (["label"], False)
+    assert detector_cache.get_counters() == {"hit": 0, "miss": 1, "error": 1}
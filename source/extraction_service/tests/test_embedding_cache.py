@@ -0,0 +1,81 @@
+import hashlib
+from io import BytesIO
+import pytest
+from botocore.exceptions import ClientError
+from conftest import load_module
+
+embedding_cache = load_module("lambda_layer/embedding-client/python", "embedding_cache")
+
+MODEL_ID = "amazon.titan-embed-image-v1:0"
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+@pytest.fixture
+def cache(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(embedding_cache, "s3", s3)
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_ENABLED", True)
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_S3_BUCKET", "bucket")
+    monkeypatch.setattr(embedding_cache, "memory_cache", embedding_cache.OrderedDict())
+    embedding_cache.reset_counters()
+    return s3
+
+def test_cache_key_is_content_addressed():
+    image_hash = hashlib.sha256(b"image").hexdigest()
+    text_hash = hashlib.sha256("text".encode("utf-8")).hexdigest()
+    key = embedding_cache.cache_key(MODEL_ID, b"image", "text")
+    assert key == f"{embedding_cache.EMBEDDING_CACHE_S3_PREFIX}/amazon.titan-embed-image-v1_0/{image_hash[0:2]}/{image_hash}_{text_hash}.f32"
+    assert embedding_cache.cache_key(MODEL_ID, b"image", "text") == key
+
+def test_cache_key_changes_with_every_input():
+    key = embedding_cache.cache_key(MODEL_ID, b"image", "text")
+    assert embedding_cache.cache_key(MODEL_ID, b"image2", "text") != key
+    assert embedding_cache.cache_key(MODEL_ID, b"image", "text2") != key
+    assert embedding_cache.cache_key("amazon.titan-embed-image-v2:0", b"image", "text") != key
+    assert embedding_cache.cache_key(MODEL_ID, b"image", "text", variant="384") != key
+
+def test_cache_key_of_missing_inputs():
+    # Image only and text only requests never share a key
+    image_only = embedding_cache.cache_key(MODEL_ID, image_bytes=b"image")
+    text_only = embedding_cache.cache_key(MODEL_ID, text="text")
+    assert image_only.endswith("_none.f32")
+    assert "/no/none_" in text_only
+    assert image_only != text_only
+
+def test_get_or_compute_stores_and_reads_float32_vectors(cache):
+    vector = [0.5, -1.25, 3.0]
+    assert embedding_cache.get_or_compute(MODEL_ID, lambda: vector, image_bytes=b"image") == (vector, False)
+    key = embedding_cache.cache_key(MODEL_ID, b"image")
+    assert len(cache.objects[key]) == 4 * len(vector)
+
+    def fail():
+        raise AssertionError("computed again")
+    # Container memory first, then S3 once the container cache is empty
+    assert embedding_cache.get_or_compute(MODEL_ID, fail, image_bytes=b"image") == (vector, True)
+    embedding_cache.memory_cache.clear()
+    assert embedding_cache.get_or_compute(MODEL_ID, fail, image_bytes=b"image") == (vector, True)
+    assert embedding_cache.get_counters() == {"hit": 2, "miss": 1, "memory_hit": 1, "error": 0}
+
+def test_get_or_compute_without_bucket_always_computes(cache, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_S3_BUCKET", None)
+    calls = []
+    embedding_cache.get_or_compute(MODEL_ID, lambda: calls.append(1) or [1.0], image_bytes=b"image")
+    embedding_cache.get_or_compute(MODEL_ID, lambda: calls.append(1) or [1.0], image_bytes=b"image")
+    assert len(calls) == 2
+    assert cache.objects == {}
+
+def test_memory_cache_is_bounded(cache, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_MEMORY_SIZE", 2)
+    for i in range(3):
+        embedding_cache.get_or_compute(MODEL_ID, lambda: [float(i)], text=str(i))
+    assert list(embedding_cache.memory_cache) == [embedding_cache.cache_key(MODEL_ID, text="1"), embedding_cache.cache_key(MODEL_ID, text="2")]
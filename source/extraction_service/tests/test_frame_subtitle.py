@@ -0,0 +1,113 @@
+import random
+import types
+import pytest
+from conftest import load_module
+
+frame_subtitle = load_module("lambda/extr-srv-frame-subtitle", "extr-srv-frame-subtitle", layers=["subtitle-index"])
+subtitle_index = load_module("lambda/extr-srv-frame-subtitle", "subtitle_index", layers=["subtitle-index"])
+utils = load_module("lambda/extr-srv-frame-subtitle", "utils", layers=["subtitle-index"])
+
+def random_subtitles(count, seed):
+    # Mostly short consecutive cues, with a few long ones overlapping many others
+    rnd = random.Random(seed)
+    subtitles, ts = [], 0.0
+    for i in range(count):
+        ts += rnd.uniform(0, 3)
+        length = rnd.uniform(20, 60) if rnd.random() < 0.05 else rnd.uniform(0.5, 4)
+        subtitles.append({"start_ts": round(ts, 2), "end_ts": round(ts + length, 2), "transcription": f"cue {i}"})
+    rnd.shuffle(subtitles)
+    return subtitles
+
+def scan(subtitles, start_ts, end_ts):
+    # Rule of the previous DynamoDB scan, in index order
+    matches = [s for s in subtitles if not (s["start_ts"] > end_ts or s["end_ts"] < start_ts)]
+    return sorted(matches, key=lambda s: (s["start_ts"], s["end_ts"]))
+
+def test_overlap_matches_a_full_scan():
+    subtitles = random_subtitles(300, seed=1)
+    index = subtitle_index.SubtitleIndex.from_subtitles(subtitles)
+    rnd = random.Random(2)
+    for _ in range(500):
+        start_ts = rnd.uniform(-5, 500)
+        end_ts = start_ts + rnd.uniform(0, 10)
+        assert index.overlap(start_ts, end_ts) == scan(subtitles, start_ts, end_ts)
+
+def test_overlap_bounds_are_inclusive():
+    index = subtitle_index.SubtitleIndex.from_subtitles([{"start_ts": 1.0, "end_ts": 2.0, "transcription": "a"}])
+    assert len(index.overlap(2.0, 3.0)) == 1
+    assert len(index.overlap(0.0, 1.0)) == 1
+    assert index.overlap(2.01, 3.0) == []
+    assert index.overlap(0.0, 0.99) == []
+
+def test_long_subtitle_before_short_ones_is_found():
+    # The running max of end_ts keeps the long first cue in range
+    index = subtitle_index.SubtitleIndex.from_subtitles([
+        {"start_ts": 0.0, "end_ts": 100.0, "transcription": "long"},
+        {"start_ts": 1.0, "end_ts": 2.0, "transcription": "short"},
+    ])
+    assert [s["transcription"] for s in index.overlap(50.0, 51.0)] == ["long"]
+
+def test_index_skips_incomplete_subtitles_and_round_trips_json():
+    index = subtitle_index.SubtitleIndex.from_subtitles([
+        {"start_ts": 3.0, "end_ts": 4.0, "transcription": "b"},
+        {"start_ts": 1.0, "end_ts": None, "transcription": "no end"},
+        {"start_ts": 1.0, "end_ts": 2.0, "transcription": "a"},
+    ])
+    assert index.texts == ["a", "b"]
+    loaded = subtitle_index.SubtitleIndex.from_json(index.to_json())
+    assert (loaded.starts, loaded.ends, loaded.texts) == (index.starts, index.ends, index.texts)
+
+def sampled_frames(count, seed):
+    # Consecutive [prev_timestamp, timestamp] intervals, as written by the sampler
+    rnd = random.Random(seed)
+    frames, prev_ts = [], 0.0
+    for i in range(count):
+        ts = round(prev_ts + rnd.uniform(0.5, 5), 2)
+        frames.append({"id": f"task_{ts}", "timestamp": ts, "prev_timestamp": prev_ts})
+        prev_ts = ts
+    return frames
+
+def test_assign_subtitles_matches_the_index_lookup():
+    index = subtitle_index.SubtitleIndex.from_subtitles(random_subtitles(300, seed=3))
+    frames = sampled_frames(200, seed=4)
+    assigned = frame_subtitle.assign_subtitles(frames, index)
+    assert assigned == [index.overlap(f["prev_timestamp"], f["timestamp"]) for f in frames]
+
+def test_assign_subtitles_answers_out_of_order_frames_from_the_index():
+    index = subtitle_index.SubtitleIndex.from_subtitles(random_subtitles(100, seed=5))
+    frames = sampled_frames(50, seed=6)
+    # Dedup drops frames, so a frame interval can start before the previous one
+    frames[20]["prev_timestamp"] = frames[5]["timestamp"]
+    frames[21]["prev_timestamp"] = frames[2]["timestamp"]
+    assigned = frame_subtitle.assign_subtitles(frames, index)
+    assert assigned == [index.overlap(f["prev_timestamp"], f["timestamp"]) for f in frames]
+
+def test_assign_subtitles_with_empty_index():
+    index = subtitle_index.SubtitleIndex.from_subtitles([])
+    assert frame_subtitle.assign_subtitles(sampled_frames(3, seed=7), index) == [[], [], []]
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+class FakeDynamoClient:
+    exceptions = types.SimpleNamespace(ConditionalCheckFailedException=ConditionalCheckFailedException)
+
+    def __init__(self, missing=(), failing=()):
+        self.missing, self.failing = set(missing), set(failing)
+        self.updates = []
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        if Key["id"] in self.missing:
+            raise ConditionalCheckFailedException()
+        if Key["id"] in self.failing:
+            raise Exception("ProvisionedThroughputExceededException")
+        self.updates.append((Key["id"], UpdateExpression, ConditionExpression))
+
+def test_update_items_with_subtitles_counts_missing_and_failed_frames(monkeypatch):
+    client = FakeDynamoClient(missing=["task_2.0"], failing=["task_3.0"])
+    monkeypatch.setattr(utils, "dynamodb", types.SimpleNamespace(meta=types.SimpleNamespace(client=client)))
+    cue = [{"start_ts": 0.5, "end_ts": 1.5, "transcription": "a"}]
+    counts = utils.update_items_with_subtitles("frames", "task", {"task_1.0": cue, "task_2.0": cue, "task_3.0": cue})
+    assert counts == {"updated": 1, "missing": 1, "failed": 1}
+    # Only the subtitles attribute, on frames that still exist
+    assert client.updates == [("task_1.0", "SET subtitles = :s", "attribute_exists(id)")]
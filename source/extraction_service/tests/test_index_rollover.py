@@ -0,0 +1,168 @@
+import json
+import fnmatch
+import types
+import pytest
+from conftest import load_module
+
+index_rollover = load_module("lambda_layer/frame-vector/python", "index_rollover")
+
+PREFIX = "video_frame_"
+MAPPING = json.dumps({"settings": {"index.knn": True}, "mappings": {"properties": {
+    "mm_embedding": {"type": "knn_vector", "dimension": 4, "method": {"name": "hnsw", "space_type": "l2", "engine": "faiss"}},
+    "timestamp": {"type": "double"}}}})
+
+class NotFoundError(Exception):
+    status_code = 404
+
+class FakeIndices:
+    def __init__(self, sizes=None, aliases=None):
+        self.sizes = dict(sizes or {}) # index name: primary store size
+        self.aliases = dict(aliases or {}) # index name: {alias: settings}
+        self.created = {}
+        self.templates = {}
+        self.calls = 0
+
+    def get_alias(self, index=None, name=None):
+        self.calls += 1
+        if name is not None:
+            found = {i: {"aliases": a} for i, a in self.aliases.items() if name in a}
+            if not found:
+                raise NotFoundError(name)
+            return found
+        return {i: {"aliases": {}} for i in self.sizes if fnmatch.fnmatch(i, index)}
+
+    def stats(self, index, metric):
+        self.calls += 1
+        return {"indices": {index: {"primaries": {"store": {"size_in_bytes": self.sizes[index]}}}}}
+
+    def exists(self, index):
+        return index in self.sizes
+
+    def create(self, index, body):
+        self.calls += 1
+        body = json.loads(body)
+        self.created[index] = body
+        self.sizes[index] = 0
+        for alias, settings in body.get("aliases", {}).items():
+            self.aliases.setdefault(index, {})[alias] = settings
+
+    def put_index_template(self, name, body):
+        self.templates[name] = body
+
+class FakeOpenSearch:
+    def __init__(self, **kwargs):
+        self.indices = FakeIndices(**kwargs)
+        self.requests = []
+        self.transport = types.SimpleNamespace(perform_request=self.perform_request)
+
+    def perform_request(self, method, url, body=None):
+        self.requests.append((method, url))
+        if "/_plugins/_knn/models/" in url:
+            raise NotFoundError(url)
+        return {}
+
+class Clock:
+    def __init__(self, now=1000.0, date="2024_05_01"):
+        self.now = now
+        self.date = date
+
+    def time(self):
+        return self.now
+
+    def utcnow(self):
+        clock = self
+        return types.SimpleNamespace(strftime=lambda fmt: clock.date)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(index_rollover, "time", clock)
+    monkeypatch.setattr(index_rollover, "datetime", clock)
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME", PREFIX)
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_VIDEO_FRAME_INDEX_MAPPING", MAPPING)
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_SHARD_SIZE_LIMIT", 1000)
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_ROLLOVER_MODE", "date")
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_ROLLOVER_CHECK_INTERVAL_S", 300)
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_ROLLOVER_CHECK_DOCS", 100)
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_REFRESH_INTERVAL", "30s")
+    monkeypatch.setattr(index_rollover, "WRITE_ALIAS", f"{PREFIX}write")
+    monkeypatch.setattr(index_rollover, "ISM_POLICY_ID", f"{PREFIX}rollover")
+    monkeypatch.setattr(index_rollover.vector_encoding, "OPENSEARCH_VECTOR_ENCODING", "float32")
+    monkeypatch.setattr(index_rollover.vector_encoding, "OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME", PREFIX)
+    monkeypatch.setattr(index_rollover, "state", {"index": None, "date": None, "checked_at": 0, "docs": 0})
+    return clock
+
+def test_first_index_of_the_day_is_created_with_the_refresh_interval(clock):
+    client = FakeOpenSearch()
+    assert index_rollover.get_write_index(client) == f"{PREFIX}2024_05_01_0"
+    body = client.indices.created[f"{PREFIX}2024_05_01_0"]
+    assert body["settings"]["index.refresh_interval"] == "30s"
+    assert body["settings"]["index.knn"] is True
+    assert "mm_embedding" in body["mappings"]["properties"]
+
+def test_latest_index_of_the_day_is_reused_by_sequence_number(clock):
+    client = FakeOpenSearch(sizes={f"{PREFIX}2024_05_01_2": 10, f"{PREFIX}2024_05_01_10": 10, f"{PREFIX}2024_04_30_11": 10})
+    assert index_rollover.get_write_index(client) == f"{PREFIX}2024_05_01_10"
+    assert client.indices.created == {}
+
+def test_full_index_rolls_over_to_the_next_sequence(clock):
+    client = FakeOpenSearch(sizes={f"{PREFIX}2024_05_01_0": 5000})
+    assert index_rollover.get_write_index(client) == f"{PREFIX}2024_05_01_1"
+    assert f"{PREFIX}2024_05_01_1" in client.indices.created
+
+def test_write_index_is_cached_until_the_check_interval_or_document_count(clock):
+    client = FakeOpenSearch()
+    index = index_rollover.get_write_index(client, 10)
+    calls = client.indices.calls
+    for _ in range(8):
+        assert index_rollover.get_write_index(client, 10) == index
+    assert client.indices.calls == calls
+
+    # 100 documents since the last check: the size is checked again
+    index_rollover.get_write_index(client, 10)
+    index_rollover.get_write_index(client, 10)
+    assert client.indices.calls > calls
+
+    calls = client.indices.calls
+    clock.now += 301
+    index_rollover.get_write_index(client, 1)
+    assert client.indices.calls > calls
+
+def test_cached_index_rolls_over_once_full(clock):
+    client = FakeOpenSearch()
+    index = index_rollover.get_write_index(client)
+    client.indices.sizes[index] = 5000
+    clock.now += 301
+    assert index_rollover.get_write_index(client) == f"{PREFIX}2024_05_01_1"
+
+def test_new_day_starts_a_new_index(clock):
+    client = FakeOpenSearch()
+    index_rollover.get_write_index(client)
+    clock.date = "2024_05_02"
+    assert index_rollover.get_write_index(client) == f"{PREFIX}2024_05_02_0"
+
+def test_ism_mode_bootstraps_the_write_alias(clock, monkeypatch):
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_ROLLOVER_MODE", "ism")
+    client = FakeOpenSearch()
+    assert index_rollover.get_write_index(client) == f"{PREFIX}000001"
+    assert ("PUT", f"/_plugins/_ism/policies/{PREFIX}rollover") in client.requests
+    template = client.indices.templates[f"{PREFIX}rollover"]["template"]
+    assert template["settings"]["plugins.index_state_management.rollover_alias"] == f"{PREFIX}write"
+    assert template["settings"]["index.refresh_interval"] == "30s"
+    assert client.indices.created[f"{PREFIX}000001"]["aliases"] == {f"{PREFIX}write": {"is_write_index": True}}
+
+def test_ism_mode_follows_the_write_index_of_the_alias(clock, monkeypatch):
+    monkeypatch.setattr(index_rollover, "OPENSEARCH_ROLLOVER_MODE", "ism")
+    client = FakeOpenSearch(aliases={
+        f"{PREFIX}000001": {f"{PREFIX}write": {"is_write_index": False}},
+        f"{PREFIX}000002": {f"{PREFIX}write": {"is_write_index": True}},
+    })
+    assert index_rollover.get_write_index(client) == f"{PREFIX}000002"
+    assert client.indices.created == {}
+    assert client.requests == []
+
+def test_shard_size_reads_shard_stats_when_present():
+    client = types.SimpleNamespace(indices=types.SimpleNamespace(stats=lambda index, metric: {"indices": {index: {
+        "shards": {"0": [{"store": {"size_in_bytes": 300}}]},
+        "primaries": {"store": {"size_in_bytes": 600}}}}}))
+    assert index_rollover.get_shard_size(client, "idx") == 300
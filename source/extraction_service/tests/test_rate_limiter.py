@@ -0,0 +1,158 @@
+import pytest
+from botocore.exceptions import ClientError
+from conftest import load_module
+
+rate_limiter = load_module("lambda_layer/embedding-client/python", "rate_limiter")
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FakeDynamoClient:
+    # Rate limit table: conditional ADD on the per-second counters
+    def __init__(self, limiter=None, rate=None, error=None):
+        self.limiter = limiter
+        self.rate = rate
+        self.error = error
+        self.items = {}
+        self.leases = 0
+
+    def get_item(self, TableName, Key, ConsistentRead):
+        if self.rate is None:
+            return {}
+        return {"Item": {"Rate": {"N": str(self.rate)}}}
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        if self.limiter is not None:
+            # The lease is a network round trip, it must not hold the limiter lock
+            assert not self.limiter.lock.locked()
+        if self.error is not None:
+            raise self.error
+        key = Key["Id"]["S"]
+        if "#used" not in ExpressionAttributeNames:
+            self.items[key] = {n: v for n, v in ExpressionAttributeValues.items()}
+            return {}
+        self.leases += 1
+        used = self.items.get(key, 0)
+        if used > int(ExpressionAttributeValues[":max"]["N"]):
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+        self.items[key] = used + int(ExpressionAttributeValues[":n"]["N"])
+        return {}
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+def throttling():
+    return ClientError({"Error": {"Code": "ThrottlingException"}}, "DetectLabels")
+
+def test_local_bucket_refills_once_per_second(clock):
+    limiter = rate_limiter.RateLimiter("api", max_rate=3, table_name=None)
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.sleeps == []
+    limiter.acquire()
+    # The fourth call waits for the next second
+    assert len(clock.sleeps) == 1
+    assert int(clock.now) == 1001
+
+def test_throttle_halves_the_rate_down_to_the_minimum(clock):
+    limiter = rate_limiter.RateLimiter("api", max_rate=40, min_rate=8, table_name=None)
+    limiter.on_throttle()
+    assert limiter.rate == 20
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.rate == 8
+    assert limiter.tokens == 0
+
+def test_success_increases_the_rate_by_step_once_per_interval(clock):
+    limiter = rate_limiter.RateLimiter("api", max_rate=40, step=4, table_name=None)
+    limiter.on_throttle()
+    limiter.on_success()
+    # Not before the increase interval
+    assert limiter.rate == 20
+    clock.now += rate_limiter.RATE_LIMIT_INCREASE_INTERVAL_S
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.rate == 24
+    for _ in range(10):
+        clock.now += rate_limiter.RATE_LIMIT_INCREASE_INTERVAL_S
+        limiter.on_success()
+    assert limiter.rate == 40
+
+def test_shared_bucket_leases_tokens_outside_the_lock(clock, monkeypatch):
+    limiter = rate_limiter.RateLimiter("api", max_rate=20, table_name="rate-limit")
+    client = FakeDynamoClient(limiter)
+    monkeypatch.setattr(rate_limiter, "dynamodb", client)
+    # Lease size: min(RATE_LIMIT_LEASE_SIZE, rate / 10) = 2 tokens per update
+    for _ in range(4):
+        limiter.acquire()
+    assert client.leases == 2
+    assert client.items["api#1000"] == 4
+    assert clock.sleeps == []
+
+def test_shared_bucket_waits_for_the_next_second_when_empty(clock, monkeypatch):
+    limiter = rate_limiter.RateLimiter("api", max_rate=10, table_name="rate-limit")
+    client = FakeDynamoClient(limiter)
+    monkeypatch.setattr(rate_limiter, "dynamodb", client)
+    # Other containers used this second's tokens
+    client.items["api#1000"] = 10
+    limiter.acquire()
+    assert int(clock.now) == 1001
+    assert client.items["api#1001"] == 1
+
+def test_shared_rate_is_read_from_the_table(clock, monkeypatch):
+    limiter = rate_limiter.RateLimiter("api", max_rate=100, min_rate=5, table_name="rate-limit")
+    monkeypatch.setattr(rate_limiter, "dynamodb", FakeDynamoClient(rate=2))
+    assert limiter.current_rate() == 5
+    monkeypatch.setattr(rate_limiter, "dynamodb", FakeDynamoClient(rate=30))
+    # Cached for a second
+    assert limiter.current_rate() == 5
+    clock.now += 1
+    assert limiter.current_rate() == 30
+
+def test_lease_fails_open_on_table_errors(clock, monkeypatch):
+    limiter = rate_limiter.RateLimiter("api", max_rate=20, table_name="rate-limit")
+    monkeypatch.setattr(rate_limiter, "dynamodb", FakeDynamoClient(error=Exception("connection reset")))
+    assert limiter.lease(1000) == 2
+
+def test_call_retries_throttling_and_decreases_the_rate(clock):
+    limiter = rate_limiter.RateLimiter("api", max_rate=10, table_name=None)
+    responses = [throttling(), throttling(), "labels"]
+    def detect():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    assert limiter.call(detect) == "labels"
+    assert limiter.rate == 2.5
+
+def test_call_raises_other_errors_at_once(clock):
+    limiter = rate_limiter.RateLimiter("api", max_rate=10, table_name=None)
+    calls = []
+    def detect():
+        calls.append(1)
+        raise ClientError({"Error": {"Code": "InvalidImageFormatException"}}, "DetectLabels")
+    with pytest.raises(ClientError):
+        limiter.call(detect)
+    assert len(calls) == 1
+
+def test_call_gives_up_after_max_attempts(clock):
+    limiter = rate_limiter.RateLimiter("api", max_rate=10, min_rate=1, table_name=None)
+    calls = []
+    def detect():
+        calls.append(1)
+        raise throttling()
+    with pytest.raises(ClientError):
+        limiter.call(detect, max_attempts=3)
+    assert len(calls) == 3
@@ -0,0 +1,114 @@
+import sys
+import types
+import pytest
+from conftest import load_module
+
+# moviepy comes from the lambda layer, only VideoFileClip is imported by name
+if "moviepy.editor" not in sys.modules:
+    try:
+        import moviepy.editor
+    except ImportError:
+        sys.modules["moviepy"] = types.ModuleType("moviepy")
+        sys.modules["moviepy.editor"] = types.ModuleType("moviepy.editor")
+        sys.modules["moviepy.editor"].VideoFileClip = None
+
+sample_video = load_module("lambda/extr-srv-sample-video", "extr-srv-sample-video")
+utils = load_module("lambda/extr-srv-sample-video", "utils")
+
+class FakeReader:
+    # FFMPEG_VideoReader stream: frame n is the n-th frame read from the pipe, counted from 1
+    def __init__(self, fps):
+        self.fps = fps
+        self.next_frame = None
+        self.pos = None
+        self.calls = []
+
+    def initialize(self, t):
+        self.calls.append(("initialize", t))
+        self.next_frame = int(self.fps * t + 0.00001) + 1
+
+    def skip_frames(self, n):
+        self.calls.append(("skip", n))
+        self.next_frame += n
+
+    def read_frame(self):
+        self.calls.append(("read",))
+        frame = self.next_frame
+        self.next_frame += 1
+        return frame
+
+def seek_frame(fps, t):
+    # Frame returned by FFMPEG_VideoReader.get_frame(t)
+    return int(fps * t + 0.00001) + 1
+
+@pytest.mark.parametrize("fps", [24, 25, 29.97, 30])
+def test_single_pass_decodes_the_frames_of_seek(fps):
+    timestamps = [{"ts": t} for t in [12.0, 12.5, 13.0, 14.2, 20.0, 20.04, 31.7]]
+    reader = FakeReader(fps)
+    frames = list(sample_video.decode_frames_single_pass(types.SimpleNamespace(reader=reader), timestamps))
+
+    assert [ts for ts, _ in frames] == [t["ts"] for t in timestamps]
+    assert [frame for _, frame in frames] == [seek_frame(fps, t["ts"]) for t in timestamps]
+    # One seek for the chunk, the rest is read forward
+    assert [c for c in reader.calls if c[0] == "initialize"] == [("initialize", 12.0)]
+
+def test_single_pass_reuses_the_frame_of_a_repeated_position():
+    reader = FakeReader(10)
+    timestamps = [{"ts": 1.0}, {"ts": 1.05}, {"ts": 1.1}]
+    frames = list(sample_video.decode_frames_single_pass(types.SimpleNamespace(reader=reader), timestamps))
+
+    # 1.0 and 1.05 are both frame 11 at 10 fps
+    assert [frame for _, frame in frames] == [11, 11, 12]
+    assert reader.calls.count(("read",)) == 2
+    assert reader.calls[-2:] == [("skip", 0), ("read",)]
+    assert reader.pos == 12
+
+def test_single_pass_skips_frames_between_samples():
+    reader = FakeReader(25)
+    list(sample_video.decode_frames_single_pass(types.SimpleNamespace(reader=reader), [{"ts": 0.0}, {"ts": 2.0}]))
+    # Frame 1, then 49 frames skipped on the pipe to read frame 51
+    assert reader.calls == [("initialize", 0.0), ("read",), ("skip", 49), ("read",)]
+
+class FakeDynamoClient:
+    def __init__(self, unprocessed_rounds):
+        # unprocessed_rounds: number of responses returning the last request of the batch as unprocessed
+        self.unprocessed_rounds = unprocessed_rounds
+        self.batches = []
+
+    def batch_write_item(self, RequestItems):
+        table, requests = next(iter(RequestItems.items()))
+        self.batches.append(len(requests))
+        if self.unprocessed_rounds > 0:
+            self.unprocessed_rounds -= 1
+            return {"UnprocessedItems": {table: requests[-1:]}}
+        return {"UnprocessedItems": {}}
+
+@pytest.fixture
+def dynamo_client(monkeypatch):
+    def install(unprocessed_rounds=0):
+        client = FakeDynamoClient(unprocessed_rounds)
+        monkeypatch.setattr(utils, "dynamodb", types.SimpleNamespace(meta=types.SimpleNamespace(client=client)))
+        monkeypatch.setattr(utils.time, "sleep", lambda s: None)
+        return client
+    return install
+
+def put_requests(count):
+    return [{"PutRequest": {"Item": {"id": str(i)}}} for i in range(count)]
+
+def test_batch_write_splits_in_batches_of_25(dynamo_client):
+    client = dynamo_client()
+    assert utils.dynamodb_batch_write_requests("frames", put_requests(60)) == 0
+    assert client.batches == [25, 25, 10]
+
+def test_batch_write_retries_unprocessed_items(dynamo_client):
+    client = dynamo_client(unprocessed_rounds=3)
+    assert utils.dynamodb_batch_write_requests("frames", put_requests(30)) == 0
+    # First batch: 25 items, then the unprocessed item 3 times until it is written
+    assert client.batches == [25, 1, 1, 1, 5]
+
+def test_batch_write_raises_once_retries_are_used_up(dynamo_client):
+    client = dynamo_client(unprocessed_rounds=100)
+    with pytest.raises(utils.UnprocessedItemsError, match="2 of 30 items"):
+        utils.dynamodb_batch_write_requests("frames", put_requests(30), max_retries=2)
+    # The second batch is still sent after the first one gave up
+    assert client.batches == [25, 1, 1, 5, 1, 1]
@@ -0,0 +1,115 @@
+import types
+from io import BytesIO
+import numpy as np
+import pytest
+from PIL import Image
+from conftest import load_module
+
+dedup = load_module("lambda/extr-srv-sample-video-dedup-faiss", "extr-srv-sample-video-dedup-faiss", layers=["embedding-client"])
+frame_similarity = load_module("lambda/extr-srv-sample-video-dedup-faiss", "frame_similarity")
+utils = load_module("lambda/extr-srv-sample-video-dedup-faiss", "utils")
+
+def jpeg(pixels):
+    output = BytesIO()
+    Image.fromarray(np.asarray(pixels, dtype=np.uint8)).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+def gradient(width=180, height=120, offset=0, reverse=False):
+    row = np.linspace(20, 220, width) + offset
+    if reverse:
+        row = row[::-1]
+    return jpeg(np.tile(row, (height, 1)))
+
+def hash_with_bits(count):
+    # 64-bit hash with the first count bits set: distance between two of them is the difference of the counts
+    bits = np.zeros(64, dtype=np.uint8)
+    bits[:count] = 1
+    return np.packbits(bits)
+
+def test_dhash_of_the_same_picture_matches():
+    a = frame_similarity.compute_dhash(gradient())
+    b = frame_similarity.compute_dhash(gradient(offset=8))
+    assert a.shape == (8,)
+    assert frame_similarity.hamming_distance(a, b) <= dedup.VIDEO_FRAME_HASH_DUPLICATE_DISTANCE
+
+def test_dhash_of_a_different_picture_is_distinct():
+    a = frame_similarity.compute_dhash(gradient())
+    b = frame_similarity.compute_dhash(gradient(reverse=True))
+    assert frame_similarity.hamming_distance(a, b) >= dedup.VIDEO_FRAME_HASH_DISTINCT_DISTANCE
+
+def test_dhash_of_invalid_image_is_none():
+    assert frame_similarity.compute_dhash(b"not a jpeg") is None
+    assert frame_similarity.hamming_distance(None, hash_with_bits(3)) is None
+
+def test_min_hamming_distance_skips_missing_hashes():
+    assert frame_similarity.min_hamming_distance(hash_with_bits(10), [hash_with_bits(0), None, hash_with_bits(12)]) == 2
+    assert frame_similarity.min_hamming_distance(hash_with_bits(10), [None]) is None
+    assert frame_similarity.min_hamming_distance(hash_with_bits(10), []) is None
+
+def frames_with_bits(*counts):
+    return [{"image": b"jpeg", "hash": hash_with_bits(c)} if c is not None else {"image": None, "hash": None} for c in counts]
+
+def test_embedding_candidates_are_the_ambiguous_frames():
+    # Distances to the previous frame: 1 (duplicate), 19 (distinct), 10 (ambiguous)
+    frames = frames_with_bits(0, 1, 20, 30)
+    assert dedup.embedding_candidates(frames, require_score=False) == [2, 3]
+
+def test_embedding_candidates_include_distinct_frames_when_scores_are_required():
+    frames = frames_with_bits(0, 1, 20, 30)
+    # Frame 1 is a near-duplicate of frame 0, so it is not the reference of frame 2
+    assert dedup.embedding_candidates(frames, require_score=True) == [2, 2, 3]
+
+def test_embedding_candidates_skip_frames_without_image():
+    frames = frames_with_bits(0, None, 10)
+    assert dedup.embedding_candidates(frames, require_score=False) == []
+
+def test_embedding_candidates_without_hashes_embed_every_frame():
+    frames = [{"image": b"jpeg", "hash": None} for _ in range(3)]
+    assert dedup.embedding_candidates(frames, require_score=False) == [0, 1, 1, 2]
+
+class FakeDynamoClient:
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.calls = []
+
+    def batch_write_item(self, RequestItems):
+        self.calls.append("batch_write_item")
+        return {"UnprocessedItems": {}}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues):
+        if Key["id"] in self.fail_ids:
+            raise Exception("ProvisionedThroughputExceededException")
+
+class FakeS3:
+    def __init__(self, calls, errors=()):
+        self.calls = calls
+        self.errors = list(errors)
+
+    def delete_objects(self, Bucket, Delete):
+        self.calls.append("delete_objects")
+        return {"Errors": [{"Key": k, "Message": "AccessDenied"} for k in self.errors]}
+
+@pytest.fixture
+def dynamo_client(monkeypatch):
+    def install(fail_ids=()):
+        client = FakeDynamoClient(fail_ids)
+        monkeypatch.setattr(utils, "dynamodb", types.SimpleNamespace(meta=types.SimpleNamespace(client=client)))
+        return client
+    return install
+
+def test_delete_frames_deletes_rows_before_images(dynamo_client, monkeypatch):
+    client = dynamo_client()
+    monkeypatch.setattr(dedup, "s3", FakeS3(client.calls))
+    dedup.delete_frames("bucket", "task", [(1.0, "tasks/task/video_frame_1.0.jpg")])
+    assert client.calls == ["batch_write_item", "delete_objects"]
+
+def test_delete_frames_raises_on_images_not_deleted(dynamo_client, monkeypatch):
+    client = dynamo_client()
+    monkeypatch.setattr(dedup, "s3", FakeS3(client.calls, errors=["tasks/task/video_frame_2.0.jpg"]))
+    with pytest.raises(utils.UnprocessedItemsError, match="1 of 2"):
+        dedup.delete_frames("bucket", "task", [(1.0, "tasks/task/video_frame_1.0.jpg"), (2.0, "tasks/task/video_frame_2.0.jpg")])
+
+def test_similarity_score_updates_return_the_failed_count(dynamo_client):
+    dynamo_client(fail_ids=["task_2.0"])
+    assert utils.update_items_with_similarity_score("frames", "task", {"task_1.0": 0.2, "task_2.0": 0.4}) == 1
+    assert utils.update_items_with_similarity_score("frames", "task", {}) == 0
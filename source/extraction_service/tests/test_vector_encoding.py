@@ -0,0 +1,118 @@
+import json
+import random
+import types
+import pytest
+from conftest import load_module
+
+vector_encoding = load_module("lambda_layer/frame-vector/python", "vector_encoding")
+
+PREFIX = "video_frame_"
+MAPPING = json.dumps({"settings": {"index.knn": True}, "mappings": {"properties": {
+    "mm_embedding": {"type": "knn_vector", "dimension": 1024, "method": {"name": "hnsw", "space_type": "l2", "engine": "faiss"}},
+    "text_embedding": {"type": "knn_vector", "dimension": 1024, "method": {"name": "hnsw", "space_type": "cosinesimil", "engine": "faiss"}},
+    "timestamp": {"type": "double"}}}})
+
+class NotFoundError(Exception):
+    status_code = 404
+
+class FakeOpenSearch:
+    # k-NN model API: model id -> state
+    def __init__(self, models=None):
+        self.models = dict(models or {})
+        self.trained = []
+        self.transport = types.SimpleNamespace(perform_request=self.perform_request)
+
+    def perform_request(self, method, url, body=None):
+        model_id = url.split("/")[4]
+        if method == "POST" and url.endswith("/_train"):
+            self.trained.append((model_id, body))
+            self.models[model_id] = "training"
+            return {"model_id": model_id}
+        if model_id not in self.models:
+            raise NotFoundError(model_id)
+        return {"model_id": model_id, "state": self.models[model_id]}
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(vector_encoding, "OPENSEARCH_INDEX_PREFIX_VIDEO_FRAME", PREFIX)
+    monkeypatch.setattr(vector_encoding, "OPENSEARCH_VECTOR_ENCODING", "float32")
+    monkeypatch.setattr(vector_encoding, "OPENSEARCH_VECTOR_BYTE_SCALE", 512.0)
+    monkeypatch.setattr(vector_encoding, "OPENSEARCH_VECTOR_PQ_M", 128)
+    monkeypatch.setattr(vector_encoding, "OPENSEARCH_VECTOR_SOURCE_EXCLUDES", True)
+
+def mapping(encoding, **kwargs):
+    return json.loads(vector_encoding.get_index_mapping(MAPPING, encoding=encoding, **kwargs))
+
+def test_float32_keeps_the_mapping_and_excludes_vectors_from_source():
+    body = mapping("float32")
+    assert body["mappings"]["properties"] == json.loads(MAPPING)["mappings"]["properties"]
+    assert body["mappings"]["_source"] == {"excludes": ["mm_embedding", "text_embedding"]}
+    assert body["settings"] == {"index.knn": True}
+
+def test_source_excludes_can_be_turned_off():
+    assert "_source" not in mapping("float32", source_excludes=False)["mappings"]
+
+def test_fp16_uses_the_faiss_scalar_quantizer():
+    field = mapping("fp16")["mappings"]["properties"]["text_embedding"]
+    assert field["dimension"] == 1024
+    assert field["method"]["engine"] == "faiss"
+    assert field["method"]["space_type"] == "cosinesimil"
+    assert field["method"]["parameters"]["encoder"] == {"name": "sq", "parameters": {"type": "fp16"}}
+
+def test_byte_uses_lucene_byte_vectors():
+    field = mapping("byte")["mappings"]["properties"]["mm_embedding"]
+    assert field["data_type"] == "byte"
+    assert field["method"] == {"name": "hnsw", "space_type": "l2", "engine": "lucene"}
+
+def test_pq_refers_to_the_created_models():
+    client = FakeOpenSearch({f"{PREFIX}mm_embedding_pq": "created", f"{PREFIX}text_embedding_pq": "created"})
+    properties = mapping("pq", client=client)["mappings"]["properties"]
+    assert properties["mm_embedding"] == {"type": "knn_vector", "model_id": f"{PREFIX}mm_embedding_pq"}
+    assert properties["text_embedding"] == {"type": "knn_vector", "model_id": f"{PREFIX}text_embedding_pq"}
+    assert properties["timestamp"] == {"type": "double"}
+
+def test_pq_without_models_keeps_float32_and_trains_from_the_full_index():
+    client = FakeOpenSearch()
+    properties = mapping("pq", client=client, training_index=f"{PREFIX}2024_05_01_0")["mappings"]["properties"]
+    assert properties["mm_embedding"]["method"]["engine"] == "faiss"
+    assert "model_id" not in properties["mm_embedding"]
+
+    trained = dict(client.trained)
+    assert set(trained) == {f"{PREFIX}mm_embedding_pq", f"{PREFIX}text_embedding_pq"}
+    request = trained[f"{PREFIX}text_embedding_pq"]
+    assert request["training_index"] == f"{PREFIX}2024_05_01_0"
+    assert request["training_field"] == "text_embedding"
+    assert request["method"]["space_type"] == "cosinesimil"
+    assert request["method"]["parameters"]["encoder"]["parameters"] == {"code_size": vector_encoding.PQ_CODE_SIZE, "m": 128}
+
+def test_pq_models_in_training_or_failed_are_not_trained_again():
+    client = FakeOpenSearch({f"{PREFIX}mm_embedding_pq": "training", f"{PREFIX}text_embedding_pq": "failed"})
+    properties = mapping("pq", client=client, training_index=f"{PREFIX}2024_05_01_0")["mappings"]["properties"]
+    assert "model_id" not in properties["mm_embedding"]
+    assert client.trained == []
+
+def test_pq_without_client_keeps_float32():
+    assert mapping("pq")["mappings"]["properties"]["mm_embedding"] == json.loads(MAPPING)["mappings"]["properties"]["mm_embedding"]
+
+@pytest.mark.parametrize("encoding", ["float32", "fp16", "pq"])
+def test_float_encodings_index_the_vector_as_is(encoding):
+    vector = [0.1, -0.25, 0.003]
+    assert vector_encoding.encode_vector(vector, encoding) is vector
+    assert vector_encoding.encode_vector(None, encoding) is None
+
+def test_byte_encoding_round_trips_within_half_a_step():
+    rnd = random.Random(1)
+    scale = vector_encoding.OPENSEARCH_VECTOR_BYTE_SCALE
+    vector = [rnd.uniform(-127 / scale, 127 / scale) for _ in range(1024)]
+    encoded = vector_encoding.encode_vector(vector, "byte")
+    assert all(isinstance(v, int) and -128 <= v <= 127 for v in encoded)
+    assert max(abs(e / scale - v) for e, v in zip(encoded, vector)) <= 0.5 / scale + 1e-12
+
+def test_byte_encoding_clips_out_of_range_values():
+    assert vector_encoding.encode_vector([1.0, -1.0, 0.0], "byte") == [127, -128, 0]
+    assert vector_encoding.encode_vector(None, "byte") is None
+
+def test_configured_encoding_is_the_default(monkeypatch):
+    monkeypatch.setattr(vector_encoding, "OPENSEARCH_VECTOR_ENCODING", "byte")
+    assert vector_encoding.encode_vector([0.01]) == [5]
+    assert json.loads(vector_encoding.get_index_mapping(MAPPING))["mappings"]["properties"]["mm_embedding"]["data_type"] == "byte"